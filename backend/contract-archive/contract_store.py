@@ -0,0 +1,149 @@
+'''
+Архив отрендеренных договоров: DOCX раскладывается на члены ZIP, каждый хранится один раз
+в contract_blobs по sha256 своих сжатых байтов. Стили, шрифты, картинки и прочие части шаблона
+у всех договоров общие, поэтому на договор новыми оказываются только document.xml, колонтитулы и обложка.
+Сборка обратно копирует сжатые байты без распаковки.
+Модуль лежит одинаковой копией в generate-contract и contract-archive.
+'''
+import hashlib
+import io
+import json
+import zipfile
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from zip_members import read_raw_member, append_raw_member
+
+# Сколько байтов сжатых членов держать в памяти теплого контейнера: при экспорте части шаблона
+# повторяются в каждом договоре и читаются из базы один раз
+BLOB_CACHE_BYTES = 32 * 1024 * 1024
+
+# Хеши, наличие которых в contract_blobs подтверждено запросом (только закоммиченные строки)
+_known_blobs: Set[str] = set()
+_KNOWN_BLOBS_LIMIT = 10000
+
+_blob_cache: 'OrderedDict[str, bytes]' = OrderedDict()
+stats = {'blob_hits': 0, 'blob_misses': 0, 'cached_bytes': 0}
+
+
+def split_docx(docx_bytes: bytes) -> Tuple[List[Dict[str, Any]], Dict[str, bytes]]:
+    '''Манифест членов (имя, хеш, CRC, размеры, метаданные) и сжатые байты по хешу'''
+    manifest: List[Dict[str, Any]] = []
+    blobs: Dict[str, bytes] = {}
+    source = io.BytesIO(docx_bytes)
+    with zipfile.ZipFile(source) as archive:
+        for info in archive.infolist():
+            raw = read_raw_member(source, info)
+            digest = hashlib.sha256(raw).hexdigest()
+            blobs[digest] = raw
+            manifest.append({
+                'name': info.filename,
+                'hash': digest,
+                'crc': info.CRC,
+                'size': info.file_size,
+                'compress_type': info.compress_type,
+                'date_time': list(info.date_time),
+                'external_attr': info.external_attr
+            })
+    return manifest, blobs
+
+
+def write_docx(manifest: List[Dict[str, Any]], blobs: Dict[str, bytes], output: Any):
+    '''Собрать DOCX в output (файловый объект) из манифеста и сжатых членов'''
+    with zipfile.ZipFile(output, 'w') as target:
+        for member in manifest:
+            raw = blobs[member['hash']]
+            info = zipfile.ZipInfo(member['name'], tuple(member['date_time']))
+            info.compress_type = member['compress_type']
+            info.external_attr = member['external_attr']
+            info.CRC = member['crc']
+            info.file_size = member['size']
+            info.compress_size = len(raw)
+            append_raw_member(target, info, raw)
+
+
+def build_docx(manifest: List[Dict[str, Any]], blobs: Dict[str, bytes]) -> bytes:
+    output = io.BytesIO()
+    write_docx(manifest, blobs, output)
+    return output.getvalue()
+
+
+def store_contract(cur, contract_number: int, file_name: str, caption: str, docx_bytes: bytes) -> Dict[str, int]:
+    '''Сохранить договор в архив (в транзакции вызывающего кода); вернуть число новых членов и их байты'''
+    import psycopg2
+    
+    manifest, blobs = split_docx(docx_bytes)
+    
+    unknown = [digest for digest in blobs if digest not in _known_blobs]
+    if unknown:
+        cur.execute('SELECT content_hash FROM contract_blobs WHERE content_hash = ANY(%s)', (unknown,))
+        existing = {row[0] for row in cur.fetchall()}
+        if len(_known_blobs) + len(existing) > _KNOWN_BLOBS_LIMIT:
+            _known_blobs.clear()
+        _known_blobs.update(existing)
+        unknown = [digest for digest in unknown if digest not in existing]
+    
+    # Новые хеши в _known_blobs не попадают до следующей проверки: транзакция еще может откатиться
+    new_bytes = 0
+    for digest in unknown:
+        cur.execute(
+            'INSERT INTO contract_blobs (content_hash, data, size) VALUES (%s, %s, %s) ON CONFLICT (content_hash) DO NOTHING',
+            (digest, psycopg2.Binary(blobs[digest]), len(blobs[digest]))
+        )
+        new_bytes += len(blobs[digest])
+    
+    cur.execute(
+        '''INSERT INTO contract_archive (contract_number, file_name, caption, docx_hash, docx_size, manifest)
+           VALUES (%s, %s, %s, %s, %s, %s)
+           ON CONFLICT (contract_number) DO UPDATE
+           SET file_name = EXCLUDED.file_name, caption = EXCLUDED.caption, docx_hash = EXCLUDED.docx_hash,
+               docx_size = EXCLUDED.docx_size, manifest = EXCLUDED.manifest, created_at = CURRENT_TIMESTAMP''',
+        (contract_number, file_name, caption, hashlib.sha256(docx_bytes).hexdigest(), len(docx_bytes),
+         json.dumps(manifest, ensure_ascii=False))
+    )
+    return {'members': len(manifest), 'new_members': len(unknown), 'new_bytes': new_bytes}
+
+
+def fetch_blobs(cur, hashes: List[str]) -> Dict[str, bytes]:
+    '''Сжатые члены по хешам: сначала из кеша контейнера, недостающие - одним запросом'''
+    found: Dict[str, bytes] = {}
+    missing = []
+    for digest in dict.fromkeys(hashes):
+        raw = _blob_cache.get(digest)
+        if raw is None:
+            missing.append(digest)
+        else:
+            _blob_cache.move_to_end(digest)
+            found[digest] = raw
+    stats['blob_hits'] += len(found)
+    stats['blob_misses'] += len(missing)
+    
+    if missing:
+        cur.execute('SELECT content_hash, data FROM contract_blobs WHERE content_hash = ANY(%s)', (missing,))
+        for digest, data in cur.fetchall():
+            raw = bytes(data)
+            found[digest] = raw
+            _blob_cache[digest] = raw
+            stats['cached_bytes'] += len(raw)
+        while stats['cached_bytes'] > BLOB_CACHE_BYTES and _blob_cache:
+            _, evicted = _blob_cache.popitem(last=False)
+            stats['cached_bytes'] -= len(evicted)
+        if len(found) < len(set(hashes)):
+            raise Exception('Contract archive is missing stored members')
+    return found
+
+
+def load_contract(cur, contract_number: int) -> Optional[Dict[str, Any]]:
+    '''Договор из архива: file_name, caption, created_at и собранный DOCX; None - договора нет в архиве'''
+    cur.execute(
+        'SELECT file_name, caption, created_at, manifest FROM contract_archive WHERE contract_number = %s',
+        (contract_number,)
+    )
+    row = cur.fetchone()
+    if row is None:
+        return None
+    
+    file_name, caption, created_at, manifest = row
+    if not isinstance(manifest, list):
+        manifest = json.loads(manifest)
+    blobs = fetch_blobs(cur, [member['hash'] for member in manifest])
+    return {'file_name': file_name, 'caption': caption, 'created_at': created_at, 'docx': build_docx(manifest, blobs)}
@@ -0,0 +1,186 @@
+import base64
+import json
+import os
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+from typing import Dict, Any, Tuple
+from db_pool import unit_of_work
+from contract_store import load_contract, fetch_blobs, build_docx, stats
+
+# Ответ функции - base64 целиком, поэтому размер экспорта ограничен; больше - сузить диапазон
+EXPORT_MAX_CONTRACTS = int(os.environ.get('EXPORT_MAX_CONTRACTS', '500'))
+EXPORT_MAX_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', str(20 * 1024 * 1024)))
+# ZIP собирается во временный файл: в памяти он держится только до этого размера
+EXPORT_SPOOL_BYTES = 4 * 1024 * 1024
+# Сколько строк архива серверный курсор отдает за раз
+EXPORT_FETCH_SIZE = 50
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Re-send archived contracts to Telegram without rendering and export them as a ZIP
+    Args: event - dict with httpMethod; POST body {"contract_number": N} queues a re-send,
+          GET ?from=N&to=M or ?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD returns a ZIP archive
+          context - object with request_id attribute
+    Returns: HTTP response with JSON status or base64 ZIP
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+    
+    if method not in ('GET', 'POST'):
+        return {
+            'statusCode': 405,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Method not allowed'})
+        }
+    
+    try:
+        if method == 'POST':
+            return resend(json.loads(event.get('body') or '{}'))
+        return export(event.get('queryStringParameters') or {})
+    
+    except Exception as e:
+        return error_response(500, str(e))
+
+
+def resend(body_data: Dict[str, Any]) -> Dict[str, Any]:
+    '''Поставить сохраненный DOCX в очередь отправки: без рендера и без нового номера'''
+    try:
+        contract_number = int(body_data.get('contract_number'))
+    except (TypeError, ValueError):
+        return error_response(400, 'contract_number is required')
+    
+    from outbox import enqueue_document
+    
+    with unit_of_work() as db:
+        cur = db.cursor()
+        stored = load_contract(cur, contract_number)
+        if stored is None:
+            return error_response(404, f'Contract {contract_number} is not in the archive')
+        
+        # Та же запись через COPY, что и у generate-contract: один путь и один формат строк очереди
+        enqueue_document(cur, contract_number, f"{stored['caption']} (повторно)", stored['file_name'], stored['docx'])
+        cur.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json'
+        },
+        'isBase64Encoded': False,
+        'body': json.dumps({
+            'success': True,
+            'contract_number': contract_number,
+            'delivery': 'queued'
+        })
+    }
+
+
+def export_range(params: Dict[str, Any]) -> Tuple[str, Tuple, str]:
+    '''Условие WHERE, его параметры и метка для имени файла: диапазон номеров или дат создания'''
+    if params.get('from') or params.get('to'):
+        first = int(params.get('from') or 1)
+        last = int(params.get('to') or 2 ** 31 - 1)
+        return 'contract_number BETWEEN %s AND %s', (first, last), f"{params.get('from', '')}-{params.get('to', '')}"
+    
+    if params.get('date_from') or params.get('date_to'):
+        # Границы включительно: date_to=2025-01-31 захватывает весь день
+        start = datetime.strptime(params['date_from'], '%Y-%m-%d') if params.get('date_from') else datetime(1970, 1, 1)
+        end = datetime.strptime(params['date_to'], '%Y-%m-%d') + timedelta(days=1) if params.get('date_to') else datetime(9999, 1, 1)
+        return 'created_at >= %s AND created_at < %s', (start, end), f"{params.get('date_from', '')}_{params.get('date_to', '')}"
+    
+    raise ValueError('from/to or date_from/date_to query parameters are required')
+
+
+def export(params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    ZIP с договорами диапазона. Строки архива читаются серверным курсором, DOCX собирается по одному
+    и сразу дописывается во временный файл, поэтому в памяти - один договор и общие части шаблона
+    '''
+    try:
+        where, args, label = export_range(params)
+    except ValueError as e:
+        return error_response(400, str(e))
+    
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as spool:
+        with unit_of_work() as db:
+            conn = db.connection()
+            cur = conn.cursor()
+            cur.execute(f'SELECT COUNT(*) FROM contract_archive WHERE {where}', args)
+            count = cur.fetchone()[0]
+            if count == 0:
+                return error_response(404, 'No archived contracts in this range')
+            if count > EXPORT_MAX_CONTRACTS:
+                return error_response(413, f'Too many contracts: {count} > {EXPORT_MAX_CONTRACTS}, narrow the range')
+            
+            rows = conn.cursor(name='contract_export')
+            rows.itersize = EXPORT_FETCH_SIZE
+            rows.execute(
+                f'SELECT contract_number, file_name, created_at, manifest FROM contract_archive WHERE {where} ORDER BY contract_number',
+                args
+            )
+            
+            # DOCX уже сжат, поэтому внешний ZIP без сжатия
+            with zipfile.ZipFile(spool, 'w', zipfile.ZIP_STORED) as target:
+                for contract_number, file_name, created_at, manifest in rows:
+                    if not isinstance(manifest, list):
+                        manifest = json.loads(manifest)
+                    blobs = fetch_blobs(cur, [member['hash'] for member in manifest])
+                    info = zipfile.ZipInfo(f'{contract_number}_{file_name}', created_at.timetuple()[:6])
+                    target.writestr(info, build_docx(manifest, blobs))
+                    if spool.tell() > EXPORT_MAX_BYTES:
+                        return error_response(413, f'Export is larger than {EXPORT_MAX_BYTES} bytes, narrow the range')
+            rows.close()
+            cur.close()
+        
+        size = spool.tell()
+        spool.seek(0)
+        body = _base64_file(spool)
+    
+    print(f"Export {label}: {count} contracts, {size} bytes, blob cache hits={stats['blob_hits']} misses={stats['blob_misses']}")
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/zip',
+            'Content-Disposition': f'attachment; filename="contracts_{label}.zip"'
+        },
+        'isBase64Encoded': True,
+        'body': body
+    }
+
+
+def _base64_file(source: Any) -> str:
+    '''base64 файла по частям, кратным 3 байтам: части склеиваются без паддинга внутри'''
+    chunks = []
+    while True:
+        chunk = source.read(3 * 1024 * 1024)
+        if not chunk:
+            break
+        chunks.append(base64.b64encode(chunk).decode('ascii'))
+    return ''.join(chunks)
+
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json'
+        },
+        'isBase64Encoded': False,
+        'body': json.dumps({'success': False, 'error': message})
+    }
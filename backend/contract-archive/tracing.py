@@ -0,0 +1,94 @@
+'''
+Трассировка по стадиям: одна JSON-строка в лог на вызов функции, ключ - context.request_id.
+Модуль лежит одинаковой копией в generate-contract, deliver-outbox и contract-archive.
+'''
+import json
+import os
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Доля вызовов, для которых пишется строка трассировки; вызовы с ошибкой пишутся всегда
+SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '1'))
+# В пакетном режиме спанов тысячи: в строку попадают первые MAX_SPANS, суммы по стадиям - всегда
+MAX_SPANS = 200
+
+
+class Trace:
+    '''Спаны одного вызова: стадия, смещение от начала и длительность в мс'''
+    
+    def __init__(self, function: str, request_id: str, sampled: bool):
+        self.function = function
+        self.request_id = request_id
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.totals: Dict[str, Dict[str, float]] = {}
+        self.fields: Dict[str, Any] = {}
+    
+    def add(self, name: str, started: float, attrs: Dict[str, Any]):
+        ms = (time.perf_counter() - started) * 1000
+        total = self.totals.setdefault(name, {'ms': 0.0, 'count': 0})
+        total['ms'] += ms
+        total['count'] += 1
+        if len(self.spans) < MAX_SPANS:
+            span_record = {'name': name, 'start_ms': round((started - self.started) * 1000, 2), 'ms': round(ms, 2)}
+            span_record.update(attrs)
+            self.spans.append(span_record)
+    
+    def line(self, status: Optional[int]) -> str:
+        return json.dumps({
+            'trace': self.function,
+            'request_id': self.request_id,
+            'status': status,
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'stages': {name: {'ms': round(total['ms'], 2), 'count': total['count']} for name, total in self.totals.items()},
+            'spans': self.spans,
+            'spans_dropped': max(0, sum(int(total['count']) for total in self.totals.values()) - len(self.spans)),
+            **self.fields
+        }, ensure_ascii=False, default=str)
+
+
+_current: Dict[str, Optional[Trace]] = {'trace': None}
+
+
+def start_trace(function: str, context: Any) -> Trace:
+    '''Начать трассировку вызова; request_id берется из context облачной функции'''
+    request_id = getattr(context, 'request_id', None) or uuid.uuid4().hex
+    trace = Trace(function, request_id, random.random() < SAMPLE_RATE)
+    _current['trace'] = trace
+    return trace
+
+
+def finish_trace(status: Optional[int]):
+    '''Записать строку трассировки (если вызов попал в выборку или завершился ошибкой)'''
+    trace = _current['trace']
+    _current['trace'] = None
+    if trace is None:
+        return
+    if trace.sampled or 'error' in trace.fields or (status is not None and status >= 500):
+        print(trace.line(status))
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    '''Замерить стадию; в yield-словарь можно дописать атрибуты спана. Без активной трассировки - no-op'''
+    trace = _current['trace']
+    started = time.perf_counter()
+    try:
+        yield attrs
+    except Exception:
+        attrs['failed'] = True
+        raise
+    finally:
+        if trace is not None:
+            trace.add(name, started, attrs)
+
+
+def annotate(**fields: Any):
+    '''Добавить поля в строку трассировки текущего вызова'''
+    trace = _current['trace']
+    if trace is not None:
+        trace.fields.update(fields)
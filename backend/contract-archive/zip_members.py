@@ -0,0 +1,29 @@
+'''
+Перенос членов ZIP как есть: сжатые байты читаются и дописываются без распаковки и повторного сжатия.
+Модуль лежит одинаковой копией в generate-contract (рендерер и архив договоров) и contract-archive.
+'''
+import copy
+import io
+import struct
+import zipfile
+
+
+def read_raw_member(source: io.BytesIO, info: zipfile.ZipInfo) -> bytes:
+    '''Сжатые байты члена архива как есть, без распаковки'''
+    source.seek(info.header_offset)
+    header = source.read(zipfile.sizeFileHeader)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    source.seek(info.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+    return source.read(info.compress_size)
+
+
+def append_raw_member(target: zipfile.ZipFile, info: zipfile.ZipInfo, raw: bytes):
+    '''Дописать член с готовыми сжатыми байтами, без повторного сжатия'''
+    copied = copy.copy(info)
+    copied.flag_bits &= ~0x08  # размеры пишем в локальный заголовок, data descriptor не нужен
+    copied.header_offset = target.fp.tell()
+    target.fp.write(copied.FileHeader())
+    target.fp.write(raw)
+    target.filelist.append(copied)
+    target.NameToInfo[copied.filename] = copied
+    target.start_dir = target.fp.tell()
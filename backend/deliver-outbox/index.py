@@ -0,0 +1,216 @@
+import json
+import os
+import time
+from typing import Dict, Any, Optional, Tuple
+from telegram_client import get_client, TelegramError
+from db_pool import unit_of_work, pool_summary
+from tracing import start_trace, finish_trace, span, annotate
+
+BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '20'))
+MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+# Сколько секунд запись считается занятой воркером; если он упадет, запись вернется в очередь
+LEASE_SECONDS = 300
+# Запас до конца cron-интервала, чтобы не пересекаться со следующим запуском
+TIME_BUDGET_SECONDS = float(os.environ.get('OUTBOX_TIME_BUDGET', '50'))
+# Сколько дней хранятся отправленные и проваленные записи (уже без файлов) для статуса доставки
+RETENTION_DAYS = int(os.environ.get('OUTBOX_RETENTION_DAYS', '30'))
+# Сколько старых записей удаляется за запуск, чтобы очередь не росла без отдельного cron
+CLEANUP_BATCH = 1000
+
+CLAIM_QUERY = '''
+    UPDATE telegram_outbox
+    SET attempts = attempts + 1,
+        next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+    WHERE id IN (
+        SELECT id FROM telegram_outbox
+        WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+        ORDER BY id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, contract_number, method, chat_id, caption, file_name, file_data, attempts,
+              cover_caption, cover_file_name, cover_data
+'''
+
+CLEANUP_QUERY = '''
+    DELETE FROM telegram_outbox
+    WHERE id IN (
+        SELECT id FROM telegram_outbox
+        WHERE status <> 'pending' AND created_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+'''
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Deliver queued contracts and covers from telegram_outbox to Telegram with retries
+    Args: event - cron trigger or manual call
+          context - cloud function context
+    Returns: HTTP response with delivery counters
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+    
+    if method not in ('GET', 'POST'):
+        return {
+            'statusCode': 405,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Method not allowed'})
+        }
+    
+    start_trace('deliver-outbox', context)
+    response = deliver()
+    annotate(db_pool=pool_summary())
+    finish_trace(response['statusCode'])
+    return response
+
+
+def deliver() -> Dict[str, Any]:
+    '''Отправлять очередь пачками, пока не кончатся записи или бюджет времени'''
+    try:
+        db_url = os.environ.get('DATABASE_URL', '')
+        telegram_token = os.environ.get('TELEGRAM_BOT_TOKEN', '')
+        
+        started = time.monotonic()
+        sent_count = 0
+        retry_count = 0
+        failed_count = 0
+        
+        with unit_of_work(db_url) as db:
+            with span('db_connect') as connect:
+                conn = db.connection()
+                connect.update(db.acquired)
+            cur = conn.cursor()
+            
+            while time.monotonic() - started < TIME_BUDGET_SECONDS:
+                # Захват коммитится сразу: параллельный воркер эти записи уже не увидит
+                with span('claim') as attrs:
+                    cur.execute(CLAIM_QUERY, (LEASE_SECONDS, BATCH_SIZE))
+                    claimed = cur.fetchall()
+                    conn.commit()
+                    attrs['rows'] = len(claimed)
+                
+                if not claimed:
+                    break
+                
+                for row in claimed:
+                    outbox_id, contract_number, tg_method, chat_id, caption, file_name, file_data, attempts = row[:8]
+                    with span('telegram', method=tg_method, outbox_id=outbox_id, attempt=attempts) as attrs:
+                        # memoryview из BYTEA уходит в тело multipart без копии в bytes
+                        if tg_method == 'sendMediaGroup':
+                            cover_caption, cover_file_name, cover_data = row[8:]
+                            ok, error, retry_after = send_media_group(
+                                telegram_token, chat_id,
+                                (cover_caption, cover_file_name, cover_data),
+                                (caption, file_name, file_data)
+                            )
+                        else:
+                            ok, error, retry_after = send_file(telegram_token, tg_method, chat_id, caption, file_name, file_data)
+                        attrs['ok'] = ok
+                    
+                    # Файлы завершенной записи больше не нужны: строка остается только ради статуса
+                    if ok:
+                        cur.execute(
+                            '''UPDATE telegram_outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP, last_error = NULL,
+                                      file_data = NULL, cover_data = NULL
+                               WHERE id = %s''',
+                            (outbox_id,)
+                        )
+                        sent_count += 1
+                    elif attempts >= MAX_ATTEMPTS:
+                        cur.execute(
+                            "UPDATE telegram_outbox SET status = 'failed', last_error = %s, file_data = NULL, cover_data = NULL WHERE id = %s",
+                            (error, outbox_id)
+                        )
+                        failed_count += 1
+                        print(f'Outbox {outbox_id} (contract {contract_number}) failed after {attempts} attempts: {error}')
+                    else:
+                        cur.execute(
+                            'UPDATE telegram_outbox SET next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => %s), last_error = %s WHERE id = %s',
+                            (retry_after or backoff_seconds(attempts), error, outbox_id)
+                        )
+                        retry_count += 1
+                    conn.commit()
+            
+            with span('cleanup') as attrs:
+                cur.execute(CLEANUP_QUERY, (RETENTION_DAYS, CLEANUP_BATCH))
+                attrs['deleted'] = cur.rowcount
+                conn.commit()
+            cur.close()
+        
+        annotate(sent_count=sent_count, retry_count=retry_count, failed_count=failed_count)
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Content-Type': 'application/json'
+            },
+            'body': json.dumps({
+                'success': True,
+                'sent_count': sent_count,
+                'retry_count': retry_count,
+                'failed_count': failed_count
+            })
+        }
+    
+    except Exception as e:
+        annotate(error=str(e))
+        return {
+            'statusCode': 500,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Content-Type': 'application/json'
+            },
+            'body': json.dumps({
+                'success': False,
+                'error': str(e)
+            })
+        }
+
+
+def backoff_seconds(attempts: int) -> int:
+    '''Экспоненциальная пауза между попытками: 15 с, 30 с, 1 мин ... не больше часа'''
+    return min(15 * 2 ** (attempts - 1), 3600)
+
+
+def send_file(token: str, method: str, chat_id: str, caption: str, file_name: str, file_data: Any) -> Tuple[bool, Optional[str], Optional[int]]:
+    '''Отправить файл (bytes или memoryview) в Telegram; возвращает (успех, текст ошибки, retry_after из ответа 429)'''
+    client = get_client(token)
+    
+    try:
+        if method == 'sendPhoto':
+            client.send_photo(chat_id, file_name, file_data, caption)
+        else:
+            client.send_document(chat_id, file_name, file_data, caption)
+    except TelegramError as e:
+        retry_after = int(e.retry_after) if e.retry_after is not None else None
+        return False, str(e)[:500], retry_after
+    
+    return True, None, None
+
+
+def send_media_group(token: str, chat_id: str, cover: Tuple[str, str, Any], document: Tuple[str, str, Any]) -> Tuple[bool, Optional[str], Optional[int]]:
+    '''Обложка и договор одним sendMediaGroup; Telegram не смешивает фото и документы в альбоме, поэтому оба - document'''
+    items = []
+    for caption, file_name, file_data in (cover, document):
+        items.append(('document', file_name, file_data, caption))
+    
+    try:
+        get_client(token).send_media_group(chat_id, items)
+    except TelegramError as e:
+        retry_after = int(e.retry_after) if e.retry_after is not None else None
+        return False, str(e)[:500], retry_after
+    
+    return True, None, None
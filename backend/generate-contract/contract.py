@@ -0,0 +1,428 @@
+import json
+import os
+import io
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from template_cache import get_template, template_selector, CachedTemplate, TemplateError
+from substitution import Substitution, W_T
+from cover import Cover, load_cover
+from db_pool import unit_of_work
+from tracing import span, annotate
+from outbox import enqueue_contract_delivery, get_delivery_status, contract_document
+from contract_store import store_contract
+from numbering import is_gapless, refill_lease, reserve_number, reserve_block, lock_last_number, commit_last_number
+from idempotency import IdempotencyError, request_hash, idempotency_key, find_replay, remember
+
+# python-docx (в том числе через ooxml_renderer) и Pillow импортируются только в рендере:
+# GET статуса и повтор по Idempotency-Key отвечают без них
+
+STORY_PARTS = re.compile(r'^/word/(document|header\d*|footer\d*)\.xml$')
+
+# stream - сборка напрямую из ZIP (ooxml_renderer), docx - через объектную модель python-docx
+DOCX_RENDERER = os.environ.get('DOCX_RENDERER', 'stream')
+
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '500'))
+
+FORM_FIELDS = [
+    'дата_заключения_договора', 'graj', 'ФИО_ИП_полностью_кого', 'ФИО_ИП_кратко', 'NIK', 'PAS', 'mail',
+    'ИНН_SWIFT', 'РЕКВИЗИТЫ_БАНК', 'naz', 'isp', 'avt', 'avttext', 'fongr', 'procc'
+]
+
+
+def process_request(event: Dict[str, Any]) -> Dict[str, Any]:
+    '''GET - статус доставки, POST - один договор или пакет; ошибки превращаются в ответ 500'''
+    method: str = event.get('httpMethod', 'GET')
+    
+    try:
+        if method == 'GET':
+            return handle_delivery_status(event)
+        
+        body_data = json.loads(event.get('body', '{}'))
+        
+        if 'items' in body_data:
+            return handle_batch(body_data)
+        
+        annotate(mode='single')
+        
+        db_url = os.environ.get('DATABASE_URL')
+        if not db_url:
+            raise Exception('DATABASE_URL not found')
+        
+        selector = template_selector(body_data)
+        body_hash = request_hash(body_data)
+        key = idempotency_key(event, body_hash)
+        
+        with unit_of_work(db_url) as db:
+            with span('db_connect') as connect:
+                conn = db.connection()
+                connect.update(db.acquired)
+            cur = conn.cursor()
+            
+            # Номер берется до блокировки ключа идемпотентности, в отдельной короткой транзакции:
+            # разделяемая блокировка последовательности не держится весь рендер и не задерживает пакеты.
+            # Повтор номер не тратит - он остается в аренде контейнера
+            if not is_gapless() and refill_lease(cur):
+                conn.commit()
+            
+            # Повтор в пределах окна получает исходный ответ: без нового номера, рендера и отправки
+            if key is not None:
+                replay = find_replay(cur, key, body_hash)
+                if replay is not None:
+                    annotate(idempotency='replay', contract_number=replay.get('contract_number'))
+                    return {
+                        'statusCode': 200,
+                        'headers': {
+                            'Access-Control-Allow-Origin': '*',
+                            'Content-Type': 'application/json',
+                            'Idempotent-Replayed': 'true'
+                        },
+                        'isBase64Encoded': False,
+                        'body': json.dumps(replay)
+                    }
+            
+            # Обложка декодируется один раз и обрабатывается до блокировки счетчика;
+            # base64 из тела запроса после этого не нужен
+            cover = load_cover(body_data, release=True)
+            if cover is not None:
+                cover.embedded()
+            
+            template, template_info = get_template(cur, *selector)
+            
+            if is_gapless():
+                # Строка счетчика заблокирована до commit: номер не сгорит, если рендер упадет
+                contract_number = lock_last_number(cur) + 1
+                output_bytes, substitution = render_contract(template, body_data, contract_number, cover)
+                commit_last_number(cur, contract_number)
+            else:
+                # Номер уже закоммичен: если рендер упадет, он сгорит - в режиме sequence пропуски допустимы
+                contract_number = reserve_number(cur)
+                output_bytes, substitution = render_contract(template, body_data, contract_number, cover)
+            
+            response_body = {
+                'success': True,
+                'contract_number': contract_number,
+                'placeholders': substitution.report.as_dict(),
+                'template': template_info,
+                'delivery': 'queued',
+                'message': 'Договор успешно сгенерирован и поставлен в очередь отправки в Telegram'
+            }
+            
+            # Отправку делает deliver-outbox; запись в очередь, архив и ключ коммитятся вместе с номером
+            enqueue_contract_delivery(cur, body_data, contract_number, output_bytes, cover)
+            # Исходные байты обложки уже в очереди: архив и commit идут без них
+            cover = None
+            archive_contract(cur, body_data, contract_number, output_bytes)
+            if key is not None:
+                remember(cur, key, body_hash, contract_number, output_bytes, response_body)
+            with span('db_commit'):
+                conn.commit()
+            cur.close()
+            annotate(idempotency='stored' if key is not None else 'off',
+                     contract_number=contract_number, placeholders=substitution.report.as_dict())
+        
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Content-Type': 'application/json'
+            },
+            'isBase64Encoded': False,
+            'body': json.dumps(response_body)
+        }
+    
+    except (IdempotencyError, TemplateError) as e:
+        annotate(error=str(e))
+        return error_response(e.status, str(e))
+    
+    except Exception as e:
+        error_msg = str(e)
+        annotate(error=error_msg)
+        print(f'ERROR in generate-contract: {error_msg}')
+        import traceback
+        traceback.print_exc()
+        
+        return {
+            'statusCode': 500,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Content-Type': 'application/json'
+            },
+            'isBase64Encoded': False,
+            'body': json.dumps({
+                'success': False,
+                'error': error_msg
+            })
+        }
+
+
+def handle_delivery_status(event: Dict[str, Any]) -> Dict[str, Any]:
+    '''GET ?contract_number=N - статус доставки договора в Telegram'''
+    params = event.get('queryStringParameters') or {}
+    try:
+        contract_number = int(params.get('contract_number', ''))
+    except ValueError:
+        return error_response(400, 'contract_number query parameter is required')
+    
+    db_url = os.environ.get('DATABASE_URL')
+    if not db_url:
+        return error_response(500, 'DATABASE_URL not found')
+    
+    with unit_of_work(db_url) as db:
+        with span('db_connect') as connect:
+            conn = db.connection()
+            connect.update(db.acquired)
+        cur = conn.cursor()
+        status = get_delivery_status(cur, contract_number)
+        cur.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json'
+        },
+        'isBase64Encoded': False,
+        'body': json.dumps(status)
+    }
+
+
+def handle_batch(body_data: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Пакетная генерация: номера выдаются одним запросом, шаблон (template/template_version
+    верхнего уровня, общий для всех элементов) берется один раз, результат возвращается по каждому элементу
+    '''
+    items = body_data.get('items')
+    if not isinstance(items, list) or not items:
+        return error_response(400, 'items must be a non-empty list')
+    if len(items) > BATCH_MAX_ITEMS:
+        return error_response(400, f'Too many items: {len(items)} > {BATCH_MAX_ITEMS}')
+    
+    annotate(mode='batch', items=len(items), parallel=bool(body_data.get('parallel')))
+    selector = template_selector(body_data)
+    
+    db_url = os.environ.get('DATABASE_URL')
+    if not db_url:
+        raise Exception('DATABASE_URL not found')
+    
+    with unit_of_work(db_url) as db:
+        with span('db_connect') as connect:
+            conn = db.connection()
+            connect.update(db.acquired)
+        cur = conn.cursor()
+        template, template_info = get_template(cur, *selector)
+        
+        # Обложка каждого элемента декодируется один раз: тот же Cover идет и в рендер, и в очередь отправки
+        covers = [_load_item_cover(item) for item in items]
+        
+        if is_gapless():
+            # Номер получает только успешно отрендеренный элемент, поэтому рендер последовательный
+            first_number = next_number = lock_last_number(cur) + 1
+            jobs, rendered = [], []
+            for index, item in enumerate(items):
+                cover, cover_error = covers[index]
+                job = (index, item, next_number, cover)
+                outcome = (None, None, cover_error) if cover_error else _render_item(template, job)
+                if outcome[2] is None:
+                    next_number += 1
+                else:
+                    job = (index, item, None, cover)
+                jobs.append(job)
+                rendered.append(outcome)
+            if next_number > first_number:
+                commit_last_number(cur, next_number - 1)
+        else:
+            numbers = reserve_block(cur, len(items))
+            # Блокировка номеров не должна держаться весь рендер: блок фиксируется отдельной транзакцией
+            conn.commit()
+            jobs = [(index, item, number, covers[index][0]) for index, (item, number) in enumerate(zip(items, numbers))]
+            # Элементы с неразборчивой обложкой не рендерятся: у них ошибка декодирования
+            with span('render_batch', items=len(jobs)):
+                outcomes = iter(render_batch(template, [job for job in jobs if covers[job[0]][1] is None],
+                                             bool(body_data.get('parallel'))))
+            rendered = [(None, None, covers[job[0]][1]) if covers[job[0]][1] else next(outcomes) for job in jobs]
+        
+        for (index, item, contract_number, cover), (output_bytes, report, error) in zip(jobs, rendered):
+            if error is None:
+                # Cover тот же, что ушел в рендер: при последовательном рендере обработка уже в нем
+                enqueue_contract_delivery(cur, item, contract_number, output_bytes, cover)
+                archive_contract(cur, item, contract_number, output_bytes)
+        
+        with span('db_commit'):
+            conn.commit()
+        cur.close()
+    
+    assigned = [job[2] for job in jobs if job[2] is not None]
+    if assigned:
+        annotate(numbers=[min(assigned), max(assigned)])
+    
+    results = []
+    for (index, item, contract_number, _), (output_bytes, report, error) in zip(jobs, rendered):
+        result = {'index': index, 'contract_number': contract_number, 'success': error is None}
+        if error is None:
+            result['placeholders'] = report
+        else:
+            result['error'] = error
+        results.append(result)
+    
+    failed = sum(1 for result in results if not result['success'])
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json'
+        },
+        'isBase64Encoded': False,
+        'body': json.dumps({
+            'success': failed == 0,
+            'count': len(results),
+            'failed': failed,
+            'template': template_info,
+            'results': results
+        })
+    }
+
+
+def archive_contract(cur, body_data: Dict[str, Any], contract_number: int, output_bytes: bytes):
+    '''Сохранить DOCX в архив: повторная отправка и экспорт обходятся без рендера и нового номера'''
+    caption, file_name = contract_document(body_data, contract_number)
+    with span('archive') as attrs:
+        attrs.update(store_contract(cur, contract_number, file_name, caption, output_bytes))
+
+
+def render_batch(template: CachedTemplate, jobs: List[Tuple[int, Any, int, Optional[Cover]]], parallel: bool) -> List[Tuple]:
+    '''
+    Отрендерить элементы пакета, при parallel - в пуле процессов. Дочерним процессам Cover уходит
+    с уже декодированными байтами, а у родителя остаются свои объекты для очереди отправки
+    '''
+    if parallel and len(jobs) > 1:
+        try:
+            # memoryview не сериализуется в дочерние процессы, им уходит копия bytes
+            with ProcessPoolExecutor(initializer=_init_batch_worker, initargs=(bytes(template.data), template.placeholders)) as pool:
+                return list(pool.map(_render_batch_item, jobs, chunksize=max(1, len(jobs) // 32)))
+        except Exception as e:
+            # В окружениях без /dev/shm пул процессов не поднимается
+            print(f'Process pool unavailable, rendering sequentially: {e}')
+    
+    return [_render_item(template, job) for job in jobs]
+
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json'
+        },
+        'isBase64Encoded': False,
+        'body': json.dumps({'success': False, 'error': message})
+    }
+
+
+_batch_template: Dict[str, Any] = {'template': None}
+
+
+def _init_batch_worker(data: bytes, placeholders: Optional[List[Dict[str, Any]]]):
+    _batch_template['template'] = CachedTemplate(data, placeholders)
+
+
+def _render_batch_item(job: Tuple[int, Dict[str, Any], int, Optional[Cover]]) -> Tuple[Optional[bytes], Optional[Dict[str, Any]], Optional[str]]:
+    return _render_item(_batch_template['template'], job)
+
+
+def _load_item_cover(item: Any) -> Tuple[Optional[Cover], Optional[str]]:
+    '''Обложка элемента пакета (base64 убирается из элемента) и текст ошибки, если ее не удалось декодировать'''
+    if not isinstance(item, dict):
+        return None, None
+    try:
+        return load_cover(item, release=True), None
+    except Exception as e:
+        return None, f'Invalid cover_image: {e}'
+
+
+def _render_item(template: CachedTemplate, job: Tuple[int, Dict[str, Any], int, Optional[Cover]]) -> Tuple[Optional[bytes], Optional[Dict[str, Any]], Optional[str]]:
+    '''Отрендерить один элемент пакета, превращая исключение в текст ошибки'''
+    _, item, contract_number, cover = job
+    try:
+        if not isinstance(item, dict):
+            raise Exception('Item must be an object with form fields')
+        output_bytes, substitution = render_contract(template, item, contract_number, cover)
+        return output_bytes, substitution.report.as_dict(), None
+    except Exception as e:
+        return None, None, str(e)
+
+
+def build_replacements(body_data: Dict[str, Any], contract_number: int) -> Dict[str, str]:
+    replacements = {'{{номер_договора}}': str(contract_number)}
+    for field in FORM_FIELDS:
+        replacements['{{' + field + '}}'] = body_data.get(field, '')
+    return replacements
+
+
+def render_contract(template: CachedTemplate, body_data: Dict[str, Any], contract_number: int, cover: Optional[Cover]) -> Tuple[bytes, Substitution]:
+    '''Собрать DOCX договора по данным формы'''
+    replacements = build_replacements(body_data, contract_number)
+    
+    cover_image_bytes = cover.embedded() if cover is not None else None
+    
+    if not cover_image_bytes:
+        replacements['{{img}}'] = ''
+    
+    output_bytes = None
+    if DOCX_RENDERER == 'stream':
+        from ooxml_renderer import render_docx
+        
+        try:
+            output_bytes, substitution = render_docx(template.data, template.placeholders, replacements, cover_image_bytes)
+        except Exception as e:
+            print(f'Streaming renderer failed, falling back to python-docx: {e}')
+    
+    if output_bytes is None:
+        output_bytes, substitution = render_with_python_docx(template, replacements, cover_image_bytes)
+    
+    return output_bytes, substitution
+
+
+def patch_compiled_placeholders(doc: Any, placeholders: List[Dict[str, Any]], substitution: Substitution):
+    '''Заменить плейсхолдеры только в известных w:t из индекса, собранного при загрузке шаблона'''
+    parts = {str(part.partname): part for part in doc.part.package.iter_parts()}
+    texts_by_part: Dict[str, List[Any]] = {}
+    
+    for location in placeholders:
+        part = parts.get(location['part'])
+        if part is None:
+            continue
+        if location['part'] not in texts_by_part:
+            texts_by_part[location['part']] = list(part.element.iter(W_T))
+        substitution.text_node(texts_by_part[location['part']][location['index']], part)
+
+
+def render_with_python_docx(template: CachedTemplate, replacements: Dict[str, str], cover_image_bytes: Any) -> Tuple[bytes, Substitution]:
+    '''Запасной путь: подстановка через объектную модель python-docx и doc.save'''
+    from docx.shared import Inches
+    from docx.text.run import Run
+    
+    with span('parse', renderer='docx'):
+        doc = template.document()
+    
+    hooks = {}
+    if cover_image_bytes:
+        def insert_cover(run_element: Any, part: Any):
+            Run(run_element, part).add_picture(io.BytesIO(cover_image_bytes), width=Inches(1.57))
+        hooks['{{img}}'] = insert_cover
+    
+    substitution = Substitution(replacements, hooks)
+    
+    with span('substitution', renderer='docx'):
+        if template.placeholders is not None:
+            patch_compiled_placeholders(doc, template.placeholders, substitution)
+        else:
+            for part in doc.part.package.iter_parts():
+                if STORY_PARTS.match(str(part.partname)) and hasattr(part, 'element'):
+                    substitution.part(part.element, part)
+    
+    output = io.BytesIO()
+    with span('save', renderer='docx'):
+        doc.save(output)
+    return output.getvalue(), substitution
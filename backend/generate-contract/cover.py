@@ -0,0 +1,120 @@
+import hashlib
+import io
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from tracing import span
+from buffers import BufferReader, b64decode_chunked
+
+# Картинка в договоре: 150x150, JPEG в разы меньше PNG на фотографиях
+EMBED_SIZE = (150, 150)
+EMBED_FORMAT = os.environ.get('COVER_EMBED_FORMAT', 'JPEG').upper()
+EMBED_JPEG_QUALITY = 90
+
+# original - отправлять загруженный файл, resized - пережатый JPEG не больше COVER_MAX_SIDE
+COVER_UPLOAD = os.environ.get('TELEGRAM_COVER_UPLOAD', 'original')
+COVER_MAX_SIDE = int(os.environ.get('TELEGRAM_COVER_MAX_SIDE', '1280'))
+COVER_JPEG_QUALITY = 85
+
+# Сколько обработанных обложек держать в теплом контейнере
+CACHE_SIZE = int(os.environ.get('COVER_CACHE_SIZE', '32'))
+
+_cache: 'OrderedDict[str, Tuple[Optional[bytes], Optional[bytes]]]' = OrderedDict()
+stats = {'hits': 0, 'misses': 0}
+
+
+def _save(img: Any, image_format: str, quality: int) -> bytes:
+    img_io = io.BytesIO()
+    if image_format == 'JPEG':
+        img.save(img_io, format='JPEG', quality=quality, optimize=True)
+    else:
+        img.save(img_io, format=image_format)
+    return img_io.getvalue()
+
+
+def _process(raw: Any, with_upload: bool) -> Tuple[Optional[bytes], Optional[bytes]]:
+    '''Одно декодирование: миниатюра для договора и (если нужна) копия для Telegram'''
+    from PIL import Image
+    
+    with Image.open(BufferReader(raw)) as source:
+        # JPEG декодируется сразу с уменьшением в 2/4/8 раз до ближайшего размера не меньше нужного
+        target = COVER_MAX_SIDE if with_upload else max(EMBED_SIZE) * 2
+        source.draft('RGB', (target, target))
+        img = source.convert('RGB')
+    
+    # Пиксели закрываются сразу после сохранения, а не когда до них доберется сборщик мусора
+    try:
+        upload = None
+        if with_upload:
+            img.thumbnail((COVER_MAX_SIDE, COVER_MAX_SIDE), Image.LANCZOS)
+            upload = _save(img, 'JPEG', COVER_JPEG_QUALITY)
+            if len(upload) >= len(raw):
+                upload = None
+        
+        with img.resize(EMBED_SIZE, Image.LANCZOS, reducing_gap=3.0) as thumbnail:
+            embedded = _save(thumbnail, EMBED_FORMAT, EMBED_JPEG_QUALITY)
+    finally:
+        img.close()
+    return embedded, upload
+
+
+class Cover:
+    '''Обложка из формы: base64 декодируется один раз, обработка кешируется по sha256 содержимого'''
+    
+    def __init__(self, raw: Any, file_name: str):
+        self.raw = raw
+        self.file_name = file_name
+        self.content_hash = hashlib.sha256(raw).hexdigest()
+        self._result: Optional[Tuple[Optional[bytes], Optional[bytes]]] = None
+    
+    def _processed(self) -> Tuple[Optional[bytes], Optional[bytes]]:
+        if self._result is not None:
+            return self._result
+        
+        with_upload = COVER_UPLOAD == 'resized'
+        with span('image', bytes=len(self.raw)) as attrs:
+            cached = _cache.get(self.content_hash)
+            if cached is not None:
+                _cache.move_to_end(self.content_hash)
+                stats['hits'] += 1
+                attrs['cache'] = 'hit'
+                self._result = cached
+                return cached
+            
+            stats['misses'] += 1
+            attrs['cache'] = 'miss'
+            try:
+                result = _process(self.raw, with_upload)
+            except Exception as e:
+                print(f'Failed to process cover image: {e}')
+                attrs['failed'] = True
+                result = (None, None)
+            
+            _cache[self.content_hash] = result
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+            self._result = result
+            return result
+    
+    def embedded(self) -> Optional[bytes]:
+        '''Миниатюра 150x150 для вставки в договор или None, если картинку не удалось прочитать'''
+        return self._processed()[0]
+    
+    def upload(self) -> Tuple[Any, str]:
+        '''Файл для Telegram: (буфер, имя); оригинал, если пережатие выключено или не уменьшило файл'''
+        if COVER_UPLOAD == 'resized':
+            resized = self._processed()[1]
+            if resized is not None:
+                return resized, os.path.splitext(self.file_name)[0] + '.jpg'
+        return self.raw, self.file_name
+
+
+def load_cover(body_data: Dict[str, Any], release: bool = False) -> Optional[Cover]:
+    '''
+    Обложка из cover_image (base64) или None, если ее нет.
+    release - убрать base64 из body_data после декодирования: текст на треть больше самой картинки
+    '''
+    cover_image_b64 = body_data.pop('cover_image', '') if release else body_data.get('cover_image', '')
+    if not cover_image_b64:
+        return None
+    return Cover(b64decode_chunked(cover_image_b64), body_data.get('cover_image_name') or 'cover.jpg')
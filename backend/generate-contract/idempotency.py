@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+from tracing import span
+
+# Сколько секунд повтор запроса возвращает исходный результат; 0 - идемпотентность выключена
+IDEMPOTENCY_WINDOW_SECONDS = int(os.environ.get('IDEMPOTENCY_WINDOW', '600'))
+
+# 1 - без заголовка Idempotency-Key ключом служит хеш тела (для клиентов, которые ключ не шлют).
+# По умолчанию выключено: одинаковая форма, отправленная повторно намеренно, должна дать новый договор
+HASH_FALLBACK = os.environ.get('IDEMPOTENCY_HASH_FALLBACK', '0') == '1'
+
+MAX_KEY_LENGTH = 128
+
+# Строки длиннее (base64 обложки) хешируются отдельно по кускам: json.dumps всего тела копировал бы их дважды
+LARGE_FIELD = 64 * 1024
+
+# Сколько просроченных ключей удаляется при записи нового, чтобы таблица не росла без cron
+CLEANUP_BATCH = 100
+
+
+class IdempotencyError(Exception):
+    '''Ключ нельзя использовать: HTTP-статус ответа в status'''
+    
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _digest_text(text: str) -> str:
+    '''sha256 длинной строки по кускам, без копии всей строки в bytes'''
+    digest = hashlib.sha256()
+    for start in range(0, len(text), LARGE_FIELD):
+        digest.update(text[start:start + LARGE_FIELD].encode('utf-8'))
+    return f'sha256:{digest.hexdigest()}'
+
+
+def _compact(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > LARGE_FIELD:
+        return _digest_text(value)
+    if isinstance(value, dict):
+        return {key: _compact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_compact(item) for item in value]
+    return value
+
+
+def request_hash(body_data: Any) -> str:
+    '''sha256 нормализованного тела: порядок полей и пробелы JSON не важны, длинные строки входят своим хешем'''
+    normalized = json.dumps(_compact(body_data), sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def idempotency_key(event: Dict[str, Any], body_hash: str) -> Optional[str]:
+    '''Ключ запроса из заголовка Idempotency-Key или хеша тела; None - идемпотентность не применяется'''
+    if IDEMPOTENCY_WINDOW_SECONDS <= 0:
+        return None
+    
+    headers = {str(name).lower(): value for name, value in (event.get('headers') or {}).items()}
+    key = str(headers.get('idempotency-key') or '').strip()
+    if key:
+        if len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyError(400, f'Idempotency-Key is longer than {MAX_KEY_LENGTH} characters')
+        return key
+    
+    return f'body:{body_hash}' if HASH_FALLBACK else None
+
+
+def find_replay(cur, key: str, body_hash: str) -> Optional[Dict[str, Any]]:
+    '''
+    Заблокировать ключ до конца транзакции и вернуть сохраненный ответ, если ключ еще действует.
+    Параллельный повтор ждет на блокировке и после commit первого запроса получает его ответ
+    '''
+    with span('idempotency_lookup') as attrs:
+        cur.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (key,))
+        cur.execute(
+            '''SELECT request_hash, response FROM contract_idempotency
+               WHERE idempotency_key = %s AND expires_at > CURRENT_TIMESTAMP''',
+            (key,)
+        )
+        row = cur.fetchone()
+        attrs['hit'] = row is not None
+    
+    if row is None:
+        return None
+    
+    stored_hash, response = row
+    if stored_hash != body_hash:
+        raise IdempotencyError(422, 'Idempotency-Key was already used with a different request body')
+    return response if isinstance(response, dict) else json.loads(response)
+
+
+def remember(cur, key: str, body_hash: str, contract_number: int, output_bytes: bytes, response: Dict[str, Any]):
+    '''Сохранить ключ с номером, хешем DOCX и телом ответа (в транзакции, которая выдала номер)'''
+    with span('idempotency_store') as attrs:
+        # Конфликт возможен только с просроченной записью: действующую нашел бы find_replay
+        cur.execute(
+            '''INSERT INTO contract_idempotency (idempotency_key, request_hash, contract_number, artifact_hash, response, expires_at)
+               VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+               ON CONFLICT (idempotency_key) DO UPDATE
+               SET request_hash = EXCLUDED.request_hash, contract_number = EXCLUDED.contract_number,
+                   artifact_hash = EXCLUDED.artifact_hash, response = EXCLUDED.response,
+                   created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at''',
+            (key, body_hash, contract_number, hashlib.sha256(output_bytes).hexdigest(),
+             json.dumps(response, ensure_ascii=False), IDEMPOTENCY_WINDOW_SECONDS)
+        )
+        
+        cur.execute(
+            '''DELETE FROM contract_idempotency WHERE idempotency_key IN (
+                   SELECT idempotency_key FROM contract_idempotency
+                   WHERE expires_at <= CURRENT_TIMESTAMP
+                   LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+               )''',
+            (CLEANUP_BATCH,)
+        )
+        attrs['expired_deleted'] = cur.rowcount
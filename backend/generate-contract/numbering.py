@@ -0,0 +1,83 @@
+import os
+from typing import Dict, List
+from tracing import span
+
+# sequence - номера из contract_number_seq без блокировок (возможны пропуски),
+# gapless - номер фиксируется в contract_counter только после успешного рендера
+NUMBERING_MODE = os.environ.get('CONTRACT_NUMBERING', 'sequence')
+
+# Сколько номеров теплый контейнер забирает из последовательности за раз (только для одиночных запросов)
+NUMBER_LEASE_SIZE = max(1, int(os.environ.get('CONTRACT_NUMBER_LEASE', '1')))
+
+_lease: Dict[str, List[int]] = {'numbers': []}
+
+# Пакет сдвигает последовательность setval'ом под исключительной блокировкой, одиночные nextval
+# берут разделяемую: иначе чужой nextval попал бы внутрь блока пакета
+NUMBER_LOCK = "hashtext('contract_number_seq')"
+
+# Последний выданный номер с учетом обоих источников, чтобы режимы можно было переключать
+LAST_ISSUED_QUERY = '''
+    SELECT GREATEST(c.current_number, CASE WHEN s.is_called THEN s.last_value ELSE s.last_value - 1 END)
+    FROM contract_counter c, contract_number_seq s
+    WHERE c.id = 1
+    FOR UPDATE OF c
+'''
+
+
+def is_gapless() -> bool:
+    return NUMBERING_MODE == 'gapless'
+
+
+def refill_lease(cur) -> bool:
+    '''
+    Пополнить аренду контейнера, если она пуста (режим sequence); True - был запрос к базе.
+    Разделяемая блокировка держится до commit, поэтому вызывающий код коммитит сразу, до рендера
+    '''
+    leased = _lease['numbers']
+    if leased:
+        return False
+    with span('counter', mode='sequence', leased=False):
+        cur.execute(f'SELECT pg_advisory_xact_lock_shared({NUMBER_LOCK})')
+        cur.execute("SELECT nextval('contract_number_seq') FROM generate_series(1, %s)", (NUMBER_LEASE_SIZE,))
+        leased.extend(row[0] for row in cur.fetchall())
+    return True
+
+
+def reserve_number(cur) -> int:
+    '''Выдать номер для одиночного запроса (режим sequence) из аренды контейнера'''
+    refill_lease(cur)
+    return _lease['numbers'].pop(0)
+
+
+def reserve_block(cur, count: int) -> List[int]:
+    '''Выдать пакету count номеров подряд (режим sequence); блокировка держится до commit транзакции'''
+    with span('counter', mode='sequence', block=count):
+        cur.execute(f'SELECT pg_advisory_xact_lock({NUMBER_LOCK})')
+        cur.execute("SELECT nextval('contract_number_seq')")
+        first = cur.fetchone()[0]
+        if count > 1:
+            cur.execute("SELECT setval('contract_number_seq', %s)", (first + count - 1,))
+    
+    return list(range(first, first + count))
+
+
+def lock_last_number(cur) -> int:
+    '''Режим gapless: заблокировать счетчик до конца транзакции и вернуть последний выданный номер'''
+    with span('counter', mode='gapless'):
+        cur.execute(LAST_ISSUED_QUERY)
+        return cur.fetchone()[0]
+
+
+def commit_last_number(cur, last_number: int):
+    '''Режим gapless: записать последний использованный номер (вызывать перед commit)'''
+    with span('counter_commit'):
+        cur.execute(
+            'UPDATE contract_counter SET current_number = %s, updated_at = CURRENT_TIMESTAMP WHERE id = 1',
+            (last_number,)
+        )
+        # Последовательность подтягиваем, чтобы режим sequence продолжил без повторов
+        cur.execute(
+            '''SELECT setval('contract_number_seq', %s) FROM contract_number_seq
+               WHERE (CASE WHEN is_called THEN last_value ELSE last_value - 1 END) < %s''',
+            (last_number, last_number)
+        )
@@ -0,0 +1,184 @@
+import io
+import posixpath
+import re
+import zipfile
+from typing import Any, Dict, List, Optional, Tuple
+from docx.image.image import Image as DocxImage
+from docx.opc.oxml import serialize_part_xml
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.shape import CT_Inline
+from docx.shared import Inches
+from substitution import Substitution, W_T
+from tracing import span
+from zip_members import read_raw_member, append_raw_member
+from buffers import BufferReader
+
+STORY_MEMBER = re.compile(r'^word/(document|header\d*|footer\d*)\.xml$')
+
+CONTENT_TYPES = '[Content_Types].xml'
+CT_NS = 'http://schemas.openxmlformats.org/package/2006/content-types'
+RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+RT_IMAGE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+
+COVER_WIDTH = Inches(1.57)
+
+
+def _rels_name(member: str) -> str:
+    directory, name = posixpath.split(member)
+    return posixpath.join(directory, '_rels', name + '.rels')
+
+
+def _next_rid(rels_root: Any) -> str:
+    '''Первый свободный rIdN, как в python-docx'''
+    used = {rel.get('Id') for rel in rels_root}
+    for n in range(1, len(used) + 2):
+        if f'rId{n}' not in used:
+            return f'rId{n}'
+
+
+def _next_shape_id(root: Any) -> int:
+    used = [int(value) for value in root.xpath('//@id') if value.isdigit()]
+    return max(used) + 1 if used else 1
+
+
+def _next_media_name(names: List[str], ext: str) -> str:
+    '''Следующее свободное word/media/imageN.ext, номер уникален без учета расширения'''
+    pattern = re.compile(r'^word/media/image(\d+)\.[^/]+$')
+    used = {int(m.group(1)) for m in (pattern.match(name) for name in names) if m}
+    n = 1
+    while n in used:
+        n += 1
+    return f'word/media/image{n}.{ext}'
+
+
+def _copy_raw(source: Any, target: zipfile.ZipFile, info: zipfile.ZipInfo):
+    '''Перенести член архива как есть, без распаковки и повторного сжатия'''
+    append_raw_member(target, info, read_raw_member(source, info))
+
+
+class _CoverInserter:
+    '''Хук {{img}}: вставляет картинку в run и копит изменения rels/media/content types'''
+    
+    def __init__(self, source: zipfile.ZipFile, image_bytes: bytes):
+        self.source = source
+        self.image = DocxImage.from_blob(image_bytes)
+        self.image_bytes = image_bytes
+        self.media_name: Optional[str] = None
+        self.rels: Dict[str, Any] = {}
+        self.rel_ids: Dict[str, str] = {}
+        self.roots: Dict[str, Any] = {}
+    
+    def _relate(self, member: str) -> str:
+        if member in self.rel_ids:
+            return self.rel_ids[member]
+        
+        names = self.source.namelist()
+        if self.media_name is None:
+            self.media_name = _next_media_name(names, self.image.ext)
+        
+        rels_name = _rels_name(member)
+        if rels_name not in self.rels:
+            if rels_name in names:
+                self.rels[rels_name] = parse_xml(self.source.read(rels_name))
+            else:
+                self.rels[rels_name] = parse_xml(f'<Relationships xmlns="{RELS_NS}"/>')
+        rels_root = self.rels[rels_name]
+        
+        rid = _next_rid(rels_root)
+        rel = rels_root.makeelement(f'{{{RELS_NS}}}Relationship', {
+            'Id': rid,
+            'Type': RT_IMAGE,
+            'Target': posixpath.relpath(self.media_name, posixpath.dirname(member))
+        })
+        rels_root.append(rel)
+        self.rel_ids[member] = rid
+        return rid
+    
+    def hook_for(self, member: str):
+        def insert(run_element: Any, _part: Any):
+            root = self.roots[member]
+            rid = self._relate(member)
+            cx, cy = self.image.scaled_dimensions(COVER_WIDTH, None)
+            inline = CT_Inline.new_pic_inline(_next_shape_id(root), rid, self.image.filename, cx, cy)
+            drawing = OxmlElement('w:drawing')
+            drawing.append(inline)
+            run_element.append(drawing)
+        return insert
+
+
+def _ensure_default_content_type(data: bytes, ext: str, content_type: str) -> Optional[bytes]:
+    root = parse_xml(data)
+    for default in root.findall(f'{{{CT_NS}}}Default'):
+        if default.get('Extension', '').lower() == ext:
+            return None
+    root.insert(0, root.makeelement(f'{{{CT_NS}}}Default', {'Extension': ext, 'ContentType': content_type}))
+    return serialize_part_xml(root)
+
+
+def render_docx(template: Any, placeholders: Optional[List[Dict[str, Any]]], values: Dict[str, str],
+                cover_image_bytes: Optional[bytes]) -> Tuple[bytes, Substitution]:
+    '''
+    Собрать договор прямо из ZIP шаблона: переписываются только document/header/footer,
+    а при наличии обложки - их rels, media и [Content_Types].xml.
+    Остальные члены архива копируются сжатыми байтами без перекомпрессии.
+    template - bytes или memoryview BYTEA из кеша, читается без копии.
+    Возвращает (bytes DOCX, Substitution с отчетом).
+    '''
+    source_io = BufferReader(template)
+    source = zipfile.ZipFile(source_io)
+    
+    cover = _CoverInserter(source, cover_image_bytes) if cover_image_bytes else None
+    substitution = Substitution(values, {})
+    
+    by_member: Dict[str, List[Dict[str, Any]]] = {}
+    for location in placeholders or []:
+        by_member.setdefault(location['part'].lstrip('/'), []).append(location)
+    
+    roots: Dict[str, Any] = {}
+    with span('parse', renderer='stream'):
+        for info in source.infolist():
+            name = info.filename
+            if not STORY_MEMBER.match(name):
+                continue
+            if placeholders is not None and name not in by_member:
+                continue
+            roots[name] = parse_xml(source.read(name))
+            if cover is not None:
+                cover.roots[name] = roots[name]
+    
+    with span('substitution', renderer='stream'):
+        for name, root in roots.items():
+            if cover is not None:
+                substitution.hooks = {'{{img}}': cover.hook_for(name)}
+            
+            if placeholders is not None:
+                texts = list(root.iter(W_T))
+                for location in by_member[name]:
+                    substitution.text_node(texts[location['index']])
+            else:
+                substitution.part(root)
+    
+    with span('save', renderer='stream'):
+        rewritten: Dict[str, bytes] = {name: serialize_part_xml(root) for name, root in roots.items()}
+        
+        if cover is not None and cover.media_name is not None:
+            for rels_name, rels_root in cover.rels.items():
+                rewritten[rels_name] = serialize_part_xml(rels_root)
+            content_types = _ensure_default_content_type(source.read(CONTENT_TYPES), cover.image.ext, cover.image.content_type)
+            if content_types is not None:
+                rewritten[CONTENT_TYPES] = content_types
+        
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as target:
+            for info in source.infolist():
+                if info.filename in rewritten:
+                    target.writestr(info.filename, rewritten.pop(info.filename))
+                else:
+                    _copy_raw(source_io, target, info)
+            for name, data in rewritten.items():
+                target.writestr(name, data)
+            if cover is not None and cover.media_name is not None:
+                target.writestr(cover.media_name, cover.image_bytes, compress_type=zipfile.ZIP_STORED)
+    
+    source.close()
+    return output.getvalue(), substitution
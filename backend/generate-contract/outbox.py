@@ -0,0 +1,142 @@
+'''
+Очередь telegram_outbox: запись через COPY и статус доставки договора.
+Модуль лежит одинаковой копией в generate-contract и contract-archive (повторная отправка из архива),
+поэтому обложка (cover.Cover из generate-contract) здесь не импортируется - нужен только ее upload().
+'''
+import binascii
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from tracing import span
+
+DOCX_MIME = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# separate - sendPhoto + sendDocument, media_group - обложка и договор одним sendMediaGroup
+DELIVERY_MODE = os.environ.get('TELEGRAM_DELIVERY_MODE', 'separate')
+
+# Сколько байтов файла превращается в hex за один кусок COPY
+COPY_CHUNK = 256 * 1024
+
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def enqueue_contract_delivery(cur, body_data: Dict[str, Any], contract_number: int, output_bytes: bytes, cover: Optional[Any]):
+    '''Поставить обложку и договор в telegram_outbox (в транзакции вызывающего кода)'''
+    with span('outbox_enqueue', mode=DELIVERY_MODE):
+        _enqueue(cur, body_data, contract_number, output_bytes, cover)
+
+
+def enqueue_document(cur, contract_number: int, caption: str, file_name: str, file_data: Any):
+    '''Поставить в telegram_outbox готовый договор без обложки (повторная отправка из архива)'''
+    with span('outbox_enqueue', mode='document'):
+        _copy_rows(cur, ('contract_number', 'method', 'chat_id', 'caption', 'file_name', 'file_data'),
+                   [(contract_number, 'sendDocument', os.environ.get('TELEGRAM_CHAT_ID', ''), caption, file_name, file_data)])
+
+
+def contract_document(body_data: Dict[str, Any], contract_number: int) -> Tuple[str, str]:
+    '''Подпись и имя файла договора в Telegram (и в архиве договоров)'''
+    nickname = body_data.get('NIK', 'Unknown')
+    return f'🎵 {nickname} - Лицензионный договор №{contract_number}', f'{nickname}_Договор_{contract_number}.docx'
+
+
+def _enqueue(cur, body_data: Dict[str, Any], contract_number: int, output_bytes: bytes, cover: Optional[Any]):
+    chat_id = os.environ.get('TELEGRAM_CHAT_ID', '')
+    nickname = body_data.get('NIK', 'Unknown')
+    
+    document = contract_document(body_data, contract_number) + (output_bytes,)
+    
+    cover_message = None
+    if cover is not None:
+        cover_bytes, cover_name = cover.upload()
+        cover_message = (f'🎨 Обложка для {nickname}', cover_name, cover_bytes)
+    
+    if cover_message and DELIVERY_MODE == 'media_group':
+        # Одна запись - один вызов sendMediaGroup; обложка уходит первой
+        caption, file_name, file_data = document
+        cover_caption, cover_name, cover_bytes = cover_message
+        _copy_rows(cur, ('contract_number', 'method', 'chat_id', 'caption', 'file_name', 'file_data',
+                         'cover_caption', 'cover_file_name', 'cover_data'),
+                   [(contract_number, 'sendMediaGroup', chat_id, caption, file_name, file_data,
+                     cover_caption, cover_name, cover_bytes)])
+        return
+    
+    messages = []
+    if cover_message:
+        messages.append(('sendPhoto',) + cover_message)
+    messages.append(('sendDocument',) + document)
+    
+    _copy_rows(cur, ('contract_number', 'method', 'chat_id', 'caption', 'file_name', 'file_data'),
+               [(contract_number, method, chat_id, caption, file_name, file_data)
+                for method, caption, file_name, file_data in messages])
+
+
+class _CopyStream:
+    '''Файловый объект для copy_expert: read отдает следующий непустой кусок, размер psycopg2 не важен'''
+    
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+    
+    def read(self, size: int = -1) -> bytes:
+        for chunk in self.chunks:
+            if chunk:
+                return chunk
+        return b''
+
+
+def _copy_text(rows: List[Tuple]) -> Iterator[bytes]:
+    '''Строки в текстовом формате COPY; BYTEA - \\\\x и hex, который считается кусками прямо из буфера'''
+    for row in rows:
+        for n, value in enumerate(row):
+            if n:
+                yield b'\t'
+            if value is None:
+                yield b'\\N'
+            elif isinstance(value, (bytes, bytearray, memoryview)):
+                view = memoryview(value).cast('B')
+                yield b'\\\\x'
+                for start in range(0, len(view), COPY_CHUNK):
+                    yield binascii.hexlify(view[start:start + COPY_CHUNK])
+            else:
+                yield str(value).translate(COPY_ESCAPES).encode('utf-8')
+        yield b'\n'
+
+
+def _copy_rows(cur, columns: Tuple[str, ...], rows: List[Tuple]):
+    '''
+    Вставка в telegram_outbox через COPY FROM STDIN: в INSERT psycopg2 экранирует BYTEA в hex
+    внутри текста запроса, и на пике в памяти файл, его hex и собранный запрос (~5 размеров файла).
+    COPY отправляет тот же hex кусками по COPY_CHUNK
+    '''
+    cur.copy_expert(f"COPY telegram_outbox ({', '.join(columns)}) FROM STDIN", _CopyStream(_copy_text(rows)))
+
+
+def get_delivery_status(cur, contract_number: int) -> Dict[str, Any]:
+    '''Статус доставки договора: общий и по каждому сообщению'''
+    cur.execute('''
+        SELECT method, status, attempts, last_error, created_at, sent_at
+        FROM telegram_outbox
+        WHERE contract_number = %s
+        ORDER BY id
+    ''', (contract_number,))
+    
+    messages: List[Dict[str, Any]] = []
+    for method, status, attempts, last_error, created_at, sent_at in cur.fetchall():
+        messages.append({
+            'method': method,
+            'status': status,
+            'attempts': attempts,
+            'last_error': last_error,
+            'created_at': created_at.isoformat() if created_at else None,
+            'sent_at': sent_at.isoformat() if sent_at else None
+        })
+    
+    statuses = {message['status'] for message in messages}
+    if not messages:
+        overall = 'unknown'
+    elif 'failed' in statuses:
+        overall = 'failed'
+    elif statuses == {'sent'}:
+        overall = 'sent'
+    else:
+        overall = 'pending'
+    
+    return {'contract_number': contract_number, 'status': overall, 'messages': messages}
@@ -0,0 +1,135 @@
+import re
+from bisect import bisect_right
+from typing import Any, Callable, Dict, List, Optional, Set
+
+PLACEHOLDER_RE = re.compile(r'\{\{[^{}]+\}\}')
+
+# Имена в нотации Clark, как у docx.oxml.ns.qn: модуль не тянет python-docx ради двух констант
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_T = W_NS + 't'
+W_P = W_NS + 'p'
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+
+class SubstitutionReport:
+    '''Итог подстановки: сколько замен сделано и какие ключи не удалось заполнить'''
+    
+    def __init__(self):
+        self.replaced = 0
+        self.unknown: Set[str] = set()
+        self.unfilled: Set[str] = set()
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'replaced': self.replaced,
+            'unknown': sorted(self.unknown),
+            'unfilled': sorted(self.unfilled)
+        }
+
+
+class Substitution:
+    '''
+    Однопроходная подстановка {{...}} по одному регулярному выражению.
+    Значение пишется в тот w:t, где начинается плейсхолдер, поэтому форматирование его run сохраняется.
+    hooks - обработчики особых ключей (например {{img}}): ключ вырезается из текста,
+    а обработчик получает элемент w:r и часть документа.
+    '''
+    
+    def __init__(self, values: Dict[str, str], hooks: Optional[Dict[str, Callable[[Any, Any], None]]] = None):
+        self.values = values
+        self.hooks = hooks or {}
+        self.report = SubstitutionReport()
+    
+    def _resolve(self, token: str) -> Optional[str]:
+        if token in self.hooks:
+            return ''
+        if token not in self.values:
+            self.report.unknown.add(token)
+            return None
+        value = self.values[token]
+        if not value:
+            self.report.unfilled.add(token)
+        self.report.replaced += 1
+        return value
+    
+    def text(self, text: str) -> str:
+        '''Подставить значения в строку (для узлов, где плейсхолдер уже не разбит)'''
+        def replace(match) -> str:
+            value = self._resolve(match.group(0))
+            return match.group(0) if value is None else value
+        return PLACEHOLDER_RE.sub(replace, text)
+    
+    def text_node(self, t: Any, part: Any = None) -> None:
+        '''Обработать один w:t, в котором плейсхолдеры целиком'''
+        self._apply_texts([t], part)
+    
+    def paragraph(self, p: Any, part: Any = None) -> None:
+        '''Обработать абзац (lxml w:p) за один проход по его w:t'''
+        self._apply_texts([t for t in p.iter(W_T) if _paragraph_of(t) is p], part)
+    
+    def part(self, root: Any, part: Any = None) -> None:
+        '''Обработать все абзацы части документа за один обход w:t'''
+        by_paragraph: Dict[Any, List[Any]] = {}
+        for t in root.iter(W_T):
+            by_paragraph.setdefault(_paragraph_of(t), []).append(t)
+        for texts in by_paragraph.values():
+            self._apply_texts(texts, part)
+    
+    def _apply_texts(self, texts: List[Any], part: Any) -> None:
+        if not texts:
+            return
+        full_text = ''.join(t.text or '' for t in texts)
+        if '{{' not in full_text:
+            return
+        self._apply(full_text, texts, part)
+    
+    def _apply(self, full_text: str, texts: List[Any], part: Any) -> None:
+        starts: List[int] = []
+        offset = 0
+        for t in texts:
+            starts.append(offset)
+            offset += len(t.text or '')
+        
+        pieces: List[List[str]] = [[] for _ in texts]
+        hooked: List[tuple] = []
+        changed = False
+        
+        def emit(start: int, end: int) -> None:
+            while start < end:
+                i = bisect_right(starts, start) - 1
+                stop = min(end, starts[i + 1]) if i + 1 < len(starts) else end
+                pieces[i].append(full_text[start:stop])
+                start = stop
+        
+        pos = 0
+        for match in PLACEHOLDER_RE.finditer(full_text):
+            value = self._resolve(match.group(0))
+            if value is None:
+                continue
+            emit(pos, match.start())
+            owner = bisect_right(starts, match.start()) - 1
+            pieces[owner].append(value)
+            if match.group(0) in self.hooks:
+                hooked.append((match.group(0), owner))
+            pos = match.end()
+            changed = True
+        
+        if not changed:
+            return
+        emit(pos, len(full_text))
+        
+        for t, parts in zip(texts, pieces):
+            new_text = ''.join(parts)
+            if new_text != (t.text or ''):
+                t.text = new_text
+                t.set(XML_SPACE, 'preserve')
+        
+        for token, owner in hooked:
+            self.hooks[token](texts[owner].getparent(), part)
+
+
+def _paragraph_of(t: Any) -> Any:
+    node = t.getparent()
+    while node is not None and node.tag != W_P:
+        node = node.getparent()
+    return node
@@ -0,0 +1,127 @@
+import copy
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from tracing import span, annotate
+from buffers import BufferReader
+
+
+class CachedTemplate:
+    '''Шаблон в памяти контейнера: буфер BYTEA, индекс плейсхолдеров и лениво распарсенный Document'''
+    
+    def __init__(self, data: Any, placeholders: Optional[List[Dict[str, Any]]], content_hash: Optional[str] = None):
+        self.data = data
+        self.content_hash = content_hash
+        self.placeholders = placeholders
+        self._document = None
+    
+    def document(self) -> Any:
+        '''Рабочая копия python-docx Document (парсинг один раз, дальше deepcopy)'''
+        if self._document is None:
+            from docx import Document
+            
+            self._document = Document(BufferReader(self.data))
+        return copy.deepcopy(self._document)
+
+
+DEFAULT_TEMPLATE = os.environ.get('DEFAULT_TEMPLATE', 'default')
+
+# Сколько разных шаблонов держать в теплом контейнере
+CACHE_SIZE = int(os.environ.get('TEMPLATE_CACHE_SIZE', '4'))
+
+NAME_PATTERN = re.compile(r'^[\w.-]{1,64}$')
+
+
+class TemplateError(Exception):
+    '''Шаблон из запроса нельзя выбрать: неверное имя или версия (400) или их нет (404)'''
+    
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# Кэш живет в модуле и переживает вызовы одного "теплого" контейнера.
+# Содержимое адресуется sha256 и не меняется, поэтому запись по хешу не устаревает
+_cached: 'OrderedDict[str, CachedTemplate]' = OrderedDict()
+
+stats: Dict[str, int] = {'hits': 0, 'misses': 0}
+
+ACTIVE_QUERY = 'SELECT active_version, active_hash FROM templates WHERE name = %s'
+
+VERSION_QUERY = 'SELECT version, content_hash FROM template_versions WHERE name = %s AND version = %s'
+
+DATA_QUERY = '''
+    SELECT COALESCE(compiled_data, template_data), placeholders
+    FROM template_contents
+    WHERE content_hash = %s
+'''
+
+
+def template_selector(body_data: Dict[str, Any]) -> Tuple[str, Optional[int]]:
+    '''Имя и версия шаблона из тела запроса: template и template_version, по умолчанию активная версия DEFAULT_TEMPLATE'''
+    name = str(body_data.get('template') or DEFAULT_TEMPLATE)
+    if not NAME_PATTERN.match(name):
+        raise TemplateError(400, f'Invalid template name: {name}')
+    
+    version = body_data.get('template_version')
+    if version in (None, ''):
+        return name, None
+    try:
+        return name, int(version)
+    except (TypeError, ValueError):
+        raise TemplateError(400, f'Invalid template version: {version}')
+
+
+def get_template(cur, name: Optional[str] = None, version: Optional[int] = None) -> Tuple[CachedTemplate, Dict[str, Any]]:
+    '''
+    Шаблон и его версия ({name, version, content_hash}). Теплый кеш сверяется только по хешу
+    из одной строки templates (или template_versions); BYTEA читается, только если такого хеша в кеше нет
+    '''
+    name = name or DEFAULT_TEMPLATE
+    with span('template_fetch', template=name) as attrs:
+        if version is None:
+            cur.execute(ACTIVE_QUERY, (name,))
+        else:
+            cur.execute(VERSION_QUERY, (name, version))
+        row = cur.fetchone()
+        
+        if not row or not row[1]:
+            if name == DEFAULT_TEMPLATE and version is None:
+                raise Exception('Template not found. Please upload template.docx first via /434 page')
+            raise TemplateError(404, f'Template {name}' + (f' version {version}' if version is not None else '') + ' not found')
+        
+        version, content_hash = row[0], row[1].strip()
+        info = {'name': name, 'version': version, 'content_hash': content_hash}
+        attrs['version'] = version
+        
+        template = _cached.get(content_hash)
+        if template is not None:
+            _cached.move_to_end(content_hash)
+            stats['hits'] += 1
+            attrs['cache'] = 'hit'
+            annotate(template_cache=dict(stats))
+            return template, info
+        
+        stats['misses'] += 1
+        attrs['cache'] = 'miss'
+        
+        cur.execute(DATA_QUERY, (content_hash,))
+        data_row = cur.fetchone()
+        if not data_row or not data_row[0]:
+            raise Exception(f'Template {name} version {version} has no stored content. Please re-upload it via /434')
+        template_data, placeholders = data_row
+        
+        # memoryview из psycopg2 держится как есть: копия в bytes удвоила бы шаблон на все время жизни контейнера
+        if bytes(template_data[:2]) != b'PK':
+            raise Exception(f'Template is corrupted. First bytes: {bytes(template_data[:10]).hex()}. Please re-upload template.docx via /434')
+        
+        template = CachedTemplate(template_data, placeholders, content_hash)
+        _cached[content_hash] = template
+        while len(_cached) > CACHE_SIZE:
+            _cached.popitem(last=False)
+        
+        attrs['bytes'] = len(template_data)
+        attrs['compiled'] = placeholders is not None
+        annotate(template_cache=dict(stats))
+        return template, info
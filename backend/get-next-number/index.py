@@ -1,12 +1,23 @@
 import json
 import os
-from typing import Dict, Any
-import psycopg2
+import time
+from datetime import timezone
+from typing import Dict, Any, Optional
+from db_pool import unit_of_work
+
+# Сколько секунд теплый контейнер отвечает без базы: номер только показывается в форме,
+# настоящий выдает generate-contract. 0 - каждый запрос идет в базу
+CACHE_TTL_SECONDS = float(os.environ.get('NEXT_NUMBER_CACHE_TTL', '2'))
+
+# Последний прочитанный номер, его ETag и Last-Modified
+_cached: Dict[str, Any] = {'next_number': None, 'etag': None, 'last_modified': None, 'expires': 0.0}
+stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Get next contract number without incrementing
-    Args: event - dict with httpMethod
+    Business: Get next contract number without incrementing; cheap under polling
+    Args: event - dict with httpMethod; If-None-Match header answers 304 when the number is unchanged,
+          Cache-Control: no-cache skips the in-process cache
           context - object with request_id attribute
     Returns: HTTP response with next contract number
     '''
@@ -18,7 +29,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match, Cache-Control',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -32,30 +43,40 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     try:
-        db_url = os.environ.get('DATABASE_URL')
-        if not db_url:
-            raise Exception('DATABASE_URL not found')
+        headers = {str(name).lower(): value for name, value in (event.get('headers') or {}).items()}
+        no_cache = 'no-cache' in str(headers.get('cache-control') or '').lower()
         
-        conn = psycopg2.connect(db_url)
-        cur = conn.cursor()
+        if no_cache or _cached['next_number'] is None or time.monotonic() >= _cached['expires']:
+            stats['misses'] += 1
+            load_next_number()
+        else:
+            stats['hits'] += 1
         
-        cur.execute('SELECT current_number FROM contract_counter WHERE id = 1')
-        result = cur.fetchone()
-        current_number = result[0] if result else 0
-        next_number = current_number + 1
+        response_headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'ETag, Last-Modified',
+            'Cache-Control': 'no-cache',
+            'ETag': _cached['etag']
+        }
+        if _cached['last_modified']:
+            response_headers['Last-Modified'] = _cached['last_modified']
         
-        cur.close()
-        conn.close()
+        if etag_matches(headers.get('if-none-match'), _cached['etag']):
+            stats['not_modified'] += 1
+            return {
+                'statusCode': 304,
+                'headers': response_headers,
+                'isBase64Encoded': False,
+                'body': ''
+            }
         
+        response_headers['Content-Type'] = 'application/json'
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
+            'headers': response_headers,
             'isBase64Encoded': False,
             'body': json.dumps({
-                'next_number': next_number
+                'next_number': _cached['next_number']
             })
         }
         
@@ -71,3 +92,50 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'error': str(e)
             })
         }
+
+
+def load_next_number():
+    '''Прочитать номер из базы и обновить кеш контейнера'''
+    from email.utils import format_datetime
+    
+    db_url = os.environ.get('DATABASE_URL')
+    if not db_url:
+        raise Exception('DATABASE_URL not found')
+    
+    with unit_of_work(db_url) as db:
+        cur = db.cursor()
+        
+        # Тот же расчет, что и у generate-contract: учитываем и счетчик, и последовательность,
+        # поэтому значение верно в любом режиме CONTRACT_NUMBERING. При CONTRACT_NUMBER_LEASE > 1 это
+        # верхняя граница: теплые контейнеры могут еще выдать арендованные номера меньше этого
+        cur.execute('''
+            SELECT GREATEST(c.current_number, CASE WHEN s.is_called THEN s.last_value ELSE s.last_value - 1 END),
+                   c.updated_at
+            FROM contract_counter c, contract_number_seq s
+            WHERE c.id = 1
+        ''')
+        result = cur.fetchone()
+        cur.close()
+    
+    current_number, updated_at = result if result else (0, None)
+    next_number = current_number + 1
+    
+    # В режиме sequence номера берутся из последовательности и updated_at не меняется,
+    # поэтому в ETag входит и сам номер
+    version = int(updated_at.replace(tzinfo=timezone.utc).timestamp()) if updated_at else 0
+    _cached.update(
+        next_number=next_number,
+        etag=f'"{next_number}-{version}"',
+        last_modified=format_datetime(updated_at.replace(tzinfo=timezone.utc), usegmt=True) if updated_at else None,
+        expires=time.monotonic() + CACHE_TTL_SECONDS
+    )
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    '''If-None-Match: список ETag через запятую или *, слабые W/ сравниваются по значению'''
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return any((candidate[2:] if candidate.startswith('W/') else candidate) == etag for candidate in candidates)
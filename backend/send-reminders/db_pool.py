@@ -0,0 +1,184 @@
+'''
+Пул соединений Postgres, общий для теплых вызовов функции, и единица работы на один запрос.
+Каждая функция деплоится отдельно, поэтому модуль лежит копией в папке каждой функции
+с базой (generate-contract, upload-template, get-next-number, deliver-outbox, telegram-bot,
+send-reminders, contract-archive) - копии должны оставаться одинаковыми.
+'''
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# psycopg2 импортируется при первом соединении: CORS preflight и 405 отвечают без него
+
+# Вызовы в контейнере идут по одному, поэтому много соединений не нужно
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+# Соединение, простоявшее дольше, проверяется SELECT 1 перед выдачей
+CHECK_AFTER_SECONDS = float(os.environ.get('DB_POOL_CHECK_AFTER', '5'))
+# Дольше не держим вовсе: сервер или NAT все равно могли закрыть его
+MAX_IDLE_SECONDS = float(os.environ.get('DB_POOL_MAX_IDLE', '300'))
+
+# TCP keepalive, чтобы мертвое соединение обнаружилось, а не висело до таймаута запроса
+CONNECT_OPTIONS = {'keepalives': 1, 'keepalives_idle': 30, 'keepalives_interval': 10, 'keepalives_count': 3}
+
+
+class ConnectionPool:
+    '''Простаивающие соединения одного DSN; выдаются живыми, возвращаются без открытой транзакции'''
+    
+    def __init__(self, dsn: str, size: int = POOL_SIZE):
+        self.dsn = dsn
+        self.size = size
+        self.idle: List[Tuple[Any, float]] = []
+        self.lock = threading.Lock()
+        self.stats = {'opened': 0, 'reused': 0, 'discarded': 0, 'connect_ms': 0.0, 'saved_ms': 0.0}
+    
+    def _connect(self) -> Any:
+        import psycopg2
+        
+        started = time.perf_counter()
+        conn = psycopg2.connect(self.dsn, **CONNECT_OPTIONS)
+        self.stats['opened'] += 1
+        self.stats['connect_ms'] += (time.perf_counter() - started) * 1000
+        return conn
+    
+    def _alive(self, conn: Any, idle_for: float) -> bool:
+        import psycopg2
+        
+        if conn.closed:
+            return False
+        if idle_for > MAX_IDLE_SECONDS:
+            return False
+        if idle_for < CHECK_AFTER_SECONDS:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+    
+    def getconn(self) -> Tuple[Any, Dict[str, Any]]:
+        '''Вернуть (соединение, сведения о выдаче: reused, ms, saved_ms)'''
+        started = time.perf_counter()
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                conn, released_at = self.idle.pop()
+            if self._alive(conn, time.monotonic() - released_at):
+                self.stats['reused'] += 1
+                # Экономия - среднее время открытия нового соединения в этом контейнере
+                saved_ms = self.stats['connect_ms'] / self.stats['opened'] if self.stats['opened'] else 0.0
+                self.stats['saved_ms'] += saved_ms
+                return conn, {'reused': True, 'ms': round((time.perf_counter() - started) * 1000, 2),
+                              'saved_ms': round(saved_ms, 2)}
+            self.stats['discarded'] += 1
+            _close_quietly(conn)
+        
+        conn = self._connect()
+        return conn, {'reused': False, 'ms': round((time.perf_counter() - started) * 1000, 2), 'saved_ms': 0.0}
+    
+    def putconn(self, conn: Any, broken: bool = False):
+        '''Вернуть соединение; незавершенная транзакция откатывается, сломанное соединение закрывается'''
+        import psycopg2.extensions
+        
+        if not broken and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = True
+        
+        with self.lock:
+            if not broken and not conn.closed and len(self.idle) < self.size:
+                self.idle.append((conn, time.monotonic()))
+                return
+        self.stats['discarded'] += 1
+        _close_quietly(conn)
+    
+    def summary(self) -> Dict[str, Any]:
+        '''Счетчики пула с начала жизни контейнера (для строки трассировки)'''
+        stats = self.stats
+        return {'opened': stats['opened'], 'reused': stats['reused'], 'discarded': stats['discarded'],
+                'connect_ms': round(stats['connect_ms'], 1), 'saved_ms': round(stats['saved_ms'], 1)}
+
+
+def _close_quietly(conn: Any):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_pools: Dict[str, ConnectionPool] = {}
+
+
+def get_pool(dsn: str) -> ConnectionPool:
+    '''Пул на DSN, живет между теплыми вызовами контейнера'''
+    pool = _pools.get(dsn)
+    if pool is None:
+        pool = ConnectionPool(dsn)
+        _pools[dsn] = pool
+    return pool
+
+
+class UnitOfWork:
+    '''
+    Одно соединение и одна транзакция на запрос (или update Telegram).
+    Соединение берется из пула при первом обращении; на выходе - commit или rollback при исключении,
+    затем соединение возвращается в пул. Вызывающий код может коммитить и сам (например, по частям).
+    '''
+    
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.conn: Any = None
+        self.acquired: Dict[str, Any] = {}
+    
+    def connection(self) -> Any:
+        if self.conn is None:
+            if not self.dsn:
+                raise Exception('DATABASE_URL not found')
+            self.conn, self.acquired = get_pool(self.dsn).getconn()
+        return self.conn
+    
+    def cursor(self) -> Any:
+        return self.connection().cursor()
+    
+    def __enter__(self) -> 'UnitOfWork':
+        return self
+    
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> bool:
+        if self.conn is None:
+            return False
+        
+        import psycopg2
+        
+        pool = get_pool(self.dsn)
+        broken = isinstance(exc, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            elif not broken and not self.conn.closed:
+                self.conn.rollback()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            if exc_type is None:
+                raise
+        finally:
+            pool.putconn(self.conn, broken)
+            self.conn = None
+        return False
+
+
+def pool_summary(dsn: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    '''Счетчики пула DATABASE_URL (или переданного DSN); None, если в контейнере пул еще не создавался'''
+    pool = _pools.get(dsn if dsn is not None else os.environ.get('DATABASE_URL', ''))
+    return pool.summary() if pool is not None else None
+
+
+def unit_of_work(dsn: Optional[str] = None) -> UnitOfWork:
+    '''UnitOfWork для DATABASE_URL (или переданного DSN)'''
+    return UnitOfWork(dsn if dsn is not None else os.environ.get('DATABASE_URL', ''))
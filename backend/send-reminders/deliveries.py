@@ -0,0 +1,172 @@
+'''
+Журнал доставки напоминаний (reminder_deliveries). Срабатывание захватывается вместе с переносом
+next_fire_at одним запросом и сразу пишется в журнал под PK (reminder_id, fire_at): параллельный
+или повторный запуск cron его не получит. Если отправитель упал до записи итога, аренда
+claimed_until истечет и срабатывание заберет следующий запуск. Разовые срабатывания из очереди
+reminder_snoozes (кнопка «Напомнить позже») идут в журнал тем же запросом, что и регулярные.
+'''
+import os
+from typing import Any, List, Tuple
+
+# Сколько секунд захваченное срабатывание принадлежит отправителю
+LEASE_SECONDS = int(os.environ.get('REMINDERS_LEASE', '120'))
+
+# После стольких попыток временная ошибка (сеть, 429, 5xx) становится failed
+MAX_ATTEMPTS = int(os.environ.get('REMINDERS_MAX_ATTEMPTS', '5'))
+
+# Сколько дней хранятся завершенные записи журнала
+RETENTION_DAYS = int(os.environ.get('REMINDERS_LOG_RETENTION_DAYS', '30'))
+
+# Сколько старых записей удаляется за запуск, чтобы журнал не рос без отдельного cron
+CLEANUP_BATCH = 1000
+
+# Наступившие срабатывания за один проход: диапазон по idx_reminders_next_fire с переносом на следующее
+# срабатывание и диапазон по idx_reminder_snoozes_fire_at разовой очереди (строки удаляются), затем запись
+# в журнал - один запрос. Строки, занятые другим запуском, пропускаются (SKIP LOCKED).
+# Фильтр шарда проверяется на строках диапазона; при shard_count = 1 он сворачивается в TRUE
+CLAIM_DUE_QUERY = '''
+    WITH due AS (
+        SELECT id, next_fire_at
+        FROM reminders
+        WHERE is_active = TRUE AND next_fire_at <= now()
+          AND (%(shard_count)s = 1 OR reminder_shard(user_id, %(shard_count)s) = %(shard_index)s)
+        ORDER BY next_fire_at
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    ),
+    snoozed AS (
+        SELECT s.id
+        FROM reminder_snoozes s
+        JOIN reminders r ON r.id = s.reminder_id
+        WHERE s.fire_at <= now() AND r.is_active = TRUE
+          AND (%(shard_count)s = 1 OR reminder_shard(s.user_id, %(shard_count)s) = %(shard_index)s)
+        ORDER BY s.fire_at
+        LIMIT %(limit)s
+        FOR UPDATE OF s SKIP LOCKED
+    ),
+    advanced AS (
+        UPDATE reminders r
+        SET next_fire_at = reminder_next_fire(r.reminder_time, r.days_of_week, now(), r.time_zone)
+        FROM due
+        WHERE r.id = due.id
+        RETURNING r.id, r.user_id, r.title, r.description, due.next_fire_at AS fire_at
+    ),
+    drained AS (
+        DELETE FROM reminder_snoozes s
+        USING snoozed, reminders r
+        WHERE s.id = snoozed.id AND r.id = s.reminder_id
+        RETURNING s.reminder_id AS id, s.user_id, r.title, r.description, s.fire_at
+    ),
+    fired AS (
+        SELECT * FROM advanced
+        UNION ALL
+        SELECT * FROM drained
+    ),
+    logged AS (
+        INSERT INTO reminder_deliveries (reminder_id, fire_at, user_id, attempts, claimed_until)
+        SELECT id, fire_at, user_id, 1, now() + make_interval(secs => %(lease)s)
+        FROM fired
+        ON CONFLICT (reminder_id, fire_at) DO NOTHING
+        RETURNING reminder_id, fire_at, attempts
+    )
+    SELECT l.reminder_id, f.user_id, f.title, f.description, l.fire_at, l.attempts
+    FROM logged l
+    JOIN fired f ON f.id = l.reminder_id AND f.fire_at = l.fire_at
+'''
+
+# Срабатывания, ждущие повтора или брошенные упавшим отправителем
+RECLAIM_QUERY = '''
+    WITH stale AS (
+        SELECT d.reminder_id, d.fire_at
+        FROM reminder_deliveries d
+        JOIN reminders r ON r.id = d.reminder_id
+        WHERE d.status = 'pending' AND d.claimed_until <= now() AND r.is_active = TRUE
+          AND (%s = 1 OR reminder_shard(d.user_id, %s) = %s)
+        ORDER BY d.claimed_until
+        LIMIT %s
+        FOR UPDATE OF d SKIP LOCKED
+    ),
+    claimed AS (
+        UPDATE reminder_deliveries d
+        SET attempts = d.attempts + 1, claimed_until = now() + make_interval(secs => %s)
+        FROM stale
+        WHERE d.reminder_id = stale.reminder_id AND d.fire_at = stale.fire_at
+        RETURNING d.reminder_id, d.fire_at, d.attempts
+    )
+    SELECT c.reminder_id, r.user_id, r.title, r.description, c.fire_at, c.attempts
+    FROM claimed c
+    JOIN reminders r ON r.id = c.reminder_id
+'''
+
+# Итоги пачки одним запросом на страницу execute_values, а не UPDATE на строку
+RECORD_QUERY = '''
+    UPDATE reminder_deliveries d
+    SET status = v.status,
+        last_error = v.last_error,
+        sent_at = CASE WHEN v.status = 'sent' THEN now() END,
+        claimed_until = now() + make_interval(secs => v.retry_in)
+    FROM (VALUES %s) AS v(reminder_id, fire_at, status, last_error, retry_in)
+    WHERE d.reminder_id = v.reminder_id AND d.fire_at = v.fire_at
+'''
+
+RECORD_TEMPLATE = '(%s, %s::timestamptz, %s, %s, %s)'
+
+
+def claim(cur, limit: int, shard: Tuple[int, int] = (0, 1)) -> List[Tuple]:
+    '''
+    Захватить срабатывания шарда (shard_index, shard_count): сначала ждущие повтора, затем наступившие -
+    до limit регулярных и до limit разовых. Строки - (reminder_id, user_id, title, description, fire_at, attempts)
+    '''
+    cur.execute(RECLAIM_QUERY, (shard[1], shard[1], shard[0], limit, LEASE_SECONDS))
+    claimed = cur.fetchall()
+    if len(claimed) < limit:
+        cur.execute(CLAIM_DUE_QUERY, {'shard_count': shard[1], 'shard_index': shard[0],
+                                      'limit': limit - len(claimed), 'lease': LEASE_SECONDS})
+        claimed.extend(cur.fetchall())
+    return claimed
+
+
+def record(cur, outcomes: List[Tuple[int, Any, str, Any, int]]):
+    '''Записать итоги пачки: (reminder_id, fire_at, status, last_error, retry_in)'''
+    from psycopg2.extras import execute_values
+    
+    if outcomes:
+        execute_values(cur, RECORD_QUERY, outcomes, template=RECORD_TEMPLATE, page_size=500)
+
+
+def cleanup(cur):
+    '''
+    Удалить завершенные записи старше RETENTION_DAYS, а также ждущие повтора доставки и отложенные
+    срабатывания выключенных напоминаний (каждого вида не больше CLEANUP_BATCH за раз).
+    Строки удаленных напоминаний убирает ON DELETE CASCADE
+    '''
+    cur.execute(
+        '''DELETE FROM reminder_deliveries WHERE (reminder_id, fire_at) IN (
+               SELECT reminder_id, fire_at FROM reminder_deliveries
+               WHERE status <> 'pending' AND created_at < now() - make_interval(days => %s)
+               LIMIT %s
+               FOR UPDATE SKIP LOCKED
+           )''',
+        (RETENTION_DAYS, CLEANUP_BATCH)
+    )
+    # Выключенное напоминание не повторяется: брошенную или ждущую повтора доставку забирать некому
+    cur.execute(
+        '''DELETE FROM reminder_deliveries WHERE (reminder_id, fire_at) IN (
+               SELECT d.reminder_id, d.fire_at FROM reminder_deliveries d
+               JOIN reminders r ON r.id = d.reminder_id
+               WHERE d.status = 'pending' AND d.claimed_until <= now() AND r.is_active = FALSE
+               LIMIT %s
+               FOR UPDATE OF d SKIP LOCKED
+           )''',
+        (CLEANUP_BATCH,)
+    )
+    cur.execute(
+        '''DELETE FROM reminder_snoozes WHERE id IN (
+               SELECT s.id FROM reminder_snoozes s
+               JOIN reminders r ON r.id = s.reminder_id
+               WHERE r.is_active = FALSE
+               LIMIT %s
+               FOR UPDATE OF s SKIP LOCKED
+           )''',
+        (CLEANUP_BATCH,)
+    )
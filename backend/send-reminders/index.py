@@ -1,16 +1,38 @@
 import json
 import os
-from typing import Dict, Any
-import psycopg2
-from datetime import datetime
-import requests
+import time
+from typing import Dict, Any, List, Tuple
+from datetime import datetime, timedelta, timezone
+from telegram_client import GLOBAL_RATE, TelegramClient, TelegramError, get_client
+from db_pool import unit_of_work
+from deliveries import MAX_ATTEMPTS, claim, record, cleanup
+from shards import LOCK_SECONDS, SHARD_COUNT, ShardError, acquire, fan_out, parse_shard, release, renew
+
+# Сколько срабатываний забирается одним запросом
+DUE_BATCH = int(os.environ.get('REMINDERS_BATCH', '500'))
+
+# Сколько сообщений отправляется одновременно. Темп задают ведра telegram_client (TELEGRAM_GLOBAL_RATE ~30/с
+# на бота и TELEGRAM_PER_CHAT_RATE на чат), потоки лишь прячут задержку сети: 30/с при ответе за 250 мс - 8 потоков
+SEND_CONCURRENCY = max(1, int(os.environ.get('REMINDERS_CONCURRENCY', '8')))
+
+# Запас до конца cron-интервала: новые пачки после него не забираются и дождутся следующего запуска
+TIME_BUDGET_SECONDS = float(os.environ.get('REMINDERS_TIME_BUDGET', '50'))
+
+# Срабатывание, опоздавшее сильнее (cron не работал), не отправляется, а помечается skipped
+MAX_LATE_SECONDS = int(os.environ.get('REMINDERS_MAX_LATE', '3600'))
+
+# Статус в журнале доставки -> счетчик в ответе
+OUTCOME_COUNTERS = {'sent': 'sent', 'failed': 'failed', 'pending': 'retry', 'skipped': 'skipped_late'}
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Send scheduled reminders to users via Telegram
-    Args: event - cron trigger or manual call
+    Business: Send due reminders (next_fire_at <= now), snoozed one-offs and pending retries via Telegram,
+              logging each firing once in reminder_deliveries so overlapping cron runs never send it twice.
+              With ?shard_index=&shard_count= handles only that shard's users; without them and
+              REMINDERS_SHARDS > 1 fans out one call per shard
+    Args: event - cron trigger or manual call, queryStringParameters shard_index/shard_count for a shard worker
           context - cloud function context
-    Returns: HTTP response with sent reminders count
+    Returns: HTTP response with sent/failed/retry/throttled counts and wall time
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -26,62 +48,102 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': ''
         }
     
+    if method not in ('GET', 'POST'):
+        return {
+            'statusCode': 405,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Method not allowed'})
+        }
+    
     try:
         db_url = os.environ.get('DATABASE_URL', '')
         telegram_token = os.environ.get('TELEGRAM_BOT_TOKEN', '')
         
-        conn = psycopg2.connect(db_url)
-        cur = conn.cursor()
-        
         now = datetime.now()
         current_time = now.strftime('%H:%M')
         current_day = now.isoweekday()
         
-        cur.execute('''
-            SELECT id, user_id, title, description, reminder_time
-            FROM reminders
-            WHERE is_active = TRUE
-              AND reminder_time::text = %s
-              AND %s = ANY(days_of_week)
-        ''', (current_time, current_day))
+        started = time.monotonic()
+        shard = parse_shard(event.get('queryStringParameters') or {})
+        if shard is None and SHARD_COUNT > 1:
+            # Координатор: сам ничего не отправляет, шарды работают в своих экземплярах функции
+            result = fan_out(SHARD_COUNT, TIME_BUDGET_SECONDS + LOCK_SECONDS)
+            result.update(shard_count=SHARD_COUNT, elapsed_ms=round((time.monotonic() - started) * 1000, 1),
+                          current_time=current_time, current_day=current_day)
+            print(f"Reminders coordinator: {SHARD_COUNT} shards sent={result['sent_count']} "
+                  f"busy={result['busy_shards']} success={result['success']}")
+            return json_response(200, result)
+        shard = shard or (0, 1)
+        owner = getattr(context, 'request_id', None) or os.urandom(16).hex()
         
-        reminders = cur.fetchall()
-        sent_count = 0
+        with unit_of_work(db_url) as db:
+            cur = db.cursor()
+            locked = acquire(cur, shard, owner)
+            cur.close()
         
-        for reminder in reminders:
-            rid, user_id, title, description, rem_time = reminder
-            
-            text = f'🔔 *Напоминание*\n\n{title}'
-            if description:
-                text += f'\n\n_{description}_'
-            
-            keyboard = {
-                'inline_keyboard': [
-                    [{'text': '✅ Готово', 'callback_data': f'done_{rid}'}],
-                    [{'text': '⏰ Напомнить позже', 'callback_data': f'snooze_{rid}'}]
-                ]
-            }
-            
-            send_message(user_id, text, telegram_token, keyboard)
-            sent_count += 1
+        if not locked:
+            print(f'Reminders shard {shard[0]}/{shard[1]} is busy, skipping')
+            return json_response(200, {'success': True, 'busy': True, 'shard': f'{shard[0]}/{shard[1]}',
+                                       'current_time': current_time, 'current_day': current_day})
         
-        cur.close()
-        conn.close()
+        client = get_shard_client(telegram_token, shard)
+        client_before = dict(client.stats)
+        counts = {'sent': 0, 'failed': 0, 'retry': 0, 'skipped_late': 0}
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({
-                'success': True,
-                'sent_count': sent_count,
-                'current_time': current_time,
-                'current_day': current_day
-            })
-        }
+        # Пачка захватывается и коммитится до отправки, итоги пишутся следующей короткой транзакцией;
+        # соединение на время отправки возвращается в пул. Новые пачки - только пока есть бюджет времени
+        try:
+            while time.monotonic() - started < TIME_BUDGET_SECONDS:
+                with unit_of_work(db_url) as db:
+                    cur = db.cursor()
+                    # Аренда истекла (вызов завис дольше LOCK_SECONDS) - шард уже у другого вызова
+                    batch = claim(cur, DUE_BATCH, shard) if renew(cur, shard, owner) else []
+                    cur.close()
+                
+                if not batch:
+                    break
+                
+                outcomes = send_all(client, batch)
+                for outcome in outcomes:
+                    counts[OUTCOME_COUNTERS[outcome[2]]] += 1
+                
+                with unit_of_work(db_url) as db:
+                    cur = db.cursor()
+                    record(cur, outcomes)
+                    cur.close()
+                
+                if len(batch) < DUE_BATCH:
+                    break
+        finally:
+            with unit_of_work(db_url) as db:
+                cur = db.cursor()
+                release(cur, shard, owner)
+                cleanup(cur)
+                cur.close()
         
+        elapsed = time.monotonic() - started
+        throttled = client.stats['throttled'] - client_before['throttled']
+        rate_limited = client.stats['rate_limited'] - client_before['rate_limited']
+        print(f"Reminders shard {shard[0]}/{shard[1]}: sent={counts['sent']} failed={counts['failed']} retry={counts['retry']} "
+              f"skipped_late={counts['skipped_late']} throttled={throttled} rate_limited={rate_limited} in {elapsed:.2f} s")
+        
+        return json_response(200, {
+            'success': True,
+            'shard': f'{shard[0]}/{shard[1]}',
+            'sent_count': counts['sent'],
+            'failed_count': counts['failed'],
+            'retry_count': counts['retry'],
+            'skipped_late': counts['skipped_late'],
+            'throttled_count': throttled,
+            'rate_limited_count': rate_limited,
+            'elapsed_ms': round(elapsed * 1000, 1),
+            'current_time': current_time,
+            'current_day': current_day
+        })
+    
+    except ShardError as e:
+        return json_response(e.status, {'success': False, 'error': str(e)})
+    
     except Exception as e:
         return {
             'statusCode': 500,
@@ -96,21 +158,79 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
 
-def send_message(chat_id: int, text: str, token: str, keyboard: Dict = None):
-    '''Отправить сообщение в Telegram'''
-    url = f'https://api.telegram.org/bot{token}/sendMessage'
-    
-    data = {
-        'chat_id': chat_id,
-        'text': text,
-        'parse_mode': 'Markdown'
+_shard_clients: Dict[Tuple[str, int, int], TelegramClient] = {}
+
+
+def get_shard_client(token: str, shard: Tuple[int, int]) -> TelegramClient:
+    '''
+    Клиент Bot API шарда. Лимит ~30 сообщений в секунду - на бота, а шарды работают в разных
+    экземплярах со своими ведрами, поэтому каждому достается 1/shard_count общего темпа.
+    Ведро чата делить не нужно: пользователь всегда в одном шарде
+    '''
+    if shard[1] == 1:
+        return get_client(token)
+    client = _shard_clients.get((token,) + shard)
+    if client is None:
+        client = TelegramClient(token, global_rate=GLOBAL_RATE / shard[1])
+        _shard_clients[(token,) + shard] = client
+    return client
+
+
+def json_response(status: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json'
+        },
+        'body': json.dumps(payload)
     }
+
+
+def send_all(client: Any, claimed: List[Tuple]) -> List[Tuple[int, Any, str, Any, int]]:
+    '''Разослать пачку параллельно в SEND_CONCURRENCY потоков; итоги - строки для deliveries.record'''
+    late_before = datetime.now(timezone.utc) - timedelta(seconds=MAX_LATE_SECONDS)
     
-    if keyboard:
-        data['reply_markup'] = json.dumps(keyboard)
+    workers = min(SEND_CONCURRENCY, len(claimed))
+    if workers <= 1:
+        return [send_reminder(client, row, late_before) for row in claimed]
+    
+    from concurrent.futures import ThreadPoolExecutor
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda row: send_reminder(client, row, late_before), claimed))
+
+
+def send_reminder(client: Any, row: Tuple, late_before: datetime) -> Tuple[int, Any, str, Any, int]:
+    '''
+    Отправить одно срабатывание с кнопками Готово/Позже; ошибка Bot API не прерывает рассылку.
+    Итог - (reminder_id, fire_at, status, last_error, retry_in)
+    '''
+    rid, user_id, title, description, fire_at, attempts = row
+    
+    if fire_at < late_before:
+        return rid, fire_at, 'skipped', f'late by {int((datetime.now(timezone.utc) - fire_at).total_seconds())} s', 0
+    
+    text = f'🔔 *Напоминание*\n\n{title}'
+    if description:
+        text += f'\n\n_{description}_'
+    
+    # Время срабатывания в кнопках: telegram-bot отметит «Готово» и отложит именно это срабатывание
+    fired = int(fire_at.timestamp())
+    keyboard = {
+        'inline_keyboard': [
+            [{'text': '✅ Готово', 'callback_data': f'done_{rid}_{fired}'}],
+            [{'text': '⏰ Напомнить позже', 'callback_data': f'snooze_{rid}_{fired}'}]
+        ]
+    }
     
     try:
-        response = requests.post(url, json=data)
-        return response.status_code == 200
-    except Exception:
-        return False
+        client.send_message(user_id, text, keyboard)
+        return rid, fire_at, 'sent', None, 0
+    except TelegramError as e:
+        # Сеть, 429 и 5xx могут пройти позже; 400/403 (чат не найден, бот заблокирован) - нет
+        retryable = e.status == 0 or e.status == 429 or e.status >= 500
+        if retryable and attempts < MAX_ATTEMPTS:
+            return rid, fire_at, 'pending', str(e), int(e.retry_after or min(30 * 2 ** (attempts - 1), 600))
+        print(f'Failed to send reminder {rid} to {user_id} after {attempts} attempts: {e}')
+        return rid, fire_at, 'failed', str(e), 0
@@ -0,0 +1,102 @@
+'''
+Шардирование send-reminders. Вызов ?shard_index=i&shard_count=n обрабатывает только пользователей
+с reminder_shard(user_id, n) = i (V0015) и держит аренду шарда в reminder_shard_locks, чтобы второй
+вызов того же шарда не работал параллельно. Координатор (вызов без параметров при REMINDERS_SHARDS > 1)
+рассылает по вызову на шард на REMINDERS_SELF_URL и складывает их ответы.
+'''
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+# Сколько шардов запускает координатор; 1 - функция обрабатывает всех сама, как раньше
+SHARD_COUNT = max(1, int(os.environ.get('REMINDERS_SHARDS', '1')))
+
+# Адрес этой же функции, на который координатор шлет вызовы шардов
+SELF_URL = os.environ.get('REMINDERS_SELF_URL', 'https://functions.poehali.dev/f3174375-4263-4d4b-ad83-4a5d72c5ee1f')
+
+# Аренда шарда продлевается на каждой пачке; упавший вызов отпускает шард через столько секунд
+LOCK_SECONDS = int(os.environ.get('REMINDERS_SHARD_LOCK', '120'))
+
+# Счетчики ответа шарда, которые координатор складывает
+SUMMED_COUNTS = ('sent_count', 'failed_count', 'retry_count', 'skipped_late', 'throttled_count', 'rate_limited_count')
+
+
+class ShardError(Exception):
+    '''Неверные параметры шарда: HTTP-статус ответа в status'''
+    
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_shard(params: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    '''(shard_index, shard_count) из query-параметров; None, если вызов не шардовый'''
+    if 'shard_index' not in params and 'shard_count' not in params:
+        return None
+    try:
+        index = int(params.get('shard_index', ''))
+        count = int(params.get('shard_count', ''))
+    except ValueError:
+        raise ShardError(400, 'shard_index and shard_count must be integers')
+    if count < 1 or not 0 <= index < count:
+        raise ShardError(400, f'shard_index must be in 0..shard_count-1, got {index}/{count}')
+    return index, count
+
+
+def acquire(cur, shard: Tuple[int, int], owner: str) -> bool:
+    '''Взять аренду шарда; False - шард держит другой вызов'''
+    cur.execute(
+        '''INSERT INTO reminder_shard_locks (shard_count, shard_index, owner, locked_until)
+           VALUES (%s, %s, %s, now() + make_interval(secs => %s))
+           ON CONFLICT (shard_count, shard_index) DO UPDATE
+           SET owner = EXCLUDED.owner, locked_until = EXCLUDED.locked_until
+           WHERE reminder_shard_locks.locked_until <= now() OR reminder_shard_locks.owner = EXCLUDED.owner
+           RETURNING owner''',
+        (shard[1], shard[0], owner, LOCK_SECONDS)
+    )
+    return cur.fetchone() is not None
+
+
+def renew(cur, shard: Tuple[int, int], owner: str) -> bool:
+    '''Продлить аренду перед пачкой; False - аренда истекла и шард уже забрал другой вызов'''
+    cur.execute(
+        '''UPDATE reminder_shard_locks SET locked_until = now() + make_interval(secs => %s)
+           WHERE shard_count = %s AND shard_index = %s AND owner = %s
+           RETURNING owner''',
+        (LOCK_SECONDS, shard[1], shard[0], owner)
+    )
+    return cur.fetchone() is not None
+
+
+def release(cur, shard: Tuple[int, int], owner: str):
+    cur.execute(
+        '''UPDATE reminder_shard_locks SET locked_until = now()
+           WHERE shard_count = %s AND shard_index = %s AND owner = %s''',
+        (shard[1], shard[0], owner)
+    )
+
+
+def fan_out(shard_count: int, timeout: float) -> Dict[str, Any]:
+    '''Вызвать шарды 0..shard_count-1 параллельно и сложить счетчики их ответов'''
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+    
+    def call(index: int) -> Dict[str, Any]:
+        try:
+            response = requests.get(SELF_URL, params={'shard_index': index, 'shard_count': shard_count},
+                                    timeout=(5, timeout))
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            return {'shard_index': index, 'success': False, 'error': str(e)}
+        body['shard_index'] = index
+        if response.status_code != 200:
+            body['success'] = False
+        return body
+    
+    with ThreadPoolExecutor(max_workers=shard_count) as pool:
+        shards: List[Dict[str, Any]] = list(pool.map(call, range(shard_count)))
+    
+    totals = {key: sum(shard.get(key, 0) for shard in shards) for key in SUMMED_COUNTS}
+    totals['success'] = all(shard.get('success') for shard in shards)
+    totals['busy_shards'] = [shard['shard_index'] for shard in shards if shard.get('busy')]
+    totals['shards'] = shards
+    return totals
@@ -1,8 +1,33 @@
 import json
 import os
-from typing import Dict, Any, List
-import psycopg2
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, time
+from db_pool import unit_of_work, UnitOfWork
+from telegram_client import get_client, TelegramError
+
+# На сколько минут кнопка «Напомнить позже» откладывает напоминание
+SNOOZE_MINUTES = int(os.environ.get('REMINDERS_SNOOZE_MINUTES', '15'))
+
+
+class Replies:
+    '''Ответы на update: копятся, пока идет транзакция, и отправляются в Telegram после commit'''
+    
+    def __init__(self):
+        self.calls: List[Tuple[str, tuple]] = []
+    
+    def message(self, chat_id: int, text: str, keyboard: Dict = None):
+        self.calls.append(('message', (chat_id, text, keyboard)))
+    
+    def answer(self, callback_id: str, text: Optional[str] = None):
+        self.calls.append(('answer', (callback_id, text)))
+    
+    def send(self, token: str):
+        for kind, args in self.calls:
+            if kind == 'answer':
+                answer_callback(args[0], token, args[1])
+            else:
+                send_message(args[0], args[1], token, args[2])
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -39,24 +64,31 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {'statusCode': 200, 'body': json.dumps({'ok': True})}
         
         telegram_token = os.environ.get('TELEGRAM_BOT_TOKEN', '')
-        db_url = os.environ.get('DATABASE_URL', '')
         
-        if 'callback_query' in body_data:
-            return handle_callback_query(body_data['callback_query'], telegram_token, db_url)
+        replies = Replies()
         
-        message = body_data.get('message', {})
-        chat_id = message.get('chat', {}).get('id')
-        text = message.get('text', '')
-        user_id = message.get('from', {}).get('id')
+        # Один update - одно соединение из пула и одна транзакция (соединение берется только если нужно)
+        with unit_of_work() as db:
+            if 'callback_query' in body_data:
+                handle_callback_query(body_data['callback_query'], replies, db)
+            else:
+                message = body_data.get('message', {})
+                chat_id = message.get('chat', {}).get('id')
+                text = message.get('text', '')
+                user_id = message.get('from', {}).get('id')
+                
+                if text.startswith('/start'):
+                    send_main_menu(chat_id, replies)
+                elif text.startswith('/menu'):
+                    send_main_menu(chat_id, replies)
+                elif text.startswith('/reminders'):
+                    show_reminders_list(chat_id, user_id, replies, db)
+                else:
+                    replies.message(chat_id, 'Используй /menu для вызова главного меню')
         
-        if text.startswith('/start'):
-            send_main_menu(chat_id, telegram_token)
-        elif text.startswith('/menu'):
-            send_main_menu(chat_id, telegram_token)
-        elif text.startswith('/reminders'):
-            show_reminders_list(chat_id, user_id, telegram_token, db_url)
-        else:
-            send_message(chat_id, 'Используй /menu для вызова главного меню', telegram_token)
+        # Ответы уходят после commit: блокировки строк не держатся на время запросов к Bot API,
+        # а «удалено» не придет, если транзакция откатилась
+        replies.send(telegram_token)
         
         return {
             'statusCode': 200,
@@ -72,7 +104,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
 
-def send_main_menu(chat_id: int, token: str):
+def send_main_menu(chat_id: int, replies: Replies):
     '''Отправка главного меню с кнопками'''
     keyboard = {
         'inline_keyboard': [
@@ -82,18 +114,16 @@ def send_main_menu(chat_id: int, token: str):
         ]
     }
     
-    send_message(
+    replies.message(
         chat_id,
         '🤖 *Главное меню*\n\nВыбери действие:',
-        token,
         keyboard
     )
 
 
-def show_reminders_list(chat_id: int, user_id: int, token: str, db_url: str):
+def show_reminders_list(chat_id: int, user_id: int, replies: Replies, db: UnitOfWork):
     '''Показать список всех напоминаний пользователя'''
-    conn = psycopg2.connect(db_url)
-    cur = conn.cursor()
+    cur = db.cursor()
     
     cur.execute('''
         SELECT id, title, reminder_time, days_of_week, is_active 
@@ -104,7 +134,6 @@ def show_reminders_list(chat_id: int, user_id: int, token: str, db_url: str):
     
     reminders = cur.fetchall()
     cur.close()
-    conn.close()
     
     if not reminders:
         keyboard = {
@@ -113,7 +142,7 @@ def show_reminders_list(chat_id: int, user_id: int, token: str, db_url: str):
                 [{'text': '« Назад', 'callback_data': 'main_menu'}]
             ]
         }
-        send_message(chat_id, '📋 У тебя пока нет напоминаний', token, keyboard)
+        replies.message(chat_id, '📋 У тебя пока нет напоминаний', keyboard)
         return
     
     days_names = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
@@ -139,26 +168,30 @@ def show_reminders_list(chat_id: int, user_id: int, token: str, db_url: str):
     keyboard_buttons.append([{'text': '« Назад', 'callback_data': 'main_menu'}])
     
     keyboard = {'inline_keyboard': keyboard_buttons}
-    send_message(chat_id, text, token, keyboard)
+    replies.message(chat_id, text, keyboard)
 
 
-def handle_callback_query(callback: Dict, token: str, db_url: str) -> Dict[str, Any]:
+def handle_callback_query(callback: Dict, replies: Replies, db: UnitOfWork):
     '''Обработка нажатий на кнопки'''
     callback_id = callback.get('id')
     chat_id = callback.get('message', {}).get('chat', {}).get('id')
     user_id = callback.get('from', {}).get('id')
     data = callback.get('data', '')
     
-    answer_callback(callback_id, token)
+    # Кнопки под присланным напоминанием отвечают всплывающим текстом вместо нового сообщения
+    if data.startswith('done_') or data.startswith('snooze_'):
+        replies.answer(callback_id, handle_reminder_button(data, user_id, callback.get('message', {}), db))
+    else:
+        replies.answer(callback_id)
     
     if data == 'main_menu':
-        send_main_menu(chat_id, token)
+        send_main_menu(chat_id, replies)
     
     elif data == 'list_reminders':
-        show_reminders_list(chat_id, user_id, token, db_url)
+        show_reminders_list(chat_id, user_id, replies, db)
     
     elif data == 'create_reminder':
-        show_create_reminder_templates(chat_id, token)
+        show_create_reminder_templates(chat_id, replies)
     
     elif data == 'about':
         text = (
@@ -170,41 +203,35 @@ def handle_callback_query(callback: Dict, token: str, db_url: str) -> Dict[str,
             'Создавай напоминания и получай их в нужное время!'
         )
         keyboard = {'inline_keyboard': [[{'text': '« Назад', 'callback_data': 'main_menu'}]]}
-        send_message(chat_id, text, token, keyboard)
+        replies.message(chat_id, text, keyboard)
     
     elif data.startswith('template_'):
         template_name = data.replace('template_', '')
-        create_reminder_from_template(chat_id, user_id, template_name, token, db_url)
+        create_reminder_from_template(chat_id, user_id, template_name, replies, db)
     
     elif data.startswith('edit_reminder_'):
         reminder_id = int(data.replace('edit_reminder_', ''))
-        show_reminder_editor(chat_id, reminder_id, token, db_url)
+        show_reminder_editor(chat_id, reminder_id, replies, db)
     
     elif data.startswith('toggle_'):
         reminder_id = int(data.replace('toggle_', ''))
-        toggle_reminder(reminder_id, db_url)
-        show_reminder_editor(chat_id, reminder_id, token, db_url)
+        toggle_reminder(reminder_id, db)
+        show_reminder_editor(chat_id, reminder_id, replies, db)
     
     elif data.startswith('delete_'):
         reminder_id = int(data.replace('delete_', ''))
-        delete_reminder(reminder_id, db_url)
-        send_message(chat_id, '✅ Напоминание удалено', token)
-        show_reminders_list(chat_id, user_id, token, db_url)
+        delete_reminder(reminder_id, db)
+        replies.message(chat_id, '✅ Напоминание удалено')
+        show_reminders_list(chat_id, user_id, replies, db)
     
     elif data.startswith('duplicate_'):
         reminder_id = int(data.replace('duplicate_', ''))
-        duplicate_reminder(reminder_id, db_url)
-        send_message(chat_id, '✅ Напоминание продублировано', token)
-        show_reminders_list(chat_id, user_id, token, db_url)
-    
-    return {
-        'statusCode': 200,
-        'headers': {'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'ok': True})
-    }
+        duplicate_reminder(reminder_id, db)
+        replies.message(chat_id, '✅ Напоминание продублировано')
+        show_reminders_list(chat_id, user_id, replies, db)
 
 
-def show_create_reminder_templates(chat_id: int, token: str):
+def show_create_reminder_templates(chat_id: int, replies: Replies):
     '''Показать шаблоны для быстрого создания напоминаний'''
     keyboard = {
         'inline_keyboard': [
@@ -218,15 +245,14 @@ def show_create_reminder_templates(chat_id: int, token: str):
         ]
     }
     
-    send_message(
+    replies.message(
         chat_id,
         '➕ *Создать напоминание*\n\nВыбери шаблон или создай свое:',
-        token,
         keyboard
     )
 
 
-def create_reminder_from_template(chat_id: int, user_id: int, template: str, token: str, db_url: str):
+def create_reminder_from_template(chat_id: int, user_id: int, template: str, replies: Replies, db: UnitOfWork):
     '''Создать напоминание из шаблона'''
     templates = {
         'water': ('💧 Попей воды', 'Выпей стакан воды для здоровья', '10:00'),
@@ -242,8 +268,7 @@ def create_reminder_from_template(chat_id: int, user_id: int, template: str, tok
     
     title, description, default_time = templates[template]
     
-    conn = psycopg2.connect(db_url)
-    cur = conn.cursor()
+    cur = db.cursor()
     
     cur.execute('''
         INSERT INTO reminders (user_id, title, description, reminder_time, days_of_week, is_active)
@@ -252,18 +277,15 @@ def create_reminder_from_template(chat_id: int, user_id: int, template: str, tok
     ''', (user_id, title, description, default_time, [1,2,3,4,5,6,7], True))
     
     reminder_id = cur.fetchone()[0]
-    conn.commit()
     cur.close()
-    conn.close()
     
-    send_message(chat_id, f'✅ Напоминание "{title}" создано на {default_time} каждый день', token)
-    show_reminder_editor(chat_id, reminder_id, token, db_url)
+    replies.message(chat_id, f'✅ Напоминание "{title}" создано на {default_time} каждый день')
+    show_reminder_editor(chat_id, reminder_id, replies, db)
 
 
-def show_reminder_editor(chat_id: int, reminder_id: int, token: str, db_url: str):
+def show_reminder_editor(chat_id: int, reminder_id: int, replies: Replies, db: UnitOfWork):
     '''Показать редактор напоминания'''
-    conn = psycopg2.connect(db_url)
-    cur = conn.cursor()
+    cur = db.cursor()
     
     cur.execute('''
         SELECT title, description, reminder_time, days_of_week, is_active 
@@ -273,10 +295,9 @@ def show_reminder_editor(chat_id: int, reminder_id: int, token: str, db_url: str
     
     result = cur.fetchone()
     cur.close()
-    conn.close()
     
     if not result:
-        send_message(chat_id, '❌ Напоминание не найдено', token)
+        replies.message(chat_id, '❌ Напоминание не найдено')
         return
     
     title, description, rem_time, days, is_active = result
@@ -305,13 +326,12 @@ def show_reminder_editor(chat_id: int, reminder_id: int, token: str, db_url: str
         ]
     }
     
-    send_message(chat_id, text, token, keyboard)
+    replies.message(chat_id, text, keyboard)
 
 
-def toggle_reminder(reminder_id: int, db_url: str):
+def toggle_reminder(reminder_id: int, db: UnitOfWork):
     '''Переключить активность напоминания'''
-    conn = psycopg2.connect(db_url)
-    cur = conn.cursor()
+    cur = db.cursor()
     
     cur.execute('''
         UPDATE reminders 
@@ -319,27 +339,21 @@ def toggle_reminder(reminder_id: int, db_url: str):
         WHERE id = %s
     ''', (reminder_id,))
     
-    conn.commit()
     cur.close()
-    conn.close()
 
 
-def delete_reminder(reminder_id: int, db_url: str):
+def delete_reminder(reminder_id: int, db: UnitOfWork):
     '''Удалить напоминание'''
-    conn = psycopg2.connect(db_url)
-    cur = conn.cursor()
+    cur = db.cursor()
     
     cur.execute('DELETE FROM reminders WHERE id = %s', (reminder_id,))
     
-    conn.commit()
     cur.close()
-    conn.close()
 
 
-def duplicate_reminder(reminder_id: int, db_url: str):
+def duplicate_reminder(reminder_id: int, db: UnitOfWork):
     '''Дублировать напоминание'''
-    conn = psycopg2.connect(db_url)
-    cur = conn.cursor()
+    cur = db.cursor()
     
     cur.execute('''
         INSERT INTO reminders (user_id, title, description, reminder_time, days_of_week, is_active)
@@ -348,32 +362,68 @@ def duplicate_reminder(reminder_id: int, db_url: str):
         WHERE id = %s
     ''', (reminder_id,))
     
-    conn.commit()
     cur.close()
-    conn.close()
 
 
-def send_message(chat_id: int, text: str, token: str, keyboard: Dict = None):
-    '''Отправить сообщение в Telegram'''
-    import requests
-    
-    url = f'https://api.telegram.org/bot{token}/sendMessage'
-    
-    data = {
-        'chat_id': chat_id,
-        'text': text,
-        'parse_mode': 'Markdown'
-    }
+def handle_reminder_button(data: str, user_id: int, message: Dict, db: UnitOfWork) -> str:
+    '''Готово/Позже под напоминанием: done_{id}_{время срабатывания} или snooze_{id}_{время срабатывания}'''
+    action, _, rest = data.partition('_')
+    parts = rest.split('_')
+    reminder_id = int(parts[0])
+    # У кнопок, отправленных до журнала доставки, времени срабатывания нет - берется время сообщения
+    fired = int(parts[1]) if len(parts) > 1 else message.get('date') or int(datetime.now().timestamp())
+    
+    cur = db.cursor()
+    
+    if action == 'done':
+        cur.execute('''
+            INSERT INTO reminder_acks (reminder_id, fire_at, user_id)
+            SELECT id, to_timestamp(%s), user_id FROM reminders WHERE id = %s AND user_id = %s
+            ON CONFLICT (reminder_id, fire_at) DO NOTHING
+            RETURNING reminder_id
+        ''', (fired, reminder_id, user_id))
+        recorded = cur.fetchone() is not None
+        # Отложенный повтор этого срабатывания больше не нужен
+        cur.execute(
+            'DELETE FROM reminder_snoozes WHERE reminder_id = %s AND snoozed_from = to_timestamp(%s) AND user_id = %s',
+            (reminder_id, fired, user_id)
+        )
+    else:
+        cur.execute('''
+            INSERT INTO reminder_snoozes (reminder_id, user_id, fire_at, snoozed_from)
+            SELECT id, user_id, date_trunc('second', now()) + make_interval(mins => %s), to_timestamp(%s)
+            FROM reminders WHERE id = %s AND user_id = %s
+            ON CONFLICT (reminder_id, snoozed_from) DO NOTHING
+            RETURNING fire_at
+        ''', (SNOOZE_MINUTES, fired, reminder_id, user_id))
+        recorded = cur.fetchone() is not None
+    
+    # Ничего не записано: кнопку нажали повторно или напоминание уже удалено
+    exists = True
+    if not recorded:
+        cur.execute('SELECT 1 FROM reminders WHERE id = %s AND user_id = %s', (reminder_id, user_id))
+        exists = cur.fetchone() is not None
     
-    if keyboard:
-        data['reply_markup'] = json.dumps(keyboard)
+    cur.close()
     
-    requests.post(url, json=data)
+    if not exists:
+        return '⚠️ Напоминание удалено'
+    if action == 'done':
+        return '✅ Отмечено' if recorded else '✅ Уже отмечено'
+    return f'⏰ Напомню через {SNOOZE_MINUTES} мин' if recorded else '⏰ Уже отложено'
 
 
-def answer_callback(callback_id: str, token: str):
-    '''Ответить на callback query'''
-    import requests
-    
-    url = f'https://api.telegram.org/bot{token}/answerCallbackQuery'
-    requests.post(url, json={'callback_query_id': callback_id})
+def send_message(chat_id: int, text: str, token: str, keyboard: Dict = None):
+    '''Отправить сообщение в Telegram'''
+    try:
+        get_client(token).send_message(chat_id, text, keyboard)
+    except TelegramError as e:
+        print(f'Failed to send message to {chat_id}: {e}')
+
+
+def answer_callback(callback_id: str, token: str, text: str = None):
+    '''Ответить на callback query (text - всплывающее уведомление)'''
+    try:
+        get_client(token).answer_callback_query(callback_id, text)
+    except TelegramError as e:
+        print(f'Failed to answer callback {callback_id}: {e}')
@@ -0,0 +1,351 @@
+'''
+Общий клиент Telegram Bot API для backend-функций.
+Каждая функция деплоится отдельно, поэтому модуль лежит копией в папке каждой функции
+(deliver-outbox, telegram-bot, send-reminders) - копии должны оставаться одинаковыми.
+'''
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+
+# Bot API: не больше ~30 сообщений в секунду на бота и ~1 в секунду в один чат
+GLOBAL_RATE = float(os.environ.get('TELEGRAM_GLOBAL_RATE', '30'))
+PER_CHAT_RATE = float(os.environ.get('TELEGRAM_PER_CHAT_RATE', '1'))
+PER_CHAT_BURST = float(os.environ.get('TELEGRAM_PER_CHAT_BURST', '3'))
+
+# (connect, read) в секундах
+DEFAULT_TIMEOUT = (3.05, 30)
+
+# Кусок, которым тело multipart уходит в сокет
+UPLOAD_CHUNK = 64 * 1024
+
+
+class TelegramError(Exception):
+    '''Ошибка Bot API; retry_after заполнен для ответов 429'''
+    
+    def __init__(self, method: str, status: int, description: str, retry_after: Optional[float] = None):
+        super().__init__(f'Telegram {method} error {status}: {description}')
+        self.method = method
+        self.status = status
+        self.description = description
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    '''Потокобезопасное ведро токенов: rate токенов в секунду, не больше capacity'''
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def try_acquire(self) -> bool:
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+    
+    def acquire(self) -> float:
+        '''Дождаться токена; возвращает, сколько секунд пришлось ждать'''
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+    
+    def pause(self, seconds: float):
+        '''Ничего не выдавать seconds секунд (ответ 429 с retry_after) - ждут все потоки, а не только получивший 429'''
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+    
+    def is_idle(self) -> bool:
+        with self.lock:
+            self._refill(time.monotonic())
+            return self.tokens >= self.capacity
+
+
+class MultipartBody:
+    '''
+    Тело multipart/form-data, которое читается кусками прямо из буферов файлов.
+    requests с files= собирает все тело в bytes (плюс копия каждого файла из read());
+    этот объект он отправляет потоком, а Content-Length берет из len()
+    '''
+    
+    def __init__(self, fields: Optional[Dict[str, Any]], files: Dict[str, Any]):
+        self.boundary = os.urandom(16).hex()
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self.parts: List[memoryview] = []
+        
+        for name, value in (fields or {}).items():
+            self._add_header(name)
+            self.parts.append(memoryview(str(value).encode('utf-8')))
+            self.parts.append(memoryview(b'\r\n'))
+        
+        for name, value in files.items():
+            file_name, data = value[0], value[1]
+            mime_type = value[2] if len(value) > 2 else None
+            self._add_header(name, file_name, mime_type)
+            self.parts.append(self._buffer(data))
+            self.parts.append(memoryview(b'\r\n'))
+        
+        self.parts.append(memoryview(f'--{self.boundary}--\r\n'.encode('ascii')))
+        self.length = sum(len(part) for part in self.parts)
+        self.index = 0
+        self.offset = 0
+    
+    @staticmethod
+    def _quote(value: str) -> str:
+        # Как urllib3 (HTML5): кавычки и переводы строк процентами, остальное - UTF-8 как есть
+        return value.replace('\n', '%0A').replace('\r', '%0D').replace('"', '%22')
+    
+    @staticmethod
+    def _buffer(data: Any) -> memoryview:
+        '''bytes/bytearray/memoryview - без копии, BytesIO - через getbuffer, другой файл - read()'''
+        if hasattr(data, 'getbuffer'):
+            return data.getbuffer()
+        if hasattr(data, 'read'):
+            return memoryview(data.read())
+        if isinstance(data, str):
+            return memoryview(data.encode('utf-8'))
+        return memoryview(data).cast('B')
+    
+    def _add_header(self, name: str, file_name: Optional[str] = None, mime_type: Optional[str] = None):
+        disposition = f'form-data; name="{self._quote(name)}"'
+        if file_name is not None:
+            disposition += f'; filename="{self._quote(file_name)}"'
+        header = f'--{self.boundary}\r\nContent-Disposition: {disposition}\r\n'
+        if mime_type:
+            header += f'Content-Type: {mime_type}\r\n'
+        self.parts.append(memoryview((header + '\r\n').encode('utf-8')))
+    
+    def __len__(self) -> int:
+        return self.length
+    
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.length
+        chunks = []
+        while size > 0 and self.index < len(self.parts):
+            part = self.parts[self.index]
+            chunk = part[self.offset:self.offset + size]
+            chunks.append(chunk)
+            size -= len(chunk)
+            self.offset += len(chunk)
+            if self.offset >= len(part):
+                self.index += 1
+                self.offset = 0
+        return b''.join(chunks)
+    
+    def __iter__(self):
+        while True:
+            chunk = self.read(UPLOAD_CHUNK)
+            if not chunk:
+                return
+            yield chunk
+
+
+_session: Dict[str, Any] = {'session': None}
+
+
+def _shared_session() -> Any:
+    '''Keep-alive Session на модуль: теплые вызовы переиспользуют TLS-соединения'''
+    if _session['session'] is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _session['session'] = session
+    return _session['session']
+
+
+class RequestsTransport:
+    '''Транспорт по умолчанию: requests через общий Session; файлы уходят потоком (MultipartBody)'''
+    
+    def post(self, url: str, data: Optional[Dict[str, Any]], files: Optional[Dict[str, Any]],
+             timeout: Tuple[float, float]) -> Tuple[int, Dict[str, Any]]:
+        import requests
+        
+        try:
+            if files:
+                # Тело собирается заново на каждую попытку: повтор читает файлы с начала
+                body = MultipartBody(data, files)
+                response = _shared_session().post(url, data=body, headers={'Content-Type': body.content_type}, timeout=timeout)
+            else:
+                response = _shared_session().post(url, json=data, timeout=timeout)
+        except requests.RequestException as e:
+            raise ConnectionError(str(e))
+        
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {'ok': False, 'description': response.text[:500]}
+        return response.status_code, payload
+
+
+class TelegramClient:
+    '''
+    Клиент Bot API с ограничением скорости (общее ведро и ведро на чат),
+    повторами по retry_after/5xx/сетевым ошибкам и таймаутами.
+    transport - объект с методом post(url, data, files, timeout) -> (status, json); в тестах
+    его можно подменить или направить API_URL на локальную заглушку.
+    '''
+    
+    def __init__(self, token: str, transport: Any = None, base_url: Optional[str] = None,
+                 timeout: Tuple[float, float] = DEFAULT_TIMEOUT, max_retries: int = 3, max_retry_after: float = 10,
+                 global_rate: float = GLOBAL_RATE, per_chat_rate: float = PER_CHAT_RATE, per_chat_burst: float = PER_CHAT_BURST):
+        self.token = token
+        self.transport = transport or RequestsTransport()
+        self.base_url = (base_url or API_URL).rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.chat_buckets: Dict[Any, TokenBucket] = {}
+        self.chat_lock = threading.Lock()
+        self.stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'throttle_wait': 0.0, 'rate_limited': 0}
+        self.stats_lock = threading.Lock()
+    
+    def _count(self, key: str, value: float = 1):
+        # Клиентом пользуются из нескольких потоков (рассылка send-reminders)
+        with self.stats_lock:
+            self.stats[key] += value
+    
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        with self.chat_lock:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                if len(self.chat_buckets) > 10000:
+                    # Полные ведра ничего не ограничивают, их можно выбросить
+                    for key in [key for key, value in self.chat_buckets.items() if value.is_idle()]:
+                        del self.chat_buckets[key]
+                bucket = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+                self.chat_buckets[chat_id] = bucket
+            return bucket
+    
+    def _throttle(self, chat_id: Any):
+        waited = self.global_bucket.acquire()
+        if chat_id is not None:
+            waited += self._chat_bucket(chat_id).acquire()
+        if waited > 0:
+            self._count('throttled')
+            self._count('throttle_wait', waited)
+    
+    def call(self, method: str, params: Optional[Dict[str, Any]] = None, files: Optional[Dict[str, Any]] = None,
+             chat_id: Any = None) -> Any:
+        '''Вызвать метод Bot API и вернуть поле result; при ошибке - TelegramError'''
+        url = f'{self.base_url}/bot{self.token}/{method}'
+        attempt = 0
+        
+        while True:
+            if files:
+                # Файловые потоки перечитываются при повторе
+                for value in files.values():
+                    stream = value[1] if isinstance(value, tuple) else value
+                    if hasattr(stream, 'seek'):
+                        stream.seek(0)
+            
+            self._throttle(chat_id)
+            self._count('requests')
+            
+            try:
+                status, payload = self.transport.post(url, params, files, self.timeout)
+            except ConnectionError as e:
+                if attempt >= self.max_retries:
+                    raise TelegramError(method, 0, str(e))
+                attempt += 1
+                self._count('retries')
+                time.sleep(min(2 ** attempt * 0.25, 5))
+                continue
+            
+            if status == 200 and payload.get('ok'):
+                return payload.get('result')
+            
+            description = payload.get('description', '')
+            retry_after = (payload.get('parameters') or {}).get('retry_after')
+            
+            if status == 429 and retry_after is not None:
+                self._count('rate_limited')
+                # Пауза через ведра: следующий _throttle этого и остальных потоков дождется retry_after
+                self.global_bucket.pause(retry_after)
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).pause(retry_after)
+                if attempt >= self.max_retries or retry_after > self.max_retry_after:
+                    raise TelegramError(method, status, description, retry_after)
+                attempt += 1
+                self._count('retries')
+                continue
+            
+            if status >= 500 and attempt < self.max_retries:
+                attempt += 1
+                self._count('retries')
+                time.sleep(min(2 ** attempt * 0.25, 5))
+                continue
+            
+            raise TelegramError(method, status, description, retry_after)
+    
+    def send_message(self, chat_id: Any, text: str, keyboard: Optional[Dict] = None, parse_mode: str = 'Markdown') -> Any:
+        params = {'chat_id': chat_id, 'text': text, 'parse_mode': parse_mode}
+        if keyboard:
+            params['reply_markup'] = json.dumps(keyboard)
+        return self.call('sendMessage', params, chat_id=chat_id)
+    
+    def send_photo(self, chat_id: Any, file_name: str, file_data: Any, caption: str = '') -> Any:
+        return self.call('sendPhoto', {'chat_id': chat_id, 'caption': caption},
+                         files={'photo': (file_name, file_data)}, chat_id=chat_id)
+    
+    def send_document(self, chat_id: Any, file_name: str, file_data: Any, caption: str = '', mime_type: Optional[str] = None) -> Any:
+        document = (file_name, file_data, mime_type) if mime_type else (file_name, file_data)
+        return self.call('sendDocument', {'chat_id': chat_id, 'caption': caption},
+                         files={'document': document}, chat_id=chat_id)
+    
+    def send_media_group(self, chat_id: Any, items: List[Tuple[str, str, Any, str]]) -> Any:
+        '''Альбом одним вызовом; items - (type, file_name, file_data, caption), type - photo/document/...'''
+        media = []
+        files = {}
+        for n, (media_type, file_name, file_data, caption) in enumerate(items):
+            field = f'file{n}'
+            media.append({'type': media_type, 'media': f'attach://{field}', 'caption': caption})
+            files[field] = (file_name, file_data)
+        return self.call('sendMediaGroup', {'chat_id': chat_id, 'media': json.dumps(media, ensure_ascii=False)},
+                         files=files, chat_id=chat_id)
+    
+    def answer_callback_query(self, callback_query_id: str, text: Optional[str] = None) -> Any:
+        params = {'callback_query_id': callback_query_id}
+        if text:
+            params['text'] = text
+        # Ответ на callback не является сообщением в чат, поэтому идет только через общее ведро
+        return self.call('answerCallbackQuery', params)
+
+
+_clients: Dict[str, TelegramClient] = {}
+
+
+def get_client(token: str) -> TelegramClient:
+    '''Клиент на токен, общий для всех вызовов теплого контейнера (вместе с ведрами лимитов)'''
+    client = _clients.get(token)
+    if client is None:
+        client = TelegramClient(token)
+        _clients[token] = client
+    return client
@@ -0,0 +1,49 @@
+import zipfile
+import zlib
+from typing import Any, Dict
+from buffers import BufferReader
+
+# Кусок распаковки при проверке CRC: в памяти одновременно только он
+READ_CHUNK = 64 * 1024
+
+# Части, без которых Word не откроет документ
+REQUIRED_PARTS = ('[Content_Types].xml', 'word/document.xml')
+
+
+class ArchiveError(Exception):
+    '''Файл не является целым DOCX: обрезан, поврежден или это не документ Word'''
+    pass
+
+
+def validate_docx(data: Any, max_unpacked: int) -> Dict[str, int]:
+    '''
+    Проверить DOCX без распаковки в память: центральный каталог, обязательные части
+    и CRC каждого члена (как zipfile.testzip, но кусками READ_CHUNK). Обрезанный файл
+    не находит центральный каталог, поврежденный - не сходится по CRC
+    '''
+    try:
+        archive = zipfile.ZipFile(BufferReader(data))
+    except zipfile.BadZipFile as e:
+        raise ArchiveError(f'not a ZIP archive or truncated: {e}')
+    
+    with archive:
+        members = archive.infolist()
+        names = {info.filename for info in members}
+        missing = [part for part in REQUIRED_PARTS if part not in names]
+        if missing:
+            raise ArchiveError(f'not a Word document, missing {", ".join(missing)}')
+        
+        # Размеры из каталога проверяются до распаковки: zip-бомба отсекается сразу
+        unpacked = sum(info.file_size for info in members)
+        if unpacked > max_unpacked:
+            raise ArchiveError(f'unpacked size {unpacked} bytes exceeds {max_unpacked}')
+        
+        for info in members:
+            try:
+                with archive.open(info) as member:
+                    while member.read(READ_CHUNK):
+                        pass
+            except (zipfile.BadZipFile, zlib.error, EOFError, OSError, ValueError) as e:
+                raise ArchiveError(f'corrupt member {info.filename}: {e}')
+    
+    return {'members': len(members), 'unpacked_bytes': unpacked}
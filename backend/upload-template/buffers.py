@@ -0,0 +1,71 @@
+import binascii
+import io
+from typing import Any, Optional, Union
+
+# Кусок base64, который декодируется за раз: кратен 4 символам
+B64_CHUNK = 1024 * 1024
+
+
+class BufferReader(io.RawIOBase):
+    '''
+    Файловый объект только для чтения поверх bytes/bytearray/memoryview. BytesIO копирует
+    все, кроме bytes, а BYTEA из psycopg2 приходит memoryview: читатель отдает срезы без копии буфера
+    '''
+    
+    def __init__(self, buffer: Any):
+        self.view = memoryview(buffer).cast('B')
+        self.position = 0
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def tell(self) -> int:
+        return self.position
+    
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        if offset < 0:
+            raise ValueError(f'negative seek position {offset}')
+        self.position = offset
+        return offset
+    
+    def read(self, size: Optional[int] = -1) -> bytes:
+        end = len(self.view) if size is None or size < 0 else min(self.position + size, len(self.view))
+        data = bytes(self.view[self.position:end])
+        self.position = max(self.position, end)
+        return data
+    
+    def readall(self) -> bytes:
+        return self.read()
+    
+    def readinto(self, target: Any) -> int:
+        chunk = self.view[self.position:self.position + len(target)]
+        target[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+
+def b64decode_chunked(text: str, limit: Optional[int] = None) -> Union[bytes, bytearray]:
+    '''
+    base64 по кускам в один bytearray: b64decode сначала копирует всю строку в bytes,
+    и на пике в памяти текст, его копия и результат. limit - ValueError, как только
+    декодированных байтов больше, без декодирования остатка строки
+    '''
+    decoded = bytearray()
+    try:
+        for start in range(0, len(text), B64_CHUNK):
+            decoded += binascii.a2b_base64(text[start:start + B64_CHUNK])
+            if limit is not None and len(decoded) > limit:
+                raise ValueError(f'decoded data is larger than {limit} bytes')
+    except binascii.Error:
+        # Символы вне алфавита (переводы строк) сбили выравнивание кусков по 4 - декодируем целиком
+        decoded = binascii.a2b_base64(text)
+        if limit is not None and len(decoded) > limit:
+            raise ValueError(f'decoded data is larger than {limit} bytes')
+    return decoded
@@ -0,0 +1,155 @@
+'''
+Загрузка шаблона по частям с докачкой. Клиент выбирает upload_id и шлет части
+POST ?upload_id=...&chunk=N[&crc32=...]; повтор уже принятой части ничего не меняет,
+GET ?upload_id=... возвращает принятые номера, POST ?upload_id=...&complete=K собирает файл из K частей.
+Части лежат в базе: у функции нет диска, который пережил бы следующий вызов.
+'''
+import os
+import re
+import zlib
+from typing import Any, Dict, List
+
+# Сколько секунд живет незавершенная загрузка
+UPLOAD_TTL_SECONDS = int(os.environ.get('UPLOAD_TTL', '86400'))
+
+# Сколько брошенных загрузок удаляется при начале новой, чтобы таблица не росла без cron
+CLEANUP_BATCH = 20
+
+UPLOAD_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+class UploadError(Exception):
+    '''Часть или загрузку нельзя принять: HTTP-статус ответа в status'''
+    
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def check_upload_id(upload_id: str) -> str:
+    if not UPLOAD_ID_PATTERN.match(upload_id):
+        raise UploadError(400, 'upload_id must be 8-64 characters: letters, digits, _ or -')
+    return upload_id
+
+
+def store_chunk(cur, upload_id: str, name: str, filename: str, index: int, data: Any,
+                expected_crc: str, max_bytes: int) -> Dict[str, Any]:
+    '''
+    Принять часть index. Лимит размера проверяется по сумме уже принятых частей одним UPDATE,
+    поэтому параллельные части одной загрузки не превысят его вместе
+    '''
+    crc = zlib.crc32(data)
+    if expected_crc:
+        try:
+            expected = int(expected_crc, 16)
+        except ValueError:
+            raise UploadError(400, f'crc32 must be hex, got {expected_crc}')
+        if expected != crc:
+            raise UploadError(400, f'Chunk {index} CRC32 mismatch: expected {expected_crc}, got {crc:08x}')
+    
+    cur.execute(
+        '''INSERT INTO template_uploads (upload_id, name, filename) VALUES (%s, %s, %s)
+           ON CONFLICT (upload_id) DO NOTHING
+           RETURNING upload_id''',
+        (upload_id, name, filename)
+    )
+    if cur.fetchone() is not None:
+        _cleanup_expired(cur)
+    
+    # Блокировка загрузки: повтор той же части параллельно с первой попыткой увидит ее после ожидания
+    cur.execute('SELECT name FROM template_uploads WHERE upload_id = %s FOR UPDATE', (upload_id,))
+    upload_name = cur.fetchone()[0]
+    if upload_name != name:
+        raise UploadError(409, f'Upload {upload_id} belongs to template {upload_name}')
+    cur.execute(
+        'SELECT crc32 FROM template_upload_chunks WHERE upload_id = %s AND chunk_index = %s',
+        (upload_id, index)
+    )
+    stored = cur.fetchone()
+    if stored is not None:
+        if stored[0] != crc:
+            raise UploadError(409, f'Chunk {index} was already received with different content')
+        return upload_status(cur, upload_id)
+    
+    cur.execute(
+        '''UPDATE template_uploads SET received_bytes = received_bytes + %s
+           WHERE upload_id = %s AND received_bytes + %s <= %s
+           RETURNING received_bytes''',
+        (len(data), upload_id, len(data), max_bytes)
+    )
+    if cur.fetchone() is None:
+        raise UploadError(413, f'Template is larger than {max_bytes} bytes')
+    
+    import psycopg2
+    
+    cur.execute(
+        'INSERT INTO template_upload_chunks (upload_id, chunk_index, data, size, crc32) VALUES (%s, %s, %s, %s, %s)',
+        (upload_id, index, psycopg2.Binary(data), len(data), crc)
+    )
+    return upload_status(cur, upload_id)
+
+
+def upload_status(cur, upload_id: str) -> Dict[str, Any]:
+    '''Принятые части загрузки: по ним клиент докачивает недостающие'''
+    cur.execute('SELECT name, filename, received_bytes FROM template_uploads WHERE upload_id = %s', (upload_id,))
+    row = cur.fetchone()
+    if row is None:
+        raise UploadError(404, f'Upload {upload_id} not found or expired')
+    cur.execute(
+        'SELECT chunk_index, size, crc32 FROM template_upload_chunks WHERE upload_id = %s ORDER BY chunk_index',
+        (upload_id,)
+    )
+    chunks = [{'index': index, 'size': size, 'crc32': f'{crc:08x}'} for index, size, crc in cur.fetchall()]
+    return {'upload_id': upload_id, 'name': row[0], 'filename': row[1], 'received_bytes': row[2], 'chunks': chunks}
+
+
+def assemble(conn, upload_id: str, chunk_count: int) -> Dict[str, Any]:
+    '''
+    Собрать файл из частей 0..chunk_count-1 в заранее выделенный bytearray. Части читаются
+    серверным курсором по одной: в памяти итоговый файл и одна часть, а не все строки сразу
+    '''
+    cur = conn.cursor()
+    status = upload_status(cur, upload_id)
+    cur.close()
+    received = {chunk['index'] for chunk in status['chunks']}
+    missing: List[int] = [index for index in range(chunk_count) if index not in received]
+    if missing:
+        raise UploadError(409, f'Upload {upload_id} is missing chunks {missing[:20]}')
+    extra = sorted(received - set(range(chunk_count)))
+    if extra:
+        raise UploadError(409, f'Upload {upload_id} has chunks beyond {chunk_count - 1}: {extra[:20]}')
+    
+    data = bytearray(status['received_bytes'])
+    position = 0
+    rows = conn.cursor(name='template_upload_chunks')
+    rows.itersize = 1
+    rows.execute(
+        'SELECT data, crc32 FROM template_upload_chunks WHERE upload_id = %s ORDER BY chunk_index',
+        (upload_id,)
+    )
+    for index, (chunk, crc) in enumerate(rows):
+        # CRC при сборке ловит порчу части при хранении, а не только при передаче
+        if zlib.crc32(chunk) != crc:
+            raise UploadError(500, f'Stored chunk {index} of upload {upload_id} is corrupt')
+        data[position:position + len(chunk)] = chunk
+        position += len(chunk)
+    rows.close()
+    
+    status['data'] = data
+    return status
+
+
+def discard(cur, upload_id: str):
+    '''Удалить загрузку и ее части (после сборки)'''
+    cur.execute('DELETE FROM template_uploads WHERE upload_id = %s', (upload_id,))
+
+
+def _cleanup_expired(cur):
+    cur.execute(
+        '''DELETE FROM template_uploads WHERE upload_id IN (
+               SELECT upload_id FROM template_uploads
+               WHERE created_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+               ORDER BY created_at LIMIT %s
+           )''',
+        (UPLOAD_TTL_SECONDS, CLEANUP_BATCH)
+    )
@@ -0,0 +1,84 @@
+import io
+import re
+from typing import Any, Dict, List, Tuple
+from docx import Document
+from docx.oxml.ns import qn
+
+PLACEHOLDER_RE = re.compile(r'\{\{[^{}]+\}\}')
+
+W_T = qn('w:t')
+W_P = qn('w:p')
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+STORY_PARTS = re.compile(r'^/word/(document|header\d*|footer\d*)\.xml$')
+
+
+def _paragraph_of(t) -> Any:
+    node = t.getparent()
+    while node is not None and node.tag != W_P:
+        node = node.getparent()
+    return node
+
+
+def _merge_split_placeholders(texts: List[Any]) -> None:
+    '''Собрать плейсхолдеры, разбитые Word по нескольким w:t одного абзаца, в первый из них'''
+    full_text = ''.join(t.text or '' for t in texts)
+    if '{{' not in full_text:
+        return
+    
+    bounds: List[Tuple[int, int]] = []
+    offset = 0
+    for t in texts:
+        length = len(t.text or '')
+        bounds.append((offset, offset + length))
+        offset += length
+    
+    def locate(pos: int) -> int:
+        for i, (start, end) in enumerate(bounds):
+            if start <= pos < end:
+                return i
+        return len(bounds) - 1
+    
+    # Справа налево, чтобы смещения более ранних совпадений оставались верными
+    for match in reversed(list(PLACEHOLDER_RE.finditer(full_text))):
+        first = locate(match.start())
+        last = locate(match.end() - 1)
+        if first == last:
+            continue
+        
+        head = texts[first].text[:match.start() - bounds[first][0]]
+        tail = texts[last].text[match.end() - bounds[last][0]:]
+        texts[first].text = head + match.group(0)
+        texts[first].set(XML_SPACE, 'preserve')
+        for t in texts[first + 1:last]:
+            t.text = ''
+        texts[last].text = tail
+        texts[last].set(XML_SPACE, 'preserve')
+
+
+def compile_template(file_content: bytes) -> Tuple[bytes, List[Dict[str, Any]]]:
+    '''Нормализовать шаблон и построить индекс плейсхолдеров по частям документа'''
+    doc = Document(io.BytesIO(file_content))
+    placeholders: List[Dict[str, Any]] = []
+    
+    for part in doc.part.package.iter_parts():
+        partname = str(part.partname)
+        if not STORY_PARTS.match(partname) or not hasattr(part, 'element'):
+            continue
+        
+        texts = list(part.element.iter(W_T))
+        
+        by_paragraph: Dict[Any, List[Any]] = {}
+        for t in texts:
+            by_paragraph.setdefault(_paragraph_of(t), []).append(t)
+        for paragraph_texts in by_paragraph.values():
+            _merge_split_placeholders(paragraph_texts)
+        
+        for index, t in enumerate(texts):
+            keys = PLACEHOLDER_RE.findall(t.text or '')
+            if keys:
+                placeholders.append({'part': partname, 'index': index, 'keys': keys})
+    
+    output = io.BytesIO()
+    doc.save(output)
+    return output.getvalue(), placeholders
@@ -1,13 +1,32 @@
 import json
 import os
-import base64
-from typing import Dict, Any
-import psycopg2
+import re
+import hashlib
+from typing import Dict, Any, Optional
+from db_pool import unit_of_work
+from buffers import b64decode_chunked
+from archive_check import validate_docx, ArchiveError
+from chunks import UploadError, check_upload_id, store_chunk, upload_status, assemble, discard
+
+DEFAULT_TEMPLATE = os.environ.get('DEFAULT_TEMPLATE', 'default')
+
+# Предел размера DOCX: проверяется по ходу декодирования тела и по сумме принятых частей, до сборки файла
+MAX_TEMPLATE_BYTES = int(os.environ.get('MAX_TEMPLATE_BYTES', str(20 * 1024 * 1024)))
+
+# Предел суммы распакованных частей DOCX по центральному каталогу (защита от zip-бомбы)
+MAX_UNPACKED_BYTES = int(os.environ.get('MAX_TEMPLATE_UNPACKED_BYTES', str(200 * 1024 * 1024)))
+
+# Имя шаблона - лейбл или тип договора: буквы, цифры, _ . -
+NAME_PATTERN = re.compile(r'^[\w.-]{1,64}$')
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Upload template.docx file to backend storage
-    Args: event - dict with httpMethod, body with file data
+    Business: Upload a named, versioned contract template (.docx) and switch its active version
+    Args: event - dict with httpMethod; POST body - DOCX file (base64), ?name=<template>&filename=<file>;
+          large files: POST ?upload_id=<id>&chunk=N[&crc32=<hex>] per chunk, then ?upload_id=<id>&complete=<count>;
+          GET ?upload_id=<id> lists received chunks to resume an interrupted upload;
+          POST ?name=<template>&activate=N without body makes an uploaded version active;
+          GET [?name=<template>] lists templates with their versions
           context - object with request_id attribute
     Returns: HTTP response with success/error status
     '''
@@ -18,82 +37,306 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
                 'Access-Control-Allow-Headers': 'Content-Type',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
-    if method != 'POST':
+    if method not in ('GET', 'POST'):
         return {
             'statusCode': 405,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
             'body': json.dumps({'error': 'Method not allowed'})
         }
     
+    params = event.get('queryStringParameters') or {}
+    name = params.get('name') or DEFAULT_TEMPLATE
+    if not NAME_PATTERN.match(name):
+        return error_response(400, f'Invalid template name: {name}')
+    
     try:
-        body = event.get('body', '')
-        is_base64 = event.get('isBase64Encoded', False)
-        
-        if not body:
-            raise Exception('No file data provided')
+        db_url = os.environ.get('DATABASE_URL')
+        if not db_url:
+            raise Exception('DATABASE_URL not found')
         
-        # Cloud Functions всегда передают бинарные данные как base64 строку
-        if isinstance(body, str):
-            file_content = base64.b64decode(body)
-        else:
-            file_content = body
+        if params.get('upload_id'):
+            upload_id = check_upload_id(params['upload_id'])
+            if method == 'GET':
+                with unit_of_work(db_url) as db:
+                    return json_response(upload_status(db.cursor(), upload_id))
+            if params.get('complete'):
+                return complete_upload(db_url, upload_id, parse_number(params['complete'], 'complete'))
+            return receive_chunk(db_url, event, upload_id, name, params.get('filename') or 'template.docx',
+                                 parse_number(params.get('chunk', '0'), 'chunk'), params.get('crc32'))
         
-        file_size = len(file_content)
+        if method == 'GET':
+            return list_templates(db_url, params.get('name'))
         
-        if file_size < 100:
-            raise Exception(f'File too small ({file_size} bytes), likely corrupt')
+        if params.get('activate'):
+            return activate_version(db_url, name, parse_number(params['activate'], 'activate'))
         
-        # Проверка что это действительно DOCX (ZIP файл)
-        if not file_content.startswith(b'PK'):
-            raise Exception(f'Invalid DOCX file format. First bytes: {file_content[:4].hex()}')
+        file_content = decode_body(event)
+        with unit_of_work(db_url) as db:
+            return save_version(db.cursor(), file_content, name, params.get('filename') or 'template.docx')
         
-        db_url = os.environ.get('DATABASE_URL')
-        if not db_url:
-            raise Exception('DATABASE_URL not found')
+    except UploadError as e:
+        return error_response(e.status, str(e))
+    except Exception as e:
+        return error_response(500, str(e))
+
+
+def parse_number(value: str, field: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise UploadError(400, f'{field} must be a number')
+    if number < 0:
+        raise UploadError(400, f'{field} must not be negative')
+    return number
+
+
+def decode_body(event: Dict[str, Any]) -> Any:
+    '''Тело запроса в байтах; предел MAX_TEMPLATE_BYTES срабатывает по ходу декодирования base64'''
+    body = event.get('body', '')
+    
+    if not body:
+        raise Exception('No file data provided')
+    
+    # Cloud Functions всегда передают бинарные данные как base64 строку
+    if not isinstance(body, str):
+        file_content = body
+    else:
+        try:
+            file_content = b64decode_chunked(body, MAX_TEMPLATE_BYTES)
+        except ValueError:
+            raise UploadError(413, f'Template is larger than {MAX_TEMPLATE_BYTES} bytes')
+    
+    if len(file_content) > MAX_TEMPLATE_BYTES:
+        raise UploadError(413, f'Template is larger than {MAX_TEMPLATE_BYTES} bytes')
+    return file_content
+
+
+def receive_chunk(db_url: str, event: Dict[str, Any], upload_id: str, name: str, filename: str,
+                  index: int, crc32: Optional[str]) -> Dict[str, Any]:
+    '''Принять одну часть загрузки; ответ - все принятые части, как у GET ?upload_id'''
+    data = decode_body(event)
+    with unit_of_work(db_url) as db:
+        status = store_chunk(db.cursor(), upload_id, name, filename, index, data, crc32, MAX_TEMPLATE_BYTES)
+    return json_response(status)
+
+
+def complete_upload(db_url: str, upload_id: str, chunk_count: int) -> Dict[str, Any]:
+    '''Собрать части в файл и сохранить его версией шаблона в той же транзакции, что и удаление частей'''
+    with unit_of_work(db_url) as db:
+        assembled = assemble(db.connection(), upload_id, chunk_count)
+        cur = db.cursor()
+        response = save_version(cur, assembled['data'], assembled['name'], assembled['filename'])
+        discard(cur, upload_id)
+        cur.close()
+    return response
+
+
+def save_version(cur, file_content: Any, name: str, filename: str) -> Dict[str, Any]:
+    '''
+    Новая версия шаблона name. Содержимое хранится по sha256: файл, совпадающий с активной версией,
+    ничего не меняет, уже загруженный раньше - не компилируется повторно и не получает новый номер
+    '''
+    file_size = len(file_content)
+    
+    if file_size < 100:
+        raise Exception(f'File too small ({file_size} bytes), likely corrupt')
+    
+    # Проверка что это действительно DOCX (ZIP файл)
+    if not file_content.startswith(b'PK'):
+        raise Exception(f'Invalid DOCX file format. First bytes: {bytes(file_content[:4]).hex()}')
+    
+    # Обрезанный или поврежденный архив отсекается здесь, а не при генерации договора
+    try:
+        validate_docx(file_content, MAX_UNPACKED_BYTES)
+    except ArchiveError as e:
+        raise Exception(f'Invalid DOCX file: {e}')
+    
+    content_hash = hashlib.sha256(file_content).hexdigest()
+    
+    # python-docx (через compiler) и psycopg2 грузятся только на пути загрузки, preflight обходится без них
+    import psycopg2
+    
+    cur.execute('SELECT active_version, active_hash FROM templates WHERE name = %s', (name,))
+    row = cur.fetchone()
+    if row and (row[1] or '').strip() == content_hash:
+        return upload_response(name, row[0], content_hash, file_size, None, unchanged=True)
+    
+    cur.execute(
+        'SELECT COALESCE(jsonb_array_length(placeholders), 0) FROM template_contents WHERE content_hash = %s',
+        (content_hash,)
+    )
+    stored = cur.fetchone()
+    if stored is not None:
+        placeholders_count = stored[0]
+    else:
+        from compiler import compile_template
         
-        conn = psycopg2.connect(db_url)
-        cur = conn.cursor()
+        # Компиляция заодно проверяет, что python-docx способен открыть файл
+        try:
+            compiled_data, placeholders = compile_template(file_content)
+        except Exception as e:
+            raise Exception(f'Invalid DOCX file, cannot compile template: {e}')
+        placeholders_count = len(placeholders)
         
         cur.execute(
-            'UPDATE template_storage SET template_data = %s, filename = %s, file_size = %s, uploaded_at = CURRENT_TIMESTAMP WHERE id = 1',
-            (psycopg2.Binary(file_content), 'template.docx', file_size)
+            '''INSERT INTO template_contents (content_hash, template_data, file_size, compiled_data, placeholders)
+               VALUES (%s, %s, %s, %s, %s)
+               ON CONFLICT (content_hash) DO NOTHING''',
+            (content_hash, psycopg2.Binary(file_content), file_size, psycopg2.Binary(compiled_data),
+             json.dumps(placeholders, ensure_ascii=False))
         )
+    
+    # Строка имени блокируется: параллельные загрузки одного шаблона получают разные номера версий
+    cur.execute('INSERT INTO templates (name) VALUES (%s) ON CONFLICT (name) DO NOTHING', (name,))
+    cur.execute('SELECT latest_version, active_version, active_hash FROM templates WHERE name = %s FOR UPDATE', (name,))
+    latest_version, active_version, active_hash = cur.fetchone()
+    if (active_hash or '').strip() == content_hash:
+        return upload_response(name, active_version, content_hash, file_size, placeholders_count, unchanged=True)
+    
+    cur.execute(
+        'SELECT version FROM template_versions WHERE name = %s AND content_hash = %s ORDER BY version DESC LIMIT 1',
+        (name, content_hash)
+    )
+    existing = cur.fetchone()
+    if existing is not None:
+        # Тот же файл уже был версией этого шаблона: он снова становится активным
+        version = existing[0]
+    else:
+        version = latest_version + 1
+        cur.execute(
+            'INSERT INTO template_versions (name, version, content_hash, filename, file_size) VALUES (%s, %s, %s, %s, %s)',
+            (name, version, content_hash, filename, file_size)
+        )
+    
+    cur.execute(
+        '''UPDATE templates
+           SET active_version = %s, active_hash = %s, latest_version = GREATEST(latest_version, %s),
+               updated_at = CURRENT_TIMESTAMP
+           WHERE name = %s''',
+        (version, content_hash, version, name)
+    )
+    
+    return upload_response(name, version, content_hash, file_size, placeholders_count, unchanged=False)
+
+
+def activate_version(db_url: str, name: str, version: int) -> Dict[str, Any]:
+    '''Сделать активной уже загруженную версию (откат или переключение без повторной загрузки)'''
+    with unit_of_work(db_url) as db:
+        cur = db.cursor()
+        cur.execute('SELECT content_hash FROM template_versions WHERE name = %s AND version = %s', (name, version))
+        row = cur.fetchone()
+        if row is None:
+            cur.close()
+            return error_response(404, f'Template {name} version {version} not found')
         
-        conn.commit()
+        cur.execute(
+            'UPDATE templates SET active_version = %s, active_hash = %s, updated_at = CURRENT_TIMESTAMP WHERE name = %s',
+            (version, row[0], name)
+        )
         cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'isBase64Encoded': False,
-            'body': json.dumps({
-                'success': True,
-                'message': 'Template uploaded successfully',
-                'file_size': file_size
-            })
-        }
-        
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'isBase64Encoded': False,
-            'body': json.dumps({
-                'success': False,
-                'error': str(e)
-            })
-        }
\ No newline at end of file
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json'
+        },
+        'isBase64Encoded': False,
+        'body': json.dumps({
+            'success': True,
+            'message': f'Template {name} version {version} is active',
+            'name': name,
+            'version': version,
+            'content_hash': row[0].strip()
+        })
+    }
+
+
+def list_templates(db_url: str, name: Optional[str]) -> Dict[str, Any]:
+    '''Шаблоны с активной версией и историей загрузок, новые версии первыми'''
+    with unit_of_work(db_url) as db:
+        cur = db.cursor()
+        cur.execute(
+            '''SELECT t.name, t.active_version, v.version, v.content_hash, v.filename, v.file_size, v.uploaded_at
+               FROM templates t
+               JOIN template_versions v ON v.name = t.name
+               WHERE %s::text IS NULL OR t.name = %s
+               ORDER BY t.name, v.version DESC''',
+            (name, name)
+        )
+        rows = cur.fetchall()
+        cur.close()
+    
+    templates: Dict[str, Dict[str, Any]] = {}
+    for template_name, active_version, version, content_hash, filename, file_size, uploaded_at in rows:
+        entry = templates.setdefault(template_name, {'name': template_name, 'active_version': active_version, 'versions': []})
+        entry['versions'].append({
+            'version': version,
+            'content_hash': content_hash.strip(),
+            'filename': filename,
+            'file_size': file_size,
+            'uploaded_at': uploaded_at.isoformat() if uploaded_at else None
+        })
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json'
+        },
+        'isBase64Encoded': False,
+        'body': json.dumps({'success': True, 'templates': list(templates.values())})
+    }
+
+
+def upload_response(name: str, version: int, content_hash: str, file_size: int, placeholders_count: Optional[int],
+                    unchanged: bool) -> Dict[str, Any]:
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json'
+        },
+        'isBase64Encoded': False,
+        'body': json.dumps({
+            'success': True,
+            'message': 'Template is already active, nothing changed' if unchanged else 'Template uploaded successfully',
+            'name': name,
+            'version': version,
+            'content_hash': content_hash,
+            'unchanged': unchanged,
+            'file_size': file_size,
+            'placeholders_count': placeholders_count
+        })
+    }
+
+
+def json_response(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json'
+        },
+        'isBase64Encoded': False,
+        'body': json.dumps(dict(payload, success=True), ensure_ascii=False)
+    }
+
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json'
+        },
+        'isBase64Encoded': False,
+        'body': json.dumps({'success': False, 'error': message})
+    }
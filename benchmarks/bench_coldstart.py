@@ -0,0 +1,200 @@
+'''
+Холодный старт backend-функций: каждый замер - новый процесс интерпретатора.
+Для каждой функции меряется:
+  - импорт index по -X importtime (суммарно и вклад тяжелых библиотек, если они попали в импорт);
+  - первый запрос: OPTIONS (CORS preflight) и 405, время от запуска процесса до ответа;
+  - какие тяжелые библиотеки оказались загружены после preflight (должно быть пусто);
+  - сколько стоит ленивая догрузка (модули, которые функция импортирует только на рабочем пути).
+Результат - медианы по --repeat процессам, JSON; --compare сравнивает с сохраненным прогоном.
+Запуск: python benchmarks/bench_coldstart.py [--repeat 5] [--output results.json] [--compare old.json]
+'''
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.join(HERE, '..', 'backend')
+
+# Модули, которые функция догружает на рабочем пути (после preflight)
+FUNCTIONS = {
+    'generate-contract': ['contract'],
+    'upload-template': ['compiler', 'psycopg2'],
+    'get-next-number': ['psycopg2'],
+    'deliver-outbox': ['psycopg2', 'requests'],
+    'telegram-bot': ['psycopg2', 'requests'],
+    'send-reminders': ['psycopg2', 'requests'],
+    'contract-archive': ['psycopg2'],
+}
+
+HEAVY_MODULES = ('docx', 'PIL', 'psycopg2', 'requests', 'lxml')
+
+COMPARED_METRICS = ('import_ms', 'first_response_ms', 'options_ms', 'lazy_import_ms')
+
+
+def parse_importtime(stderr: str) -> Dict[str, float]:
+    '''Суммарное время (мс) по строкам -X importtime: index и первые вхождения тяжелых библиотек'''
+    found: Dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|', 2)
+        name = name.strip()
+        if not cumulative.strip().isdigit():
+            continue
+        if name == 'index' or (name in HEAVY_MODULES and name not in found):
+            found[name] = int(cumulative) / 1000
+    return found
+
+
+def probe(function: str, spawned_at: float):
+    '''Выполняется в дочернем процессе: импорт index и первые запросы'''
+    function_dir = os.path.join(BACKEND, function)
+    sys.path.insert(0, function_dir)
+    os.environ.setdefault('TRACE_SAMPLE_RATE', '0')
+    
+    class Context:
+        request_id = 'coldstart'
+    
+    started = time.perf_counter()
+    import index
+    import_ms = (time.perf_counter() - started) * 1000
+    
+    started = time.perf_counter()
+    options = index.handler({'httpMethod': 'OPTIONS'}, Context())
+    options_ms = (time.perf_counter() - started) * 1000
+    first_response_ms = (time.time() - spawned_at) * 1000
+    
+    started = time.perf_counter()
+    not_allowed = index.handler({'httpMethod': 'DELETE'}, Context())
+    not_allowed_ms = (time.perf_counter() - started) * 1000
+    
+    loaded_heavy = sorted(name for name in HEAVY_MODULES if name in sys.modules)
+    
+    started = time.perf_counter()
+    for module in FUNCTIONS[function]:
+        __import__(module)
+    lazy_import_ms = (time.perf_counter() - started) * 1000
+    
+    print(json.dumps({
+        'import_ms': round(import_ms, 2),
+        'options_ms': round(options_ms, 3),
+        'options_status': options['statusCode'],
+        'not_allowed_ms': round(not_allowed_ms, 3),
+        'not_allowed_status': not_allowed['statusCode'],
+        'first_response_ms': round(first_response_ms, 2),
+        'heavy_after_preflight': loaded_heavy,
+        'lazy_import_ms': round(lazy_import_ms, 2),
+    }))
+
+
+def measure(function: str, repeat: int) -> Dict[str, Any]:
+    function_dir = os.path.join(BACKEND, function)
+    runs: List[Dict[str, Any]] = []
+    importtime: List[Dict[str, float]] = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import index'],
+                                cwd=function_dir, capture_output=True, text=True, check=True)
+        importtime.append(parse_importtime(result.stderr))
+        
+        command = [sys.executable, os.path.abspath(__file__), '--probe', function, '--spawned-at', repr(time.time())]
+        output = subprocess.check_output(command)
+        runs.append(json.loads(output.decode().strip().splitlines()[-1]))
+    
+    def median(key: str) -> float:
+        return round(statistics.median(run[key] for run in runs), 3)
+    
+    importtime_ms = {
+        name: round(statistics.median(sample.get(name, 0.0) for sample in importtime), 2)
+        for name in sorted({name for sample in importtime for name in sample})
+    }
+    return {
+        'function': function,
+        'import_ms': median('import_ms'),
+        'importtime_ms': importtime_ms,
+        'options_ms': median('options_ms'),
+        'not_allowed_ms': median('not_allowed_ms'),
+        'first_response_ms': median('first_response_ms'),
+        'statuses': [runs[0]['options_status'], runs[0]['not_allowed_status']],
+        'heavy_after_preflight': runs[0]['heavy_after_preflight'],
+        'lazy_import_ms': median('lazy_import_ms'),
+    }
+
+
+def git_revision() -> Dict[str, Any]:
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE).decode().strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--', '../backend'], cwd=HERE).strip())
+        return {'commit': commit, 'dirty': dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def compare(current: Dict[str, Any], previous_path: str):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    
+    before = {s['function']: s for s in previous['functions']}
+    print(f"\nvs {previous.get('commit')} ({previous_path}):")
+    for scenario in current['functions']:
+        old = before.get(scenario['function'])
+        if old is None:
+            continue
+        deltas = []
+        for metric in COMPARED_METRICS:
+            if old.get(metric):
+                deltas.append(f"{metric} {(scenario[metric] - old[metric]) / old[metric] * 100:+6.1f}%")
+        print(f"  {scenario['function']:<18} " + '  '.join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--functions', default=','.join(FUNCTIONS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='куда сохранить JSON (по умолчанию benchmarks/results/coldstart-<commit>.json)')
+    parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+    # Параметры дочернего процесса
+    parser.add_argument('--probe', help=argparse.SUPPRESS)
+    parser.add_argument('--spawned-at', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.probe:
+        probe(args.probe, args.spawned_at)
+        return
+    
+    revision = git_revision()
+    report: Dict[str, Any] = {
+        **revision,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'repeat': args.repeat},
+        'functions': []
+    }
+    
+    for function in args.functions.split(','):
+        scenario = measure(function, args.repeat)
+        report['functions'].append(scenario)
+        heavy = ', '.join(f'{name} {ms:.1f}' for name, ms in scenario['importtime_ms'].items() if name != 'index')
+        print(f"{function:<18} import {scenario['import_ms']:7.1f} ms  first response {scenario['first_response_ms']:7.1f} ms  "
+              f"OPTIONS {scenario['options_ms']:6.3f} ms  405 {scenario['not_allowed_ms']:6.3f} ms  "
+              f"lazy {scenario['lazy_import_ms']:7.1f} ms  heavy in import: {heavy or '-'}  "
+              f"loaded by preflight: {', '.join(scenario['heavy_after_preflight']) or '-'}")
+    
+    output_path = args.output or os.path.join(HERE, 'results', f"coldstart-{revision['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'saved {output_path}')
+    
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
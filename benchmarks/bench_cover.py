@@ -0,0 +1,123 @@
+'''
+Обработка обложки: прежний process_cover против cover.py (одно декодирование, draft, JPEG, кеш по хешу).
+Каждый вариант запускается в отдельном процессе, чтобы пиковый RSS не смешивался.
+Запуск: python benchmarks/bench_cover.py [--megapixels 24] [--repeat 5]
+'''
+import argparse
+import base64
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'generate-contract'))
+
+from PIL import Image  # noqa: E402
+
+
+def make_cover(megapixels: float) -> bytes:
+    '''Синтетическая обложка: шум поверх градиента, сжимается примерно как фотография'''
+    side = int((megapixels * 1_000_000) ** 0.5)
+    noise = Image.effect_noise((side, side), 40).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((side, side)).convert('RGB')
+    img = Image.blend(noise, gradient, 0.5)
+    img_io = io.BytesIO()
+    img.save(img_io, format='JPEG', quality=92)
+    return img_io.getvalue()
+
+
+def legacy_process(cover_image_b64: str) -> int:
+    '''Копия прежнего пути: 150x150 PNG из полного RGB-декодирования плюс второй b64decode для Telegram'''
+    img_data = base64.b64decode(cover_image_b64)
+    img = Image.open(io.BytesIO(img_data))
+    img = img.convert('RGB')
+    img_resized = img.resize((150, 150), Image.LANCZOS)
+    img_io = io.BytesIO()
+    img_resized.save(img_io, format='PNG')
+    base64.b64decode(cover_image_b64)
+    return len(img_io.getvalue())
+
+
+def pipeline_process(cover_image_b64: str) -> int:
+    from cover import load_cover
+    
+    cover = load_cover({'cover_image': cover_image_b64})
+    embedded = cover.embedded()
+    cover.upload()
+    return len(embedded)
+
+
+def peak_rss_kib() -> int:
+    '''Пиковый RSS процесса; VmHWM, в отличие от ru_maxrss, не наследуется от родителя через exec'''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_variant(variant: str, path: str, repeat: int):
+    '''Выполняется в дочернем процессе: замер латентности и пикового RSS'''
+    with open(path, 'rb') as f:
+        cover_image_b64 = base64.b64encode(f.read()).decode()
+    
+    process = legacy_process if variant == 'legacy' else pipeline_process
+    rss_before = peak_rss_kib()
+    
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = process(cover_image_b64)
+        timings.append((time.perf_counter() - started) * 1000)
+    
+    result = {
+        'variant': variant,
+        'first_ms': round(timings[0], 1),
+        'repeat_ms': round(sorted(timings[1:])[len(timings[1:]) // 2], 2) if len(timings) > 1 else None,
+        'embedded_bytes': size,
+        'peak_rss_mib': round(peak_rss_kib() / 1024, 1),
+        'rss_growth_mib': round((peak_rss_kib() - rss_before) / 1024, 1)
+    }
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--megapixels', type=float, default=24)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--variant')
+    parser.add_argument('--path')
+    args = parser.parse_args()
+    
+    if args.variant:
+        run_variant(args.variant, args.path, args.repeat)
+        return
+    
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cover_bench.jpg')
+    with open(path, 'wb') as f:
+        f.write(make_cover(args.megapixels))
+    print(f'cover: {args.megapixels} MP, {os.path.getsize(path) / 1024 / 1024:.1f} MiB JPEG')
+    
+    try:
+        for variant in ('legacy', 'pipeline'):
+            output = subprocess.check_output([
+                sys.executable, __file__, '--variant', variant, '--path', path, '--repeat', str(args.repeat)
+            ])
+            result = json.loads(output.decode().strip().splitlines()[-1])
+            repeat_ms = f"{result['repeat_ms']:8.2f} ms" if result['repeat_ms'] is not None else '       -'
+            print(f"{variant:8}  first {result['first_ms']:8.1f} ms  repeat {repeat_ms}  "
+                  f"embedded {result['embedded_bytes'] / 1024:6.1f} KiB  "
+                  f"peak RSS {result['peak_rss_mib']:7.1f} MiB (+{result['rss_growth_mib']} MiB)")
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+'''
+Сквозной бенчмарк generate-contract: handler целиком против заглушки БД (fakedb.py),
+затем deliver-outbox отправляет очередь в локальную заглушку Telegram (telegram_stub.py).
+Сценарии - шаблоны разного размера (колонтитулы, таблицы, плейсхолдеры, разбитые по run)
+и обложки разного разрешения. Каждый сценарий выполняется в отдельном процессе.
+Результат - JSON с p50/p95/p99, пропускной способностью и пиковой памятью;
+--compare сравнивает с сохраненным прогоном другого коммита.
+Запуск: python benchmarks/bench_handler.py [--pages 1,10,100] [--covers 0,2,24] [--repeat 20]
+                                           [--output results.json] [--compare old.json]
+'''
+import argparse
+import base64
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.join(HERE, '..', 'backend')
+
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_per_s', 'peak_rss_mib')
+
+
+def percentile(values: List[float], pct: float) -> float:
+    '''Перцентиль с линейной интерполяцией'''
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_kib() -> int:
+    '''Пиковый RSS процесса (VmHWM не наследуется от родителя через exec, в отличие от ru_maxrss)'''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def load_function(name: str, directory: str) -> Any:
+    '''У всех функций модуль называется index, поэтому грузим по пути под уникальным именем'''
+    function_dir = os.path.join(BACKEND, directory)
+    if function_dir not in sys.path:
+        sys.path.insert(0, function_dir)
+    spec = importlib.util.spec_from_file_location(name, os.path.join(function_dir, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def prepare_inputs(workdir: str, pages: List[int], covers: List[float], tables: int, raw: bool) -> Dict[str, Any]:
+    '''Шаблоны и обложки собираются в родительском процессе, чтобы не влиять на память сценария'''
+    sys.path.insert(0, HERE)
+    from templates import build_template
+    
+    compile_template = None
+    if not raw:
+        spec = importlib.util.spec_from_file_location('upload_compiler', os.path.join(BACKEND, 'upload-template', 'compiler.py'))
+        compiler = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(compiler)
+        compile_template = compiler.compile_template
+    
+    inputs: Dict[str, Any] = {'templates': {}, 'covers': {}}
+    for page_count in pages:
+        template = build_template(pages=page_count, tables_per_page=tables)
+        entry = {'path': os.path.join(workdir, f'template_{page_count}.docx'), 'bytes': len(template)}
+        with open(entry['path'], 'wb') as f:
+            f.write(template)
+        if compile_template is not None:
+            compiled, placeholders = compile_template(template)
+            entry['compiled_path'] = entry['path'] + '.compiled'
+            with open(entry['compiled_path'], 'wb') as f:
+                f.write(compiled)
+            with open(entry['compiled_path'] + '.json', 'w') as f:
+                json.dump(placeholders, f)
+        inputs['templates'][page_count] = entry
+    
+    sys.path.insert(0, HERE)
+    from bench_cover import make_cover
+    for megapixels in covers:
+        if not megapixels:
+            continue
+        path = os.path.join(workdir, f'cover_{megapixels}mp.jpg')
+        with open(path, 'wb') as f:
+            f.write(make_cover(megapixels))
+        inputs['covers'][megapixels] = path
+    return inputs
+
+
+def run_scenario(args: argparse.Namespace):
+    '''Выполняется в дочернем процессе: один шаблон, одна обложка, repeat вызовов handler'''
+    sys.path.insert(0, HERE)
+    from fakedb import FakeDatabase
+    from telegram_stub import TelegramStub
+    from templates import sample_payload
+    
+    with open(args.template, 'rb') as f:
+        template = f.read()
+    compiled = None
+    if args.compiled:
+        with open(args.compiled, 'rb') as f, open(args.compiled + '.json') as placeholders_file:
+            compiled = (f.read(), json.load(placeholders_file))
+    cover = b''
+    if args.cover:
+        with open(args.cover, 'rb') as f:
+            cover = f.read()
+    
+    stub = TelegramStub(args.telegram_latency)
+    os.environ['TELEGRAM_API_URL'] = stub.start()
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'bench')
+    os.environ.setdefault('TELEGRAM_CHAT_ID', '1')
+    os.environ['DATABASE_URL'] = 'fake'
+    os.environ['TRACE_SAMPLE_RATE'] = '0'
+    # Лимиты Bot API (1 сообщение в секунду в чат) превратили бы замер доставки в замер ожидания;
+    # реальные лимиты можно вернуть, выставив переменные окружения перед запуском
+    os.environ.setdefault('TELEGRAM_GLOBAL_RATE', '100000')
+    os.environ.setdefault('TELEGRAM_PER_CHAT_RATE', '100000')
+    os.environ.setdefault('TELEGRAM_PER_CHAT_BURST', '100000')
+    
+    import psycopg2
+    db = FakeDatabase(template, compiled, spill_dir=os.path.dirname(args.template))
+    psycopg2.connect = db.connect
+    
+    generate = load_function('generate_contract_index', 'generate-contract')
+    deliver = load_function('deliver_outbox_index', 'deliver-outbox')
+    
+    class Context:
+        request_id = 'bench'
+    
+    rss_before = peak_rss_kib()
+    timings = []
+    failures = 0
+    wall_started = time.perf_counter()
+    for iteration in range(args.repeat):
+        payload = sample_payload()
+        if cover:
+            # Хвост после маркера конца JPEG декодер игнорирует, а хеш меняется: кеш обложек не срабатывает
+            payload['cover_image'] = base64.b64encode(cover + iteration.to_bytes(4, 'big')).decode()
+            payload['cover_image_name'] = 'cover.jpg'
+        # Свой ключ на итерацию: тело одинаковое, а замерить нужно рендер, а не повтор
+        event = {'httpMethod': 'POST', 'headers': {'Idempotency-Key': f'bench-{os.getpid()}-{iteration}'},
+                 'body': json.dumps(payload, ensure_ascii=False)}
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            response = generate.handler(event, Context())
+            timings.append((time.perf_counter() - started) * 1000)
+        if response['statusCode'] != 200:
+            failures += 1
+            print(response['body'], file=sys.stderr)
+    wall_ms = (time.perf_counter() - wall_started) * 1000
+    generate_peak = peak_rss_kib()
+    
+    # Повтор последнего запроса отвечает сохраненным результатом без рендера
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        replay = generate.handler(event, Context())
+        replay_ms = (time.perf_counter() - started) * 1000
+    if replay['headers'].get('Idempotent-Replayed') != 'true':
+        failures += 1
+        print('replay was not served from the idempotency table', file=sys.stderr)
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        delivered = json.loads(deliver.handler({'httpMethod': 'GET'}, Context())['body'])
+        deliver_ms = (time.perf_counter() - started) * 1000
+    stub.stop()
+    
+    # Первый вызов холодный (кеш шаблона, импорт), поэтому перцентили считаются без него
+    warm = timings[1:] or timings
+    result = {
+        'pages': args.pages,
+        'cover_mp': args.cover_mp,
+        'template_bytes': len(template),
+        'compiled': compiled is not None,
+        'repeat': args.repeat,
+        'failures': failures,
+        'first_ms': round(timings[0], 2),
+        'p50_ms': round(percentile(warm, 50), 2),
+        'p95_ms': round(percentile(warm, 95), 2),
+        'p99_ms': round(percentile(warm, 99), 2),
+        'mean_ms': round(statistics.mean(warm), 2),
+        'replay_ms': round(replay_ms, 2),
+        'throughput_per_s': round(len(timings) / (wall_ms / 1000), 2),
+        'peak_rss_mib': round(generate_peak / 1024, 1),
+        'rss_growth_mib': round((generate_peak - rss_before) / 1024, 1),
+        'deliver': {
+            'ms': round(deliver_ms, 2),
+            'sent': delivered.get('sent_count'),
+            'telegram_calls': dict(stub.calls),
+            'uploaded_mib': round(stub.bytes_received / 1024 / 1024, 2),
+            'peak_rss_mib': round(peak_rss_kib() / 1024, 1)
+        },
+        'queries': db.queries
+    }
+    print(json.dumps(result))
+
+
+def git_revision() -> Dict[str, Any]:
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE).decode().strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--', '../backend'], cwd=HERE).strip())
+        return {'commit': commit, 'dirty': dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def compare(current: Dict[str, Any], previous_path: str):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    
+    before = {(s['pages'], s['cover_mp']): s for s in previous['scenarios']}
+    print(f"\nvs {previous.get('commit')} ({previous_path}):")
+    for scenario in current['scenarios']:
+        old = before.get((scenario['pages'], scenario['cover_mp']))
+        if old is None:
+            continue
+        deltas = []
+        for metric in COMPARED_METRICS:
+            if old.get(metric):
+                deltas.append(f"{metric} {(scenario[metric] - old[metric]) / old[metric] * 100:+6.1f}%")
+        print(f"  pages={scenario['pages']:<4} cover={scenario['cover_mp']:<4} " + '  '.join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', default='1,10,100')
+    parser.add_argument('--covers', default='0,2,24', help='мегапиксели обложки через запятую, 0 - без обложки')
+    parser.add_argument('--tables', type=int, default=3, help='таблиц на страницу')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--raw', action='store_true', help='без компиляции шаблона при загрузке')
+    parser.add_argument('--telegram-latency', type=float, default=0, help='задержка ответа заглушки Telegram, мс')
+    parser.add_argument('--output', help='куда сохранить JSON (по умолчанию benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+    # Параметры дочернего процесса
+    parser.add_argument('--scenario', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--template', help=argparse.SUPPRESS)
+    parser.add_argument('--compiled', help=argparse.SUPPRESS)
+    parser.add_argument('--cover', help=argparse.SUPPRESS)
+    parser.add_argument('--cover-mp', type=float, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.scenario:
+        args.pages = int(args.pages)
+        run_scenario(args)
+        return
+    
+    pages = [int(value) for value in args.pages.split(',')]
+    covers = [float(value) for value in args.covers.split(',')]
+    revision = git_revision()
+    report: Dict[str, Any] = {
+        **revision,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'repeat': args.repeat, 'tables_per_page': args.tables, 'compiled': not args.raw,
+                     'telegram_latency_ms': args.telegram_latency},
+        'scenarios': []
+    }
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        inputs = prepare_inputs(workdir, pages, covers, args.tables, args.raw)
+        for page_count in pages:
+            template = inputs['templates'][page_count]
+            for megapixels in covers:
+                command = [sys.executable, os.path.abspath(__file__), '--scenario', '--pages', str(page_count),
+                           '--template', template['path'], '--repeat', str(args.repeat), '--cover-mp', str(megapixels),
+                           '--telegram-latency', str(args.telegram_latency)]
+                if 'compiled_path' in template:
+                    command += ['--compiled', template['compiled_path']]
+                if megapixels:
+                    command += ['--cover', inputs['covers'][megapixels]]
+                output = subprocess.check_output(command)
+                scenario = json.loads(output.decode().strip().splitlines()[-1])
+                report['scenarios'].append(scenario)
+                print(f"pages={page_count:<4} cover={megapixels:<4} first {scenario['first_ms']:8.1f} ms  "
+                      f"p50 {scenario['p50_ms']:8.1f}  p95 {scenario['p95_ms']:8.1f}  p99 {scenario['p99_ms']:8.1f} ms  "
+                      f"{scenario['throughput_per_s']:7.1f}/s  peak RSS {scenario['peak_rss_mib']:6.1f} MiB  "
+                      f"replay {scenario['replay_ms']:6.1f} ms  deliver {scenario['deliver']['ms']:7.1f} ms")
+    
+    output_path = args.output or os.path.join(HERE, 'results', f"{revision['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'saved {output_path}')
+    
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
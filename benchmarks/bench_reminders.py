@@ -0,0 +1,89 @@
+'''
+Рассылка send-reminders: N наступивших напоминаний (у каждого свой чат) через заглушку Bot API
+с задержкой ответа. Меряется время рассылки при разном числе потоков, отправленные, не отправленные,
+ожидания ведер и ответы 429. Лимиты Bot API по умолчанию боевые: 30 сообщений в секунду на бота.
+После каждого прогона функция вызывается еще раз, как повторный cron: журнал доставки не должен дать ни одной
+второй отправки.
+Запуск: python benchmarks/bench_reminders.py [--reminders 300] [--latency 150] [--concurrency 1,8,16] [--flood-rate 0]
+'''
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from bench_handler import load_function  # noqa: E402
+
+
+class Context:
+    request_id = 'bench-reminders'
+
+
+def seed(db, count: int):
+    '''count напоминаний, наступивших минуту назад, по одному на чат'''
+    due = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1)
+    db.deliveries = {}
+    db.snoozes = []
+    db.reminders = [
+        {'id': n, 'user_id': 100000 + n, 'title': '💧 Попей воды', 'description': 'Стакан воды',
+         'is_active': True, 'next_fire_at': due}
+        for n in range(1, count + 1)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reminders', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=150, help='задержка ответа заглушки, мс')
+    parser.add_argument('--concurrency', default='1,8,16')
+    parser.add_argument('--flood-rate', type=float, default=0, help='заглушка отвечает 429 сверх стольких запросов в секунду')
+    parser.add_argument('--global-rate', default='30', help='TELEGRAM_GLOBAL_RATE')
+    args = parser.parse_args()
+
+    from fakedb import FakeDatabase
+    from telegram_stub import TelegramStub
+    from templates import build_template
+
+    stub = TelegramStub(args.latency, args.flood_rate)
+    os.environ['TELEGRAM_API_URL'] = stub.start()
+    os.environ['TELEGRAM_GLOBAL_RATE'] = args.global_rate
+    os.environ['DATABASE_URL'] = 'fake'
+
+    import psycopg2
+    db = FakeDatabase(build_template(1, 0), None)
+    psycopg2.connect = db.connect
+
+    reminders = load_function('send_reminders_index', 'send-reminders')
+
+    for concurrency in [int(value) for value in args.concurrency.split(',')]:
+        seed(db, args.reminders)
+        reminders.SEND_CONCURRENCY = concurrency
+        # Новый токен - новый клиент с полными ведрами, прогоны не делят лимиты
+        os.environ['TELEGRAM_BOT_TOKEN'] = f'bench-{concurrency}'
+        rejected_before = stub.rejected
+        calls_before = stub.calls.get('sendMessage', 0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = reminders.handler({'httpMethod': 'GET'}, Context())
+            repeat = reminders.handler({'httpMethod': 'GET'}, Context())
+        body = json.loads(response['body'])
+        if not body.get('success'):
+            raise SystemExit(f'send-reminders failed: {body}')
+        repeat_body = json.loads(repeat['body'])
+        delivered = stub.calls.get('sendMessage', 0) - calls_before
+        if repeat_body.get('sent_count') or delivered != body['sent_count']:
+            raise SystemExit(f'duplicate sends: {delivered} messages for {body["sent_count"]} reminders, repeat run {repeat_body}')
+        print(f"concurrency={concurrency:<3} reminders={args.reminders:<5} wall {body['elapsed_ms'] / 1000:7.2f} s  "
+              f"{body['sent_count'] / max(body['elapsed_ms'] / 1000, 1e-9):6.1f} msg/s  sent {body['sent_count']:<5} "
+              f"failed {body['failed_count']:<4} retry {body['retry_count']:<4} throttled {body['throttled_count']:<5} "
+              f"429 {body['rate_limited_count']:<4} (stub rejected {stub.rejected - rejected_before})")
+
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+'''
+Сравнение рендереров generate-contract: потоковый ooxml_renderer против python-docx.
+Сначала проверяет XML-эквивалентность результатов (ненулевой код выхода при расхождении),
+затем меряет время и пиковую память (tracemalloc).
+Запуск: python benchmarks/bench_renderer.py [--pages 10] [--repeat 20]
+'''
+import argparse
+import importlib.util
+import io
+import re
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import zipfile
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', 'backend')
+sys.path.insert(0, os.path.join(ROOT, 'generate-contract'))
+
+from docx import Document  # noqa: E402
+from lxml import etree  # noqa: E402
+from PIL import Image  # noqa: E402
+from contract import render_with_python_docx  # noqa: E402
+from ooxml_renderer import render_docx  # noqa: E402
+from template_cache import CachedTemplate  # noqa: E402
+from templates import build_template, sample_replacements  # noqa: E402
+
+# У функций одинаковые имена модулей (index), поэтому компилятор грузим по пути
+_spec = importlib.util.spec_from_file_location('upload_compiler', os.path.join(ROOT, 'upload-template', 'compiler.py'))
+_compiler = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_compiler)
+compile_template = _compiler.compile_template
+
+COMPARED = re.compile(r'^word/((document|header\d*|footer\d*)\.xml|_rels/(document|header\d*|footer\d*)\.xml\.rels|media/.*)$')
+
+
+def cover_png() -> bytes:
+    output = io.BytesIO()
+    Image.new('RGB', (150, 150), (200, 40, 40)).save(output, format='PNG')
+    return output.getvalue()
+
+
+def canonical(data: bytes) -> bytes:
+    return etree.tostring(etree.fromstring(data), method='c14n')
+
+
+def package_view(docx: bytes) -> dict:
+    '''Содержимое пакета в сравнимом виде: XML в C14N, бинарные части как есть'''
+    view = {}
+    with zipfile.ZipFile(io.BytesIO(docx)) as archive:
+        assert archive.testzip() is None
+        for name in archive.namelist():
+            data = archive.read(name)
+            view[name] = canonical(data) if name.endswith(('.xml', '.rels')) else data
+    return view
+
+
+def check_equivalence(template: CachedTemplate, replacements: dict, cover) -> list:
+    streamed, stream_sub = render_docx(template.data, template.placeholders, dict(replacements), cover)
+    reference, docx_sub = render_with_python_docx(template, dict(replacements), cover)
+    Document(io.BytesIO(streamed))
+    
+    problems = []
+    if stream_sub.report.as_dict() != docx_sub.report.as_dict():
+        problems.append(f'reports differ: {stream_sub.report.as_dict()} != {docx_sub.report.as_dict()}')
+    
+    ours, theirs = package_view(streamed), package_view(reference)
+    for name in sorted(set(ours) | set(theirs)):
+        if COMPARED.match(name) and ours.get(name) != theirs.get(name):
+            problems.append(f'{name} differs')
+    
+    # python-docx пересобирает [Content_Types].xml целиком, поэтому сравниваем множества записей
+    entries = [{tuple(sorted(e.attrib.items())) for e in etree.fromstring(view['[Content_Types].xml'])}
+               for view in (ours, theirs)]
+    if entries[0] != entries[1]:
+        problems.append('[Content_Types].xml differs')
+    return problems
+
+
+def measure(render, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    render()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    return {
+        'p50_ms': statistics.median(timings) * 1000,
+        'p99_ms': timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000,
+        'peak_kb': peak / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    
+    raw = build_template(args.pages)
+    compiled_data, placeholders = compile_template(raw)
+    variants = {
+        'raw': CachedTemplate(raw, None),
+        'compiled': CachedTemplate(compiled_data, placeholders)
+    }
+    replacements = sample_replacements(7)
+    cover = cover_png()
+    
+    failed = False
+    for label, template in variants.items():
+        for with_cover in (True, False):
+            values = dict(replacements)
+            if not with_cover:
+                values['{{img}}'] = ''
+            problems = check_equivalence(template, values, cover if with_cover else None)
+            status = 'OK' if not problems else 'MISMATCH ' + '; '.join(problems)
+            print(f'equivalence {label:8} cover={with_cover!s:5}: {status}')
+            failed = failed or bool(problems)
+    
+    for label, template in variants.items():
+        stream = measure(lambda: render_docx(template.data, template.placeholders, dict(replacements), cover), args.repeat)
+        docx = measure(lambda: render_with_python_docx(template, dict(replacements), cover), args.repeat)
+        for name, result in (('stream', stream), ('python-docx', docx)):
+            print(f'{label:8} {name:11} p50 {result["p50_ms"]:7.1f} ms  p99 {result["p99_ms"]:7.1f} ms  '
+                  f'peak {result["peak_kb"]:8.0f} KiB')
+    
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
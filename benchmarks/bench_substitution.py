@@ -0,0 +1,108 @@
+'''
+Микробенчмарк подстановки плейсхолдеров: старый replace_in_paragraph против Substitution.
+Запуск: python benchmarks/bench_substitution.py [--pages 50] [--repeat 5]
+'''
+import argparse
+import copy
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'generate-contract'))
+
+from docx import Document  # noqa: E402
+from substitution import Substitution  # noqa: E402
+from templates import build_template, sample_replacements  # noqa: E402
+
+
+def legacy_replace_in_paragraph(paragraph, replacements):
+    '''Копия прежней реализации из generate-contract (без ветки {{img}})'''
+    full_text = paragraph.text
+    
+    has_replacements = False
+    for key, value in replacements.items():
+        if key in full_text:
+            full_text = full_text.replace(key, value)
+            has_replacements = True
+    
+    if has_replacements:
+        base_run_font = None
+        for run in paragraph.runs:
+            if not run.font.bold and run.text.strip():
+                base_run_font = run.font
+                break
+        
+        if not base_run_font and paragraph.runs:
+            base_run_font = paragraph.runs[0].font
+        
+        for run in paragraph.runs:
+            run.text = ''
+        
+        if paragraph.runs and base_run_font:
+            paragraph.runs[0].text = full_text
+            paragraph.runs[0].font.bold = False
+            paragraph.runs[0].font.italic = base_run_font.italic
+            paragraph.runs[0].font.underline = base_run_font.underline
+            paragraph.runs[0].font.size = base_run_font.size
+            paragraph.runs[0].font.name = base_run_font.name
+        elif paragraph.runs:
+            paragraph.runs[0].text = full_text
+
+
+def run_legacy(doc, replacements):
+    for paragraph in doc.paragraphs:
+        legacy_replace_in_paragraph(paragraph, replacements)
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                for paragraph in cell.paragraphs:
+                    legacy_replace_in_paragraph(paragraph, replacements)
+    for section in doc.sections:
+        for paragraph in section.header.paragraphs:
+            legacy_replace_in_paragraph(paragraph, replacements)
+        for paragraph in section.footer.paragraphs:
+            legacy_replace_in_paragraph(paragraph, replacements)
+
+
+def run_engine(doc, replacements):
+    substitution = Substitution(replacements)
+    for part in doc.part.package.iter_parts():
+        name = str(part.partname)
+        if name == '/word/document.xml' or name.startswith('/word/header') or name.startswith('/word/footer'):
+            substitution.part(part.element, part)
+    return substitution.report
+
+
+def measure(fn, pristine, replacements, repeat):
+    timings = []
+    for _ in range(repeat):
+        doc = copy.deepcopy(pristine)
+        started = time.perf_counter()
+        fn(doc, replacements)
+        timings.append(time.perf_counter() - started)
+    return min(timings), sum(timings) / len(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    pristine = Document(io.BytesIO(build_template(args.pages)))
+    replacements = sample_replacements(1)
+    
+    legacy_best, legacy_avg = measure(run_legacy, pristine, replacements, args.repeat)
+    engine_best, engine_avg = measure(run_engine, pristine, replacements, args.repeat)
+    
+    report = run_engine(copy.deepcopy(pristine), replacements)
+    print(f'pages={args.pages} paragraphs={len(pristine.paragraphs)}')
+    print(f'legacy replace_in_paragraph: best {legacy_best * 1000:.1f} ms, avg {legacy_avg * 1000:.1f} ms')
+    print(f'Substitution engine:         best {engine_best * 1000:.1f} ms, avg {engine_avg * 1000:.1f} ms')
+    print(f'speedup (best): x{legacy_best / engine_best:.1f}')
+    print(f'report: {report.as_dict()}')
+
+
+if __name__ == '__main__':
+    main()
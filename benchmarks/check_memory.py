@@ -0,0 +1,149 @@
+'''
+Бюджет пиковой памяти generate-contract и deliver-outbox на эталонных шаблоне и обложке (tracemalloc).
+Считаются Python-аллокации за время одного вызова handler: копии BYTEA, base64, буферы DOCX,
+экранирование BYTEA в тексте запроса (fakedb повторяет psycopg2) и тело multipart для Telegram.
+Пиксели PIL и буферы libpq живут вне аллокатора Python и в замер не входят.
+Тело события собирается до замера: его держит среда выполнения, а не функция.
+Превышение бюджета - код выхода 1, поэтому скрипт годится как проверка перед коммитом.
+Запуск: python benchmarks/check_memory.py [--pages 100] [--cover-mp 12] [--generate-budget 3.0] [--deliver-budget 1.5]
+'''
+import argparse
+import base64
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from typing import Any, Callable, Dict, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from bench_handler import load_function, prepare_inputs  # noqa: E402
+
+MIB = 1024 * 1024
+
+
+class Context:
+    request_id = 'check-memory'
+
+
+def traced_peak(call: Callable[[], Any]) -> Tuple[Any, int]:
+    '''Результат вызова и пик Python-аллокаций сверх памяти, занятой до него'''
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = call()
+    return result, tracemalloc.get_traced_memory()[1] - before
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--cover-mp', type=float, default=12)
+    parser.add_argument('--mode', default='separate', choices=('separate', 'media_group'),
+                        help='TELEGRAM_DELIVERY_MODE')
+    parser.add_argument('--generate-budget', type=float, default=3.0,
+                        help='пик generate-contract в долях размера обложки плюс шаблона')
+    parser.add_argument('--deliver-budget', type=float, default=1.5,
+                        help='пик deliver-outbox в долях размера отправленных файлов')
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    inputs = prepare_inputs(workdir, [args.pages], [args.cover_mp], 3, False)
+    template_entry = inputs['templates'][args.pages]
+    with open(template_entry['path'], 'rb') as f:
+        template = f.read()
+    with open(template_entry['compiled_path'], 'rb') as f, open(template_entry['compiled_path'] + '.json') as placeholders:
+        compiled = (f.read(), json.load(placeholders))
+    with open(inputs['covers'][args.cover_mp], 'rb') as f:
+        cover = f.read()
+    
+    from fakedb import FakeDatabase
+    from telegram_stub import TelegramStub
+    from templates import sample_payload
+    
+    stub = TelegramStub()
+    os.environ['TELEGRAM_API_URL'] = stub.start()
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'check')
+    os.environ.setdefault('TELEGRAM_CHAT_ID', '1')
+    os.environ['TELEGRAM_DELIVERY_MODE'] = args.mode
+    os.environ['DATABASE_URL'] = 'fake'
+    os.environ['TRACE_SAMPLE_RATE'] = '0'
+    os.environ['TELEGRAM_GLOBAL_RATE'] = '100000'
+    os.environ['TELEGRAM_PER_CHAT_RATE'] = '100000'
+    os.environ['TELEGRAM_PER_CHAT_BURST'] = '100000'
+    
+    import psycopg2
+    # Очередь хранится на диске: в настоящей базе она вне процесса функции
+    db = FakeDatabase(template, compiled, spill_dir=workdir)
+    psycopg2.connect = db.connect
+    
+    generate = load_function('generate_contract_index', 'generate-contract')
+    deliver = load_function('deliver_outbox_index', 'deliver-outbox')
+    
+    def event(iteration: int) -> Dict[str, Any]:
+        payload = sample_payload()
+        # Хвост после маркера конца JPEG меняет хеш: кеш обработанных обложек не срабатывает
+        payload['cover_image'] = base64.b64encode(cover + iteration.to_bytes(4, 'big')).decode()
+        payload['cover_image_name'] = 'cover.jpg'
+        return {'httpMethod': 'POST', 'headers': {'Idempotency-Key': f'check-{iteration}'},
+                'body': json.dumps(payload, ensure_ascii=False)}
+    
+    # Прогрев: импорты библиотек и соединения не относятся к пику одного запроса
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate.handler(event(0), Context())
+        deliver.handler({'httpMethod': 'GET'}, Context())
+    # Кеш шаблона сбрасывается, чтобы замер включал чтение BYTEA из базы
+    sys.modules['template_cache']._cached.clear()
+    
+    tracemalloc.start()
+    request = event(1)
+    response, generate_peak = traced_peak(lambda: generate.handler(request, Context()))
+    uploaded_before = stub.bytes_received
+    delivered, deliver_peak = traced_peak(lambda: deliver.handler({'httpMethod': 'GET'}, Context()))
+    tracemalloc.stop()
+    stub.stop()
+    
+    inputs_bytes = len(cover) + len(compiled[0])
+    uploaded = stub.bytes_received - uploaded_before
+    result = {
+        'pages': args.pages,
+        'cover_mp': args.cover_mp,
+        'mode': args.mode,
+        'cover_mib': round(len(cover) / MIB, 2),
+        'template_mib': round(len(compiled[0]) / MIB, 2),
+        'generate': {
+            'status': response['statusCode'],
+            'peak_mib': round(generate_peak / MIB, 2),
+            'ratio': round(generate_peak / inputs_bytes, 2),
+            'budget': args.generate_budget
+        },
+        'deliver': {
+            'sent': json.loads(delivered['body']).get('sent_count'),
+            'uploaded_mib': round(uploaded / MIB, 2),
+            'peak_mib': round(deliver_peak / MIB, 2),
+            'ratio': round(deliver_peak / max(uploaded, 1), 2),
+            'budget': args.deliver_budget
+        }
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    
+    failures = []
+    if response['statusCode'] != 200:
+        failures.append(f"generate-contract answered {response['statusCode']}: {response['body']}")
+    if not result['deliver']['sent']:
+        failures.append('deliver-outbox sent nothing')
+    if generate_peak > args.generate_budget * inputs_bytes:
+        failures.append(f"generate-contract peak {result['generate']['ratio']}x > budget {args.generate_budget}x")
+    if deliver_peak > args.deliver_budget * uploaded:
+        failures.append(f"deliver-outbox peak {result['deliver']['ratio']}x > budget {args.deliver_budget}x")
+    for failure in failures:
+        print(f'FAIL: {failure}', file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+'''
+Шарды send-reminders против одной базы (fakedb) и заглушки Bot API. Функция поднимается за локальным
+HTTP-сервером, как на платформе: координатор рассылает вызовы шардов на REMINDERS_SELF_URL, и каждый
+вызов идет в handler в своем потоке. Кроме регулярных напоминаний в базе лежат наступившие отложенные
+(«Напомнить позже») у других пользователей - шарды забирают их тем же проходом. Два координатора запускаются одновременно (cron наложился сам на себя),
+плюс занятый шард проверяется отдельно. Проверяется, что каждый чат получил ровно одно сообщение,
+каждый шард отправил только своих пользователей, а занятый шард не обрабатывается вторым вызовом.
+Ошибка - код выхода 1.
+Запуск: python benchmarks/check_shards.py [--shards 4] [--reminders 200] [--snoozes 50] [--latency 50]
+'''
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import sys
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qsl, urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from bench_handler import load_function  # noqa: E402
+from bench_reminders import seed  # noqa: E402
+
+
+def seed_snoozes(db, count: int):
+    '''count отложенных срабатываний, наступивших минуту назад, у пользователей без наступивших регулярных'''
+    now = datetime.datetime.now(datetime.timezone.utc)
+    first = len(db.reminders) + 1
+    for n in range(count):
+        reminder = {'id': first + n, 'user_id': 200000 + n, 'title': '📖 Почитай книгу', 'description': None,
+                    'is_active': True, 'next_fire_at': now + datetime.timedelta(hours=1)}
+        db.reminders.append(reminder)
+        db.snoozes.append({'reminder_id': reminder['id'], 'user_id': reminder['user_id'],
+                           'fire_at': now - datetime.timedelta(minutes=1)})
+
+
+class Context:
+    def __init__(self):
+        self.request_id = uuid.uuid4().hex
+
+
+def serve(function: Any) -> ThreadingHTTPServer:
+    '''Локальная «платформа»: GET ?query -> handler(event) в потоке на запрос'''
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            params = dict(parse_qsl(urlsplit(self.path).query))
+            response = function.handler({'httpMethod': 'GET', 'queryStringParameters': params}, Context())
+            body = response['body'].encode()
+            self.send_response(response['statusCode'])
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--reminders', type=int, default=200)
+    parser.add_argument('--snoozes', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=50, help='задержка ответа заглушки, мс')
+    parser.add_argument('--global-rate', default='30', help='TELEGRAM_GLOBAL_RATE на всех шардов вместе')
+    args = parser.parse_args()
+    
+    from fakedb import FakeDatabase, _shard_of
+    from telegram_stub import TelegramStub
+    from templates import build_template
+    
+    stub = TelegramStub(args.latency)
+    os.environ['TELEGRAM_API_URL'] = stub.start()
+    os.environ['TELEGRAM_GLOBAL_RATE'] = args.global_rate
+    os.environ['TELEGRAM_BOT_TOKEN'] = 'check-shards'
+    os.environ['DATABASE_URL'] = 'fake'
+    os.environ['REMINDERS_SHARDS'] = str(args.shards)
+    
+    import psycopg2
+    db = FakeDatabase(build_template(1, 0), None)
+    psycopg2.connect = db.connect
+    seed(db, args.reminders)
+    seed_snoozes(db, args.snoozes)
+    
+    reminders = load_function('send_reminders_index', 'send-reminders')
+    server = serve(reminders)
+    # Порт известен только после старта сервера; fan_out читает SELF_URL при каждом вызове
+    sys.modules['shards'].SELF_URL = f'http://127.0.0.1:{server.server_port}'
+    
+    failures: List[str] = []
+    
+    # Занятый шард: аренду держит «другой вызов», этот должен уйти, ничего не отправив
+    db.shard_locks[(args.shards, 0)] = {
+        'owner': 'other', 'locked_until': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=1)
+    }
+    with contextlib.redirect_stdout(io.StringIO()):
+        busy = json.loads(reminders.handler(
+            {'httpMethod': 'GET', 'queryStringParameters': {'shard_index': '0', 'shard_count': str(args.shards)}},
+            Context())['body'])
+    if not busy.get('busy') or stub.chats:
+        failures.append(f'shard 0 held by another call was processed: {busy}')
+    del db.shard_locks[(args.shards, 0)]
+    
+    # Два координатора одновременно: каждый шард вызывается дважды
+    results: List[Dict[str, Any]] = []
+    
+    def coordinate():
+        response = reminders.handler({'httpMethod': 'GET'}, Context())
+        results.append(json.loads(response['body']))
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        runs = [threading.Thread(target=coordinate) for _ in range(2)]
+        for run in runs:
+            run.start()
+        for run in runs:
+            run.join()
+    server.shutdown()
+    stub.stop()
+    
+    expected = {100000 + n for n in range(1, args.reminders + 1)} | {200000 + n for n in range(args.snoozes)}
+    duplicates = {chat: count for chat, count in stub.chats.items() if count > 1}
+    missed = expected - set(stub.chats)
+    sent = sum(result.get('sent_count', 0) for result in results)
+    per_shard = [0] * args.shards
+    for result in results:
+        for shard in result.get('shards', []):
+            per_shard[shard['shard_index']] += shard.get('sent_count', 0)
+    expected_per_shard = [0] * args.shards
+    for chat in expected:
+        expected_per_shard[_shard_of(chat, args.shards)] += 1
+    
+    print(json.dumps({
+        'shards': args.shards,
+        'reminders': args.reminders,
+        'snoozes': args.snoozes,
+        'sent': sent,
+        'messages': sum(stub.chats.values()),
+        'sent_per_shard': per_shard,
+        'expected_per_shard': expected_per_shard,
+        'busy_shards': [result.get('busy_shards') for result in results],
+        'elapsed_ms': [result.get('elapsed_ms') for result in results]
+    }, indent=2))
+    
+    if not all(result.get('success') for result in results):
+        failures.append(f'coordinator failed: {results}')
+    if duplicates:
+        failures.append(f'{len(duplicates)} chats got more than one message, e.g. {list(duplicates.items())[:5]}')
+    if missed:
+        failures.append(f'{len(missed)} chats got nothing, e.g. {sorted(missed)[:5]}')
+    if sent != len(expected):
+        failures.append(f'shards reported {sent} sends for {len(expected)} reminders and snoozes')
+    if per_shard != expected_per_shard:
+        failures.append(f'shards sent {per_shard}, reminder_shard expects {expected_per_shard}')
+    for failure in failures:
+        print(f'FAIL: {failure}', file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,680 @@
+'''
+Заглушка Postgres для бенчмарков: хранит состояние в памяти и отвечает на те SQL-запросы,
+которые выполняют generate-contract, deliver-outbox, upload-template и send-reminders. Неизвестный запрос - исключение,
+чтобы новый SQL в функциях не прошел мимо бенчмарка незамеченным.
+Подключение: psycopg2.connect = FakeDatabase(...).connect
+'''
+import binascii
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _value(param: Any) -> Any:
+    '''psycopg2.Binary хранит исходный буфер в .adapted'''
+    value = getattr(param, 'adapted', param)
+    return bytes(value) if isinstance(value, (bytearray, memoryview)) else value
+
+
+def _quote_binary(params: Tuple) -> bytes:
+    '''
+    Как psycopg2 на соединении со standard_conforming_strings: BYTEA уходит в текст запроса
+    как '\\x<hex>', и экранированные значения живут одновременно с собранным из них запросом
+    '''
+    quoted = [b"'\\x" + binascii.hexlify(param.adapted) + b"'::bytea" for param in params if hasattr(param, 'adapted')]
+    return b','.join(quoted)
+
+
+class _Spilled:
+    def __init__(self, path: str):
+        self.path = path
+
+
+def _load(value: Any) -> Any:
+    if isinstance(value, _Spilled):
+        with open(value.path, 'rb') as f:
+            return f.read()
+    return value
+
+
+def _shard_of(user_id: int, shard_count: int) -> int:
+    '''reminder_shard из V0015: первые 32 бита md5(user_id) по модулю числа шардов'''
+    return int(hashlib.md5(str(user_id).encode()).hexdigest()[:8], 16) % shard_count
+
+
+def _normalize(query: str) -> str:
+    return ' '.join(query.split())
+
+
+class _CopyField:
+    '''Одно поле строки COPY: текст с экранированием или BYTEA в виде \\\\x<hex>'''
+    
+    BYTEA_COLUMNS = ('file_data', 'cover_data')
+    UNESCAPE = {b't': '\t', b'n': '\n', b'r': '\r', b'\\': '\\'}
+    
+    def __init__(self, db: 'FakeDatabase', column: str, row_id: int):
+        self.column = column
+        self.binary = column in self.BYTEA_COLUMNS
+        self.text = bytearray()
+        self.skip = 3
+        self.odd = b''
+        self.path = None
+        self.data: Any = bytearray()
+        if self.binary and db.spill_dir:
+            self.path = os.path.join(db.spill_dir, f'outbox_{row_id}_{column}')
+            self.data = open(self.path, 'wb')
+    
+    def feed(self, token: bytes):
+        if not self.binary:
+            self.text += token
+            return
+        if self.skip:
+            taken = token[:self.skip]
+            token = token[len(taken):]
+            self.skip -= len(taken)
+        token = self.odd + token
+        even = len(token) - len(token) % 2
+        decoded = binascii.unhexlify(token[:even])
+        if self.path:
+            self.data.write(decoded)
+        else:
+            self.data.extend(decoded)
+        self.odd = token[even:]
+    
+    def finish(self) -> Any:
+        if not self.binary:
+            if bytes(self.text) == b'\\N':
+                return None
+            return re.sub(rb'\\(.)', lambda m: self.UNESCAPE[m.group(1)].encode(), bytes(self.text)).decode('utf-8')
+        if self.path:
+            self.data.close()
+            return _Spilled(self.path)
+        return bytes(self.data)
+
+
+class FakeDatabase:
+    def __init__(self, template: bytes, compiled: Optional[Tuple[bytes, List[Dict[str, Any]]]] = None,
+                 start_number: int = 1000, spill_dir: Optional[str] = None):
+        # Шаблон из конструктора - версия 1 шаблона default, как после миграции V0011
+        content_hash = hashlib.sha256(template).hexdigest()
+        compiled_data, placeholders = compiled or (None, None)
+        self.contents: Dict[str, Dict[str, Any]] = {
+            content_hash: {'template_data': template, 'compiled_data': compiled_data, 'placeholders': placeholders}
+        }
+        self.templates: Dict[str, Dict[str, Any]] = {
+            'default': {'active_version': 1, 'active_hash': content_hash, 'latest_version': 1}
+        }
+        self.uploads: Dict[str, Dict[str, Any]] = {}
+        self.versions: Dict[Tuple[str, int], Dict[str, Any]] = {
+            ('default', 1): {'content_hash': content_hash, 'filename': 'template.docx', 'file_size': len(template),
+                             'uploaded_at': datetime.datetime(2024, 1, 1)}
+        }
+        self.counter = start_number
+        self.counter_updated_at = datetime.datetime(2024, 1, 1)
+        self.sequence = start_number
+        self.outbox: List[Dict[str, Any]] = []
+        self.idempotency: Dict[str, Dict[str, Any]] = {}
+        self.blobs: Dict[str, bytes] = {}
+        self.archive: Dict[int, Dict[str, Any]] = {}
+        self.reminders: List[Dict[str, Any]] = []
+        self.deliveries: Dict[Tuple[int, Any], Dict[str, Any]] = {}
+        self.snoozes: List[Dict[str, Any]] = []
+        self.shard_locks: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        # Запрос выполняется атомарно, как один оператор Postgres: шарды в потоках делят одну заглушку
+        self.lock = threading.RLock()
+        self.queries: Dict[str, int] = {}
+        # BYTEA очереди можно держать на диске: настоящая база вне процесса и не раздувает его RSS
+        self.spill_dir = spill_dir
+    
+    def connect(self, *args: Any, **kwargs: Any) -> 'FakeConnection':
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self.closed = 0
+        self.autocommit = False
+        # psycopg2.extras.execute_values кодирует запрос кодировкой соединения
+        self.encoding = 'UTF8'
+    
+    def cursor(self, name: Optional[str] = None) -> 'FakeCursor':
+        # Именованный (серверный) курсор ведет себя как обычный: все строки уже в памяти
+        return FakeCursor(self.db, self)
+    
+    def commit(self):
+        pass
+    
+    def rollback(self):
+        pass
+    
+    def close(self):
+        self.closed = 1
+    
+    def get_transaction_status(self) -> int:
+        # Транзакций заглушка не ведет: соединение всегда TRANSACTION_STATUS_IDLE
+        return 0
+
+
+class FakeCursor:
+    def __init__(self, db: FakeDatabase, connection: FakeConnection):
+        self.db = db
+        self.connection = connection
+        self.rows: List[Tuple] = []
+        self.rowcount = 0
+        self.itersize = 2000
+        self.mogrified: List[Tuple] = []
+    
+    def mogrify(self, template: Any, args: Tuple) -> bytes:
+        '''
+        execute_values склеивает VALUES из mogrify по строке. Заглушка запоминает аргументы,
+        а в текст ставит метку: обработчик запроса получит строки списком в params
+        '''
+        self.mogrified.append(tuple(_value(arg) for arg in args))
+        return b'(?)'
+    
+    def execute(self, query: Any, params: Optional[Tuple] = None):
+        if isinstance(query, bytes):
+            query = query.decode('utf-8')
+        sql = _normalize(query)
+        if isinstance(params, dict):
+            # Именованные параметры (%(name)s) обработчик получает словарем
+            params = {name: _value(param) for name, param in params.items()}
+        else:
+            _quote_binary(params or ())
+            params = tuple(_value(param) for param in (params or ()))
+        if self.mogrified:
+            params, self.mogrified = tuple(self.mogrified), []
+        handler = self._dispatch(sql)
+        with self.db.lock:
+            self.db.queries[handler.__name__] = self.db.queries.get(handler.__name__, 0) + 1
+            self.rows = handler(sql, params) or []
+        self.rowcount = len(self.rows)
+    
+    def copy_expert(self, sql: str, file: Any, size: int = 8192):
+        '''
+        COPY telegram_outbox (...) FROM STDIN в текстовом формате. Файл читается кусками, hex BYTEA
+        декодируется по мере чтения (на диск при spill_dir), поэтому заглушка сама не держит копию потока
+        '''
+        sql = _normalize(sql)
+        match = re.search(r'^COPY telegram_outbox \(([^)]*)\) FROM STDIN$', sql)
+        if match is None:
+            raise Exception(f'FakeDatabase: unsupported COPY: {sql[:120]}')
+        self.db.queries['_outbox_copy'] = self.db.queries.get('_outbox_copy', 0) + 1
+        columns = [column.strip() for column in match.group(1).split(',')]
+        
+        values: Dict[str, Any] = {}
+        field = _CopyField(self.db, columns[0], len(self.db.outbox) + 1)
+        while True:
+            chunk = file.read(size)
+            if not chunk:
+                break
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            position = 0
+            while position < len(chunk):
+                # find, а не re.split: hex файла идет мегабайтами без разделителей
+                ends = [end for end in (chunk.find(b'\t', position), chunk.find(b'\n', position)) if end >= 0]
+                if not ends:
+                    field.feed(chunk[position:])
+                    break
+                end = min(ends)
+                field.feed(chunk[position:end])
+                position = end + 1
+                values[field.column] = field.finish()
+                if chunk[end:end + 1] == b'\n':
+                    self._outbox_row(values)
+                    values = {}
+                field = _CopyField(self.db, columns[len(values) % len(columns)], len(self.db.outbox) + 1)
+        self.rows = []
+        self.rowcount = 0
+    
+    def fetchone(self) -> Optional[Tuple]:
+        return self.rows.pop(0) if self.rows else None
+    
+    def fetchall(self) -> List[Tuple]:
+        rows, self.rows = self.rows, []
+        return rows
+    
+    def __iter__(self):
+        while self.rows:
+            yield self.rows.pop(0)
+    
+    def close(self):
+        pass
+    
+    def _dispatch(self, sql: str):
+        routes = [
+            (r'^SELECT 1$', self._ping),
+            (r'^SELECT active_version, active_hash FROM templates WHERE name', self._template_active),
+            (r'^SELECT version, content_hash FROM template_versions WHERE name = %s AND version', self._template_version),
+            (r'^SELECT content_hash FROM template_versions WHERE name = %s AND version', self._template_version_hash),
+            (r'^SELECT COALESCE\(compiled_data, template_data\), placeholders FROM template_contents', self._template_data),
+            (r'^SELECT COALESCE\(jsonb_array_length\(placeholders\), 0\) FROM template_contents', self._template_content_known),
+            (r'^INSERT INTO template_contents', self._template_content_insert),
+            (r'^INSERT INTO templates \(name\)', self._template_name_insert),
+            (r'^SELECT latest_version, active_version, active_hash FROM templates', self._template_name_lock),
+            (r'^SELECT version FROM template_versions WHERE name = %s AND content_hash', self._template_version_of),
+            (r'^INSERT INTO template_versions', self._template_version_insert),
+            (r'^UPDATE templates SET', self._template_activate),
+            (r'^SELECT t\.name, t\.active_version, v\.version', self._template_list),
+            (r'^WITH due AS \( SELECT id, next_fire_at FROM reminders', self._deliveries_claim_due),
+            (r'^WITH stale AS \( SELECT d\.reminder_id, d\.fire_at FROM reminder_deliveries', self._deliveries_reclaim),
+            (r'^UPDATE reminder_deliveries d SET status = v\.status', self._deliveries_record),
+            (r'^DELETE FROM reminder_deliveries WHERE \(reminder_id, fire_at\) IN \( SELECT reminder_id', self._deliveries_cleanup),
+            (r'^DELETE FROM reminder_deliveries WHERE \(reminder_id, fire_at\) IN \( SELECT d\.reminder_id', self._deliveries_cleanup_inactive),
+            (r'^DELETE FROM reminder_snoozes WHERE id IN', self._snoozes_cleanup_inactive),
+            (r'^INSERT INTO reminder_shard_locks', self._shard_acquire),
+            (r'^UPDATE reminder_shard_locks SET locked_until = now\(\) \+', self._shard_renew),
+            (r'^UPDATE reminder_shard_locks SET locked_until = now\(\) WHERE', self._shard_release),
+            (r'^INSERT INTO template_uploads', self._upload_insert),
+            (r'^DELETE FROM template_uploads WHERE upload_id IN', self._upload_cleanup),
+            (r'^SELECT name FROM template_uploads WHERE upload_id = %s FOR UPDATE', self._upload_lock),
+            (r'^SELECT crc32 FROM template_upload_chunks', self._upload_chunk_crc),
+            (r'^UPDATE template_uploads SET received_bytes', self._upload_reserve),
+            (r'^INSERT INTO template_upload_chunks', self._upload_chunk_insert),
+            (r'^SELECT name, filename, received_bytes FROM template_uploads', self._upload_status),
+            (r'^SELECT chunk_index, size, crc32 FROM template_upload_chunks', self._upload_chunks),
+            (r'^SELECT data, crc32 FROM template_upload_chunks', self._upload_chunk_data),
+            (r'^DELETE FROM template_uploads WHERE upload_id = %s$', self._upload_delete),
+            (r"nextval\('contract_number_seq'\) FROM generate_series", self._nextval),
+            (r"^SELECT nextval\('contract_number_seq'\)$", self._nextval),
+            (r'^SELECT GREATEST\(c\.current_number', self._last_issued),
+            (r'^UPDATE contract_counter SET current_number', self._update_counter),
+            (r"^SELECT setval\('contract_number_seq'", self._setval),
+            (r'^INSERT INTO telegram_outbox', self._outbox_insert),
+            (r'^SELECT method, status, attempts, last_error, created_at, sent_at FROM telegram_outbox', self._outbox_status),
+            (r'^UPDATE telegram_outbox SET attempts = attempts \+ 1', self._outbox_claim),
+            (r'^UPDATE telegram_outbox SET ', self._outbox_update),
+            (r'^DELETE FROM telegram_outbox WHERE', self._outbox_cleanup),
+            (r'^SELECT pg_advisory_xact_lock', self._ping),
+            (r'^SELECT request_hash, response FROM contract_idempotency', self._idempotency_find),
+            (r'^INSERT INTO contract_idempotency', self._idempotency_insert),
+            (r'^DELETE FROM contract_idempotency', self._idempotency_cleanup),
+            (r'^SELECT content_hash FROM contract_blobs', self._blobs_known),
+            (r'^SELECT content_hash, data FROM contract_blobs', self._blobs_fetch),
+            (r'^INSERT INTO contract_blobs', self._blobs_insert),
+            (r'^INSERT INTO contract_archive', self._archive_insert),
+            (r'^SELECT file_name, caption, created_at, manifest FROM contract_archive', self._archive_get),
+            (r'^SELECT COUNT\(\*\) FROM contract_archive WHERE contract_number BETWEEN', self._archive_count),
+            (r'^SELECT contract_number, file_name, created_at, manifest FROM contract_archive WHERE contract_number BETWEEN', self._archive_range),
+        ]
+        for pattern, handler in routes:
+            if re.search(pattern, sql):
+                return handler
+        raise Exception(f'FakeDatabase: unsupported query: {sql[:120]}')
+    
+    def _ping(self, sql: str, params: Tuple) -> List[Tuple]:
+        return [(1,)]
+    
+    def _template_active(self, sql: str, params: Tuple) -> List[Tuple]:
+        row = self.db.templates.get(params[0])
+        return [(row['active_version'], row['active_hash'])] if row else []
+    
+    def _template_version(self, sql: str, params: Tuple) -> List[Tuple]:
+        row = self.db.versions.get((params[0], params[1]))
+        return [(params[1], row['content_hash'])] if row else []
+    
+    def _template_version_hash(self, sql: str, params: Tuple) -> List[Tuple]:
+        row = self.db.versions.get((params[0], params[1]))
+        return [(row['content_hash'],)] if row else []
+    
+    def _template_data(self, sql: str, params: Tuple) -> List[Tuple]:
+        row = self.db.contents.get(params[0])
+        if row is None:
+            return []
+        return [(memoryview(row['compiled_data'] or row['template_data']), row['placeholders'])]
+    
+    def _template_content_known(self, sql: str, params: Tuple) -> List[Tuple]:
+        row = self.db.contents.get(params[0])
+        return [(len(row['placeholders'] or []),)] if row else []
+    
+    def _template_content_insert(self, sql: str, params: Tuple) -> List[Tuple]:
+        content_hash, template_data, file_size, compiled_data, placeholders = params
+        self.db.contents.setdefault(content_hash, {
+            'template_data': template_data, 'compiled_data': compiled_data, 'placeholders': json.loads(placeholders)
+        })
+        return []
+    
+    def _template_name_insert(self, sql: str, params: Tuple) -> List[Tuple]:
+        self.db.templates.setdefault(params[0], {'active_version': None, 'active_hash': None, 'latest_version': 0})
+        return []
+    
+    def _template_name_lock(self, sql: str, params: Tuple) -> List[Tuple]:
+        row = self.db.templates[params[0]]
+        return [(row['latest_version'], row['active_version'], row['active_hash'])]
+    
+    def _template_version_of(self, sql: str, params: Tuple) -> List[Tuple]:
+        name, content_hash = params
+        versions = [version for (template, version), row in self.db.versions.items()
+                    if template == name and row['content_hash'] == content_hash]
+        return [(max(versions),)] if versions else []
+    
+    def _template_version_insert(self, sql: str, params: Tuple) -> List[Tuple]:
+        name, version, content_hash, filename, file_size = params
+        self.db.versions[(name, version)] = {'content_hash': content_hash, 'filename': filename, 'file_size': file_size,
+                                             'uploaded_at': datetime.datetime.now()}
+        return []
+    
+    def _template_activate(self, sql: str, params: Tuple) -> List[Tuple]:
+        row = self.db.templates[params[-1]]
+        row['active_version'], row['active_hash'] = params[0], params[1]
+        if len(params) == 4:
+            row['latest_version'] = max(row['latest_version'], params[2])
+        return []
+    
+    def _template_list(self, sql: str, params: Tuple) -> List[Tuple]:
+        return [
+            (name, self.db.templates[name]['active_version'], version, row['content_hash'], row['filename'],
+             row['file_size'], row['uploaded_at'])
+            for (name, version), row in sorted(self.db.versions.items(), key=lambda item: (item[0][0], -item[0][1]))
+            if params[0] is None or name == params[0]
+        ]
+    
+    def _upload_insert(self, sql: str, params: Tuple) -> List[Tuple]:
+        upload_id, name, filename = params
+        if upload_id in self.db.uploads:
+            return []
+        self.db.uploads[upload_id] = {'name': name, 'filename': filename, 'received_bytes': 0, 'chunks': {}}
+        return [(upload_id,)]
+    
+    def _upload_cleanup(self, sql: str, params: Tuple) -> List[Tuple]:
+        return []
+    
+    def _upload_lock(self, sql: str, params: Tuple) -> List[Tuple]:
+        row = self.db.uploads.get(params[0])
+        return [(row['name'],)] if row else []
+    
+    def _upload_chunk_crc(self, sql: str, params: Tuple) -> List[Tuple]:
+        chunk = self.db.uploads[params[0]]['chunks'].get(params[1])
+        return [(chunk['crc32'],)] if chunk else []
+    
+    def _upload_reserve(self, sql: str, params: Tuple) -> List[Tuple]:
+        size, upload_id, _, limit = params
+        row = self.db.uploads[upload_id]
+        if row['received_bytes'] + size > limit:
+            return []
+        row['received_bytes'] += size
+        return [(row['received_bytes'],)]
+    
+    def _upload_chunk_insert(self, sql: str, params: Tuple) -> List[Tuple]:
+        upload_id, index, data, size, crc = params
+        self.db.uploads[upload_id]['chunks'][index] = {'data': data, 'size': size, 'crc32': crc}
+        return []
+    
+    def _upload_status(self, sql: str, params: Tuple) -> List[Tuple]:
+        row = self.db.uploads.get(params[0])
+        return [(row['name'], row['filename'], row['received_bytes'])] if row else []
+    
+    def _upload_chunks(self, sql: str, params: Tuple) -> List[Tuple]:
+        chunks = self.db.uploads[params[0]]['chunks']
+        return [(index, chunks[index]['size'], chunks[index]['crc32']) for index in sorted(chunks)]
+    
+    def _upload_chunk_data(self, sql: str, params: Tuple) -> List[Tuple]:
+        chunks = self.db.uploads[params[0]]['chunks']
+        return [(memoryview(chunks[index]['data']), chunks[index]['crc32']) for index in sorted(chunks)]
+    
+    def _upload_delete(self, sql: str, params: Tuple) -> List[Tuple]:
+        self.db.uploads.pop(params[0], None)
+        return []
+    
+    def _deliveries_claim_due(self, sql: str, params: Dict[str, Any]) -> List[Tuple]:
+        # Следующее срабатывание упрощено до +1 день: reminder_next_fire живет в Postgres
+        shard_count, shard_index, limit = params['shard_count'], params['shard_index'], params['limit']
+        now = datetime.datetime.now(datetime.timezone.utc)
+        due = sorted((row for row in self.db.reminders if row['is_active'] and row['next_fire_at'] <= now
+                      and _shard_of(row['user_id'], shard_count) == shard_index),
+                     key=lambda row: row['next_fire_at'])[:limit]
+        reminders = {row['id']: row for row in self.db.reminders}
+        snoozed = sorted((snooze for snooze in self.db.snoozes if snooze['fire_at'] <= now
+                          and reminders[snooze['reminder_id']]['is_active']
+                          and _shard_of(snooze['user_id'], shard_count) == shard_index),
+                         key=lambda snooze: snooze['fire_at'])[:limit]
+        fired = []
+        for row in due:
+            fired.append((row, row['user_id'], row['next_fire_at']))
+            row['next_fire_at'] = row['next_fire_at'] + datetime.timedelta(days=1)
+        for snooze in snoozed:
+            self.db.snoozes.remove(snooze)
+            fired.append((reminders[snooze['reminder_id']], snooze['user_id'], snooze['fire_at']))
+        
+        claimed = []
+        for row, user_id, fire_at in fired:
+            if (row['id'], fire_at) in self.db.deliveries:
+                continue
+            self.db.deliveries[(row['id'], fire_at)] = {
+                'user_id': user_id, 'status': 'pending', 'attempts': 1, 'last_error': None, 'sent_at': None,
+                'claimed_until': now + datetime.timedelta(seconds=params['lease']), 'created_at': now
+            }
+            claimed.append((row['id'], user_id, row['title'], row['description'], fire_at, 1))
+        return claimed
+    
+    def _deliveries_reclaim(self, sql: str, params: Tuple) -> List[Tuple]:
+        shard_count, _, shard_index, limit, lease = params
+        now = datetime.datetime.now(datetime.timezone.utc)
+        reminders = {row['id']: row for row in self.db.reminders if row['is_active']}
+        stale = sorted(((key, delivery) for key, delivery in self.db.deliveries.items()
+                        if delivery['status'] == 'pending' and delivery['claimed_until'] <= now and key[0] in reminders
+                        and _shard_of(delivery['user_id'], shard_count) == shard_index),
+                       key=lambda item: item[1]['claimed_until'])[:limit]
+        claimed = []
+        for (rid, fire_at), delivery in stale:
+            delivery['attempts'] += 1
+            delivery['claimed_until'] = now + datetime.timedelta(seconds=lease)
+            row = reminders[rid]
+            claimed.append((rid, row['user_id'], row['title'], row['description'], fire_at, delivery['attempts']))
+        return claimed
+    
+    def _deliveries_record(self, sql: str, params: Tuple) -> List[Tuple]:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for rid, fire_at, status, last_error, retry_in in params:
+            delivery = self.db.deliveries.get((rid, fire_at))
+            if delivery is None:
+                continue
+            delivery.update(status=status, last_error=last_error, sent_at=now if status == 'sent' else None,
+                            claimed_until=now + datetime.timedelta(seconds=retry_in))
+        return []
+    
+    def _deliveries_cleanup(self, sql: str, params: Tuple) -> List[Tuple]:
+        retention_days, limit = params
+        before = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=retention_days)
+        old = [key for key, delivery in self.db.deliveries.items()
+               if delivery['status'] != 'pending' and delivery['created_at'] < before][:limit]
+        for key in old:
+            del self.db.deliveries[key]
+        return []
+    
+    def _deliveries_cleanup_inactive(self, sql: str, params: Tuple) -> List[Tuple]:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        inactive = {row['id'] for row in self.db.reminders if not row['is_active']}
+        stale = [key for key, delivery in self.db.deliveries.items()
+                 if delivery['status'] == 'pending' and delivery['claimed_until'] <= now and key[0] in inactive][:params[0]]
+        for key in stale:
+            del self.db.deliveries[key]
+        return []
+    
+    def _snoozes_cleanup_inactive(self, sql: str, params: Tuple) -> List[Tuple]:
+        inactive = {row['id'] for row in self.db.reminders if not row['is_active']}
+        for snooze in [snooze for snooze in self.db.snoozes if snooze['reminder_id'] in inactive][:params[0]]:
+            self.db.snoozes.remove(snooze)
+        return []
+    
+    def _shard_acquire(self, sql: str, params: Tuple) -> List[Tuple]:
+        shard_count, shard_index, owner, lock_seconds = params
+        now = datetime.datetime.now(datetime.timezone.utc)
+        lock = self.db.shard_locks.get((shard_count, shard_index))
+        if lock is not None and lock['locked_until'] > now and lock['owner'] != owner:
+            return []
+        self.db.shard_locks[(shard_count, shard_index)] = {
+            'owner': owner, 'locked_until': now + datetime.timedelta(seconds=lock_seconds)
+        }
+        return [(owner,)]
+    
+    def _shard_renew(self, sql: str, params: Tuple) -> List[Tuple]:
+        lock_seconds, shard_count, shard_index, owner = params
+        lock = self.db.shard_locks.get((shard_count, shard_index))
+        if lock is None or lock['owner'] != owner:
+            return []
+        lock['locked_until'] = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=lock_seconds)
+        return [(owner,)]
+    
+    def _shard_release(self, sql: str, params: Tuple) -> List[Tuple]:
+        shard_count, shard_index, owner = params
+        lock = self.db.shard_locks.get((shard_count, shard_index))
+        if lock is not None and lock['owner'] == owner:
+            lock['locked_until'] = datetime.datetime.now(datetime.timezone.utc)
+        return []
+    
+    def _nextval(self, sql: str, params: Tuple) -> List[Tuple]:
+        rows = []
+        for _ in range(int(params[0]) if params else 1):
+            self.db.sequence += 1
+            rows.append((self.db.sequence,))
+        return rows
+    
+    def _last_issued(self, sql: str, params: Tuple) -> List[Tuple]:
+        last_issued = max(self.db.counter, self.db.sequence)
+        # get-next-number читает еще и updated_at для ETag/Last-Modified
+        return [(last_issued, self.db.counter_updated_at)] if 'c.updated_at' in sql else [(last_issued,)]
+    
+    def _update_counter(self, sql: str, params: Tuple) -> List[Tuple]:
+        self.db.counter = params[0]
+        self.db.counter_updated_at = datetime.datetime.now()
+        return []
+    
+    def _setval(self, sql: str, params: Tuple) -> List[Tuple]:
+        # Без второго параметра - безусловный setval блока пакета
+        if len(params) == 1 or self.db.sequence < params[1]:
+            self.db.sequence = params[0]
+            return [(params[0],)]
+        return []
+    
+    def _outbox_insert(self, sql: str, params: Tuple) -> List[Tuple]:
+        columns = [column.strip() for column in re.search(r'telegram_outbox \(([^)]*)\)', sql).group(1).split(',')]
+        values = [value.strip() for value in re.search(r'VALUES \(([^)]*)\)', sql).group(1).split(',')]
+        params_iter = iter(params)
+        self._outbox_row({column: next(params_iter) if value == '%s' else value.strip("'") for column, value in zip(columns, values)})
+        return []
+    
+    def _outbox_row(self, values: Dict[str, Any]):
+        row: Dict[str, Any] = {
+            'id': len(self.db.outbox) + 1, 'status': 'pending', 'attempts': 0, 'last_error': None,
+            'created_at': datetime.datetime.now(), 'sent_at': None,
+            'cover_caption': None, 'cover_file_name': None, 'cover_data': None
+        }
+        for column, value in values.items():
+            if self.db.spill_dir and isinstance(value, bytes):
+                path = os.path.join(self.db.spill_dir, f"outbox_{row['id']}_{column}")
+                with open(path, 'wb') as f:
+                    f.write(value)
+                value = _Spilled(path)
+            row[column] = value
+        self.db.outbox.append(row)
+    
+    def _outbox_status(self, sql: str, params: Tuple) -> List[Tuple]:
+        return [
+            (row['method'], row['status'], row['attempts'], row['last_error'], row['created_at'], row['sent_at'])
+            for row in self.db.outbox if row['contract_number'] == params[0] and not row.get('deleted')
+        ]
+    
+    def _outbox_claim(self, sql: str, params: Tuple) -> List[Tuple]:
+        lease, limit = params
+        claimed = []
+        for row in self.db.outbox:
+            if row['status'] == 'pending' and not row.get('claimed') and not row.get('deleted'):
+                row['claimed'] = True
+                row['attempts'] += 1
+                claimed.append(row)
+                if len(claimed) >= limit:
+                    break
+        return [
+            (row['id'], row['contract_number'], row['method'], row['chat_id'], row['caption'], row['file_name'],
+             _load(row['file_data']), row['attempts'], row['cover_caption'], row['cover_file_name'], _load(row['cover_data']))
+            for row in claimed
+        ]
+    
+    def _outbox_update(self, sql: str, params: Tuple) -> List[Tuple]:
+        row = self.db.outbox[params[-1] - 1]
+        if "status = 'sent'" in sql:
+            row['status'] = 'sent'
+            row['sent_at'] = datetime.datetime.now()
+            row['file_data'] = row['cover_data'] = None
+        elif "status = 'failed'" in sql:
+            row['status'] = 'failed'
+            row['last_error'] = params[0]
+            row['file_data'] = row['cover_data'] = None
+        else:
+            # Перенос на потом: до конца прогона запись не берется повторно, как при next_attempt_at в будущем
+            row['last_error'] = params[1]
+        return []
+    
+    def _outbox_cleanup(self, sql: str, params: Tuple) -> List[Tuple]:
+        retention_days, limit = params
+        before = datetime.datetime.now() - datetime.timedelta(days=retention_days)
+        old = [row for row in self.db.outbox
+               if row['status'] != 'pending' and not row.get('deleted') and row['created_at'] < before][:limit]
+        # Строка остается в списке (id - ее позиция), но запросы ее больше не видят
+        for row in old:
+            row['deleted'] = True
+        return []
+    
+    def _idempotency_find(self, sql: str, params: Tuple) -> List[Tuple]:
+        row = self.db.idempotency.get(params[0])
+        if row is None or row['expires_at'] <= datetime.datetime.now():
+            return []
+        return [(row['request_hash'], row['response'])]
+    
+    def _idempotency_insert(self, sql: str, params: Tuple) -> List[Tuple]:
+        key, request_hash, contract_number, artifact_hash, response, seconds = params
+        self.db.idempotency[key] = {
+            'request_hash': request_hash, 'contract_number': contract_number, 'artifact_hash': artifact_hash,
+            'response': response, 'expires_at': datetime.datetime.now() + datetime.timedelta(seconds=seconds)
+        }
+        return []
+    
+    def _idempotency_cleanup(self, sql: str, params: Tuple) -> List[Tuple]:
+        now = datetime.datetime.now()
+        expired = [key for key, row in self.db.idempotency.items() if row['expires_at'] <= now][:params[0]]
+        for key in expired:
+            del self.db.idempotency[key]
+        return [(key,) for key in expired]
+    
+    def _blobs_known(self, sql: str, params: Tuple) -> List[Tuple]:
+        return [(digest,) for digest in params[0] if digest in self.db.blobs]
+    
+    def _blobs_fetch(self, sql: str, params: Tuple) -> List[Tuple]:
+        return [(digest, memoryview(_load(self.db.blobs[digest]))) for digest in params[0] if digest in self.db.blobs]
+    
+    def _blobs_insert(self, sql: str, params: Tuple) -> List[Tuple]:
+        digest, data, size = params
+        if digest not in self.db.blobs:
+            self.db.blobs[digest] = data
+        return []
+    
+    def _archive_insert(self, sql: str, params: Tuple) -> List[Tuple]:
+        contract_number, file_name, caption, docx_hash, docx_size, manifest = params
+        self.db.archive[contract_number] = {
+            'file_name': file_name, 'caption': caption, 'docx_hash': docx_hash, 'docx_size': docx_size,
+            'manifest': manifest, 'created_at': datetime.datetime.now()
+        }
+        return []
+    
+    def _archive_get(self, sql: str, params: Tuple) -> List[Tuple]:
+        row = self.db.archive.get(params[0])
+        if row is None:
+            return []
+        return [(row['file_name'], row['caption'], row['created_at'], row['manifest'])]
+    
+    def _archive_count(self, sql: str, params: Tuple) -> List[Tuple]:
+        return [(len(self._archive_range(sql, params)),)]
+    
+    def _archive_range(self, sql: str, params: Tuple) -> List[Tuple]:
+        first, last = params
+        return [
+            (number, row['file_name'], row['created_at'], row['manifest'])
+            for number, row in sorted(self.db.archive.items()) if first <= number <= last
+        ]
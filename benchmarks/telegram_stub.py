@@ -0,0 +1,91 @@
+'''
+Локальная заглушка api.telegram.org для бенчмарков: принимает любой метод бота,
+вычитывает тело запроса и отвечает {"ok": true}. Можно добавить задержку ответа и флуд-контроль:
+сверх flood_rate запросов в секунду - 429 с retry_after, как у настоящего Bot API.
+Подключение: TELEGRAM_API_URL = TelegramStub().start()
+'''
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+
+class TelegramStub:
+    def __init__(self, latency_ms: float = 0, flood_rate: float = 0, retry_after: int = 1):
+        self.latency = latency_ms / 1000
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.window = (0, 0)  # (секунда, запросов в ней)
+        self.rejected = 0
+        self.calls: Dict[str, int] = {}
+        # Принятые sendMessage по чатам: по ним проверки ловят повторные и потерянные отправки
+        self.chats: Dict[Any, int] = {}
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+        self.server = None
+    
+    def start(self) -> str:
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Иначе заголовки и тело ответа уходят разными пакетами и keep-alive ловит задержку ACK в 40 мс
+            disable_nagle_algorithm = True
+            
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                # Кусками: заглушка живет в процессе функции и не должна попадать в замер ее памяти
+                remaining = length
+                # JSON-вызовы (sendMessage без файлов) маленькие - их тело сохраняется ради chat_id
+                is_json = self.headers.get('Content-Type', '').startswith('application/json')
+                request_body = bytearray()
+                while remaining > 0:
+                    chunk = self.rfile.read(min(remaining, 65536))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    if is_json:
+                        request_body += chunk
+                method = self.path.rsplit('/', 1)[-1]
+                with stub.lock:
+                    second = int(time.monotonic())
+                    count = stub.window[1] + 1 if stub.window[0] == second else 1
+                    stub.window = (second, count)
+                    flooded = stub.flood_rate and count > stub.flood_rate
+                    if flooded:
+                        stub.rejected += 1
+                    else:
+                        stub.calls[method] = stub.calls.get(method, 0) + 1
+                        stub.bytes_received += length
+                        if method == 'sendMessage' and is_json:
+                            chat_id = json.loads(request_body).get('chat_id')
+                            stub.chats[chat_id] = stub.chats.get(chat_id, 0) + 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if flooded:
+                    status = 429
+                    body = json.dumps({'ok': False, 'error_code': 429,
+                                       'description': f'Too Many Requests: retry after {stub.retry_after}',
+                                       'parameters': {'retry_after': stub.retry_after}}).encode()
+                else:
+                    status = 200
+                    body = json.dumps({'ok': True, 'result': {'message_id': 1}}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self.server.server_port}'
+    
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,80 @@
+'''Синтетические шаблоны договора и данные формы для бенчмарков'''
+import io
+from typing import Dict
+from docx import Document
+
+FORM_FIELDS = {
+    'дата_заключения_договора': '25 октября 2025 г.',
+    'graj': 'Германии',
+    'ФИО_ИП_полностью_кого': 'EDUARD FRANK IOSIFOVIC',
+    'ФИО_ИП_кратко': 'EDUARD F.I.',
+    'NIK': 'EDDI$',
+    'PAS': 'GER: L8V2RCZ80',
+    'mail': 'mr-frank-eduard@web.de',
+    'ИНН_SWIFT': 'SWIFT: COBADEFF',
+    'РЕКВИЗИТЫ_БАНК': 'Commerzbank AG',
+    'naz': 'Night Drive',
+    'isp': 'EDDI$',
+    'avt': 'Eduard Frank',
+    'avttext': 'Eduard Frank',
+    'fongr': 'Eduard Frank',
+    'procc': '50'
+}
+
+FILLER = ('Лицензиар предоставляет Лицензиату право использования Произведения способами, '
+          'указанными в настоящем Договоре, в пределах срока и территории действия Договора. ')
+
+
+def sample_payload() -> Dict[str, str]:
+    return dict(FORM_FIELDS)
+
+
+def sample_replacements(contract_number: int) -> Dict[str, str]:
+    replacements = {'{{номер_договора}}': str(contract_number)}
+    for key, value in FORM_FIELDS.items():
+        replacements['{{' + key + '}}'] = value
+    return replacements
+
+
+def build_template(pages: int = 1, tables_per_page: int = 1, paragraphs_per_page: int = 20,
+                   split_runs: bool = True, with_image: bool = True) -> bytes:
+    '''
+    Собрать DOCX: на каждой странице абзацы текста, таблицы с плейсхолдерами,
+    плейсхолдеры, разбитые по нескольким run (как это делает Word), и колонтитулы.
+    '''
+    doc = Document()
+    section = doc.sections[0]
+    section.header.paragraphs[0].text = 'Лицензионный договор №{{номер_договора}} от {{дата_заключения_договора}}'
+    section.footer.paragraphs[0].text = 'Лицензиар: {{ФИО_ИП_кратко}} / Лицензиат'
+    
+    for page in range(pages):
+        paragraph = doc.add_paragraph()
+        if split_runs:
+            paragraph.add_run('Гражданин {{gr').bold = True
+            paragraph.add_run('aj}} {{ФИО_ИП_')
+            paragraph.add_run('полностью_кого}}, псевдоним ').italic = True
+            paragraph.add_run('{{NIK}}, паспорт {{PAS}}')
+        else:
+            paragraph.add_run('Гражданин {{graj}} {{ФИО_ИП_полностью_кого}}, псевдоним {{NIK}}, паспорт {{PAS}}')
+        
+        for i in range(paragraphs_per_page):
+            doc.add_paragraph(f'{page + 1}.{i + 1}. ' + FILLER * 3)
+        
+        for _ in range(tables_per_page):
+            table = doc.add_table(rows=3, cols=2)
+            table.cell(0, 0).text = 'Название: {{naz}}'
+            table.cell(0, 1).text = 'Исполнитель: {{isp}}'
+            table.cell(1, 0).text = 'Автор музыки: {{avt}}'
+            table.cell(1, 1).text = 'Автор текста: {{avttext}}'
+            table.cell(2, 0).text = 'Фонограмма: {{fongr}}'
+            table.cell(2, 1).text = 'Вознаграждение {{procc}}%'
+        
+        doc.add_paragraph('E-mail: {{mail}}; {{ИНН_SWIFT}}; {{РЕКВИЗИТЫ_БАНК}}')
+        if with_image and page == 0:
+            doc.add_paragraph('{{img}}')
+        if page + 1 < pages:
+            doc.add_page_break()
+    
+    output = io.BytesIO()
+    doc.save(output)
+    return output.getvalue()
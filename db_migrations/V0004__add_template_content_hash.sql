@@ -0,0 +1,7 @@
+ALTER TABLE template_storage ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+UPDATE template_storage
+SET content_hash = encode(sha256(template_data), 'hex')
+WHERE content_hash IS NULL AND file_size > 0;
+
+COMMENT ON COLUMN template_storage.content_hash IS 'SHA-256 содержимого шаблона (hex), ключ кэша шаблона в generate-contract';
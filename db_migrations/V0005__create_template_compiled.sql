@@ -0,0 +1,12 @@
+CREATE TABLE IF NOT EXISTS template_compiled (
+    template_id INTEGER PRIMARY KEY REFERENCES template_storage(id),
+    source_hash VARCHAR(64) NOT NULL,
+    compiled_data BYTEA NOT NULL,
+    placeholders JSONB NOT NULL,
+    compiled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE template_compiled IS 'Скомпилированный шаблон: нормализованный DOCX и индекс плейсхолдеров';
+COMMENT ON COLUMN template_compiled.source_hash IS 'content_hash исходного шаблона, из которого собрана компиляция';
+COMMENT ON COLUMN template_compiled.compiled_data IS 'DOCX, в котором каждый плейсхолдер целиком лежит в одном w:t';
+COMMENT ON COLUMN template_compiled.placeholders IS 'Список [{part, index, keys}]: имя части, номер w:t в части, найденные ключи';
@@ -0,0 +1,10 @@
+CREATE SEQUENCE IF NOT EXISTS contract_number_seq START WITH 1 MINVALUE 1;
+
+-- Продолжаем нумерацию с текущего значения счетчика
+SELECT setval(
+    'contract_number_seq',
+    GREATEST((SELECT current_number FROM contract_counter WHERE id = 1), 1),
+    (SELECT current_number FROM contract_counter WHERE id = 1) > 0
+);
+
+COMMENT ON SEQUENCE contract_number_seq IS 'Номера договоров в режиме CONTRACT_NUMBERING=sequence (без блокировки строки contract_counter)';
@@ -0,0 +1,23 @@
+CREATE TABLE IF NOT EXISTS telegram_outbox (
+    id SERIAL PRIMARY KEY,
+    contract_number INTEGER NOT NULL,
+    method VARCHAR(32) NOT NULL,
+    chat_id VARCHAR(64) NOT NULL,
+    caption TEXT,
+    file_name VARCHAR(255) NOT NULL,
+    file_data BYTEA NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_telegram_outbox_pending ON telegram_outbox(next_attempt_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_telegram_outbox_contract ON telegram_outbox(contract_number);
+
+COMMENT ON TABLE telegram_outbox IS 'Очередь отправки договоров и обложек в Telegram (transactional outbox)';
+COMMENT ON COLUMN telegram_outbox.method IS 'Метод Bot API: sendPhoto или sendDocument';
+COMMENT ON COLUMN telegram_outbox.status IS 'pending - ждет отправки, sent - доставлено, failed - попытки исчерпаны';
+COMMENT ON COLUMN telegram_outbox.next_attempt_at IS 'Не раньше этого времени воркер возьмет запись (backoff и аренда на время отправки)';
@@ -0,0 +1,6 @@
+ALTER TABLE telegram_outbox ADD COLUMN IF NOT EXISTS cover_file_name VARCHAR(255);
+ALTER TABLE telegram_outbox ADD COLUMN IF NOT EXISTS cover_caption TEXT;
+ALTER TABLE telegram_outbox ADD COLUMN IF NOT EXISTS cover_data BYTEA;
+
+COMMENT ON COLUMN telegram_outbox.method IS 'Метод Bot API: sendPhoto, sendDocument или sendMediaGroup (обложка и договор одним вызовом)';
+COMMENT ON COLUMN telegram_outbox.cover_data IS 'Обложка для sendMediaGroup; отправляется первой, перед file_data';
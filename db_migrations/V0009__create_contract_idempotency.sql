@@ -0,0 +1,18 @@
+CREATE TABLE IF NOT EXISTS contract_idempotency (
+    idempotency_key VARCHAR(128) PRIMARY KEY,
+    request_hash CHAR(64) NOT NULL,
+    contract_number INTEGER NOT NULL,
+    artifact_hash CHAR(64) NOT NULL,
+    response JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_contract_idempotency_expires ON contract_idempotency(expires_at);
+
+COMMENT ON TABLE contract_idempotency IS 'Ключи идемпотентности generate-contract: повтор запроса в пределах окна возвращает исходный результат';
+COMMENT ON COLUMN contract_idempotency.idempotency_key IS 'Заголовок Idempotency-Key или sha256 нормализованного тела запроса';
+COMMENT ON COLUMN contract_idempotency.request_hash IS 'sha256 нормализованного тела: тот же ключ с другим телом отклоняется';
+COMMENT ON COLUMN contract_idempotency.artifact_hash IS 'sha256 отрендеренного DOCX';
+COMMENT ON COLUMN contract_idempotency.response IS 'Тело исходного ответа, которое отдается при повторе';
+COMMENT ON COLUMN contract_idempotency.expires_at IS 'После этого момента ключ не действует и удаляется очисткой';
@@ -0,0 +1,23 @@
+CREATE TABLE IF NOT EXISTS contract_blobs (
+    content_hash CHAR(64) PRIMARY KEY,
+    data BYTEA NOT NULL,
+    size INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS contract_archive (
+    contract_number INTEGER PRIMARY KEY,
+    file_name VARCHAR(255) NOT NULL,
+    caption TEXT,
+    docx_hash CHAR(64) NOT NULL,
+    docx_size INTEGER NOT NULL,
+    manifest JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_contract_archive_created ON contract_archive(created_at);
+
+COMMENT ON TABLE contract_blobs IS 'Сжатые члены ZIP отрендеренных договоров по sha256: общие части шаблона хранятся один раз';
+COMMENT ON TABLE contract_archive IS 'Архив отрендеренных договоров для повторной отправки и экспорта без рендера';
+COMMENT ON COLUMN contract_archive.docx_hash IS 'sha256 исходного DOCX; собранный из contract_blobs файл совпадает с ним побайтно';
+COMMENT ON COLUMN contract_archive.manifest IS 'Члены DOCX по порядку: имя, хеш в contract_blobs, CRC, размер, метод сжатия, дата';
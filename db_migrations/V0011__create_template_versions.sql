@@ -0,0 +1,57 @@
+CREATE TABLE IF NOT EXISTS template_contents (
+    content_hash CHAR(64) PRIMARY KEY,
+    template_data BYTEA NOT NULL,
+    file_size INTEGER NOT NULL,
+    compiled_data BYTEA,
+    placeholders JSONB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS templates (
+    name VARCHAR(64) PRIMARY KEY,
+    active_version INTEGER,
+    active_hash CHAR(64) REFERENCES template_contents(content_hash),
+    latest_version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS template_versions (
+    name VARCHAR(64) NOT NULL REFERENCES templates(name),
+    version INTEGER NOT NULL,
+    content_hash CHAR(64) NOT NULL REFERENCES template_contents(content_hash),
+    filename VARCHAR(255) NOT NULL,
+    file_size INTEGER NOT NULL,
+    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (name, version)
+);
+
+CREATE INDEX IF NOT EXISTS idx_template_versions_hash ON template_versions(name, content_hash);
+
+-- Единственный шаблон из template_storage становится версией 1 шаблона default
+INSERT INTO template_contents (content_hash, template_data, file_size, compiled_data, placeholders)
+SELECT s.content_hash, s.template_data, s.file_size, c.compiled_data, c.placeholders
+FROM template_storage s
+LEFT JOIN template_compiled c ON c.template_id = s.id AND c.source_hash = s.content_hash
+WHERE s.id = 1 AND s.file_size > 0 AND s.content_hash IS NOT NULL
+ON CONFLICT (content_hash) DO NOTHING;
+
+INSERT INTO templates (name, active_version, active_hash, latest_version)
+SELECT 'default', 1, content_hash, 1
+FROM template_storage
+WHERE id = 1 AND file_size > 0 AND content_hash IS NOT NULL
+ON CONFLICT (name) DO NOTHING;
+
+INSERT INTO template_versions (name, version, content_hash, filename, file_size, uploaded_at)
+SELECT 'default', 1, content_hash, filename, file_size, uploaded_at
+FROM template_storage
+WHERE id = 1 AND file_size > 0 AND content_hash IS NOT NULL
+ON CONFLICT (name, version) DO NOTHING;
+
+COMMENT ON TABLE template_contents IS 'Содержимое шаблонов по sha256: одинаковый файл хранится и компилируется один раз для всех имен и версий';
+COMMENT ON COLUMN template_contents.compiled_data IS 'DOCX, в котором каждый плейсхолдер целиком лежит в одном w:t; NULL - рендер из template_data';
+COMMENT ON COLUMN template_contents.placeholders IS 'Список [{part, index, keys}]: имя части, номер w:t в части, найденные ключи';
+COMMENT ON TABLE templates IS 'Именованные шаблоны (по лейблу или типу договора) и указатель на активную версию';
+COMMENT ON COLUMN templates.active_hash IS 'content_hash активной версии: generate-contract сверяет теплый кеш только по нему';
+COMMENT ON COLUMN templates.latest_version IS 'Последний выданный номер версии; новая загрузка получает следующий';
+COMMENT ON TABLE template_versions IS 'История загрузок шаблона: номер версии внутри имени и ссылка на содержимое';
+COMMENT ON TABLE template_storage IS 'Устарело: единственный шаблон до V0011, перенесен в templates/template_versions';
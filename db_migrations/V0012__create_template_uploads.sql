@@ -0,0 +1,24 @@
+CREATE TABLE IF NOT EXISTS template_uploads (
+    upload_id VARCHAR(64) PRIMARY KEY,
+    name VARCHAR(64) NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    received_bytes INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS template_upload_chunks (
+    upload_id VARCHAR(64) NOT NULL REFERENCES template_uploads(upload_id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    data BYTEA NOT NULL,
+    size INTEGER NOT NULL,
+    crc32 BIGINT NOT NULL,
+    PRIMARY KEY (upload_id, chunk_index)
+);
+
+CREATE INDEX IF NOT EXISTS idx_template_uploads_created ON template_uploads(created_at);
+
+COMMENT ON TABLE template_uploads IS 'Незавершенные загрузки шаблона по частям; удаляются после сборки или через UPLOAD_TTL секунд';
+COMMENT ON COLUMN template_uploads.upload_id IS 'Идентификатор загрузки от клиента: повтор части с тем же id и номером не дублирует ее';
+COMMENT ON COLUMN template_uploads.received_bytes IS 'Сумма размеров принятых частей: лимит размера шаблона проверяется по ней до сборки файла';
+COMMENT ON TABLE template_upload_chunks IS 'Части загружаемого шаблона; при сборке читаются по порядку chunk_index';
+COMMENT ON COLUMN template_upload_chunks.crc32 IS 'CRC32 части: сверяется с переданным клиентом и позволяет докачке понять, какие части уже приняты';
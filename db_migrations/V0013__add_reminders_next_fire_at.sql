@@ -0,0 +1,48 @@
+ALTER TABLE reminders ADD COLUMN IF NOT EXISTS time_zone VARCHAR(64) NOT NULL DEFAULT 'UTC';
+ALTER TABLE reminders ADD COLUMN IF NOT EXISTS next_fire_at TIMESTAMPTZ;
+
+-- Ближайшее срабатывание строго после after_ts: время fire_time по часам пояса zone в один из дней fire_days
+CREATE OR REPLACE FUNCTION reminder_next_fire(fire_time TIME, fire_days INTEGER[], after_ts TIMESTAMPTZ, zone TEXT)
+RETURNS TIMESTAMPTZ
+LANGUAGE SQL STABLE
+AS $$
+    SELECT (day::date + fire_time) AT TIME ZONE zone
+    FROM generate_series(
+        (after_ts AT TIME ZONE zone)::date,
+        (after_ts AT TIME ZONE zone)::date + 7,
+        INTERVAL '1 day'
+    ) AS day
+    WHERE EXTRACT(ISODOW FROM day)::INTEGER = ANY(fire_days)
+      AND (day::date + fire_time) AT TIME ZONE zone > after_ts
+    ORDER BY day
+    LIMIT 1
+$$;
+
+-- next_fire_at пересчитывается при любом изменении расписания, кто бы его ни менял (бот, ручная правка)
+CREATE OR REPLACE FUNCTION reminders_schedule_next_fire()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.next_fire_at := CASE
+        WHEN NEW.is_active THEN reminder_next_fire(NEW.reminder_time, NEW.days_of_week, now(), NEW.time_zone)
+    END;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_reminders_next_fire ON reminders;
+CREATE TRIGGER trg_reminders_next_fire
+    BEFORE INSERT OR UPDATE OF reminder_time, days_of_week, is_active, time_zone ON reminders
+    FOR EACH ROW EXECUTE FUNCTION reminders_schedule_next_fire();
+
+UPDATE reminders
+SET next_fire_at = reminder_next_fire(reminder_time, days_of_week, now(), time_zone)
+WHERE is_active = TRUE;
+
+-- Только активные строки: выключенные send-reminders не интересуют, и индекс не растет за их счет
+CREATE INDEX IF NOT EXISTS idx_reminders_next_fire ON reminders(next_fire_at) WHERE is_active = TRUE;
+
+COMMENT ON COLUMN reminders.time_zone IS 'Часовой пояс, в котором задано reminder_time; UTC - как раньше по часам функции';
+COMMENT ON COLUMN reminders.next_fire_at IS 'Ближайшее срабатывание; ставит триггер при изменении расписания, двигает send-reminders при отправке. NULL - выключено';
+COMMENT ON FUNCTION reminder_next_fire(TIME, INTEGER[], TIMESTAMPTZ, TEXT) IS 'Ближайшее срабатывание напоминания строго после after_ts; NULL, если дней нет';
@@ -0,0 +1,21 @@
+CREATE TABLE IF NOT EXISTS reminder_deliveries (
+    reminder_id INTEGER NOT NULL REFERENCES reminders(id) ON DELETE CASCADE,
+    fire_at TIMESTAMPTZ NOT NULL,
+    user_id BIGINT NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_until TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_error TEXT,
+    sent_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (reminder_id, fire_at)
+);
+
+-- Повторы и брошенные захваты ищутся только среди незавершенных доставок
+CREATE INDEX IF NOT EXISTS idx_reminder_deliveries_pending ON reminder_deliveries(claimed_until) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_reminder_deliveries_created ON reminder_deliveries(created_at);
+
+COMMENT ON TABLE reminder_deliveries IS 'Журнал доставки: одна строка на срабатывание напоминания, PK не дает отправить его дважды';
+COMMENT ON COLUMN reminder_deliveries.fire_at IS 'Срабатывание (прежний next_fire_at), к которому относится доставка';
+COMMENT ON COLUMN reminder_deliveries.status IS 'pending - захвачено или ждет повтора, sent, failed - попытки кончились или ошибка постоянная, skipped - опоздало больше REMINDERS_MAX_LATE';
+COMMENT ON COLUMN reminder_deliveries.claimed_until IS 'pending: до этого момента строка занята отправителем (аренда) или ждет повтора; потом ее заберет любой запуск';
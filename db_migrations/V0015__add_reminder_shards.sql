@@ -0,0 +1,20 @@
+-- Шард пользователя: первые 32 бита md5(user_id) по модулю числа шардов. Все напоминания одного
+-- пользователя (и его чат) попадают в один шард при любом shard_count
+CREATE OR REPLACE FUNCTION reminder_shard(uid BIGINT, shard_count INTEGER)
+RETURNS INTEGER
+LANGUAGE SQL IMMUTABLE
+AS $$
+    SELECT (('x' || substr(md5(uid::text), 1, 8))::bit(32)::bigint % shard_count)::integer
+$$;
+
+CREATE TABLE IF NOT EXISTS reminder_shard_locks (
+    shard_count INTEGER NOT NULL,
+    shard_index INTEGER NOT NULL,
+    owner VARCHAR(64) NOT NULL,
+    locked_until TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (shard_count, shard_index)
+);
+
+COMMENT ON FUNCTION reminder_shard(BIGINT, INTEGER) IS 'Номер шарда send-reminders (0..shard_count-1) для пользователя';
+COMMENT ON TABLE reminder_shard_locks IS 'Аренда шарда send-reminders: пока locked_until не прошел, шард обрабатывает только owner';
+COMMENT ON COLUMN reminder_shard_locks.owner IS 'request_id вызова, держащего шард';
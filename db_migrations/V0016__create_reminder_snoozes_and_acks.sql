@@ -0,0 +1,25 @@
+-- Разовые срабатывания («Напомнить позже»): send-reminders забирает их тем же запросом, что и регулярные
+CREATE TABLE IF NOT EXISTS reminder_snoozes (
+    id BIGSERIAL PRIMARY KEY,
+    reminder_id INTEGER NOT NULL REFERENCES reminders(id) ON DELETE CASCADE,
+    user_id BIGINT NOT NULL,
+    fire_at TIMESTAMPTZ NOT NULL,
+    snoozed_from TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    UNIQUE (reminder_id, snoozed_from)
+);
+
+-- Диапазон fire_at <= now() по индексу, как у idx_reminders_next_fire: очередь не сканируется целиком
+CREATE INDEX IF NOT EXISTS idx_reminder_snoozes_fire_at ON reminder_snoozes(fire_at);
+
+CREATE TABLE IF NOT EXISTS reminder_acks (
+    reminder_id INTEGER NOT NULL REFERENCES reminders(id) ON DELETE CASCADE,
+    fire_at TIMESTAMPTZ NOT NULL,
+    user_id BIGINT NOT NULL,
+    acked_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (reminder_id, fire_at)
+);
+
+COMMENT ON TABLE reminder_snoozes IS 'Очередь разовых срабатываний по кнопке «Напомнить позже»; строка удаляется при отправке';
+COMMENT ON COLUMN reminder_snoozes.snoozed_from IS 'Срабатывание, которое отложили: повторное нажатие той же кнопки не ставит второе';
+COMMENT ON TABLE reminder_acks IS 'Отметки «Готово»: одна на срабатывание (fire_at - как в reminder_deliveries)';
@@ -0,0 +1,12 @@
+-- Файлы нужны только до отправки: deliver-outbox обнуляет file_data и cover_data у отправленных и проваленных
+ALTER TABLE telegram_outbox ALTER COLUMN file_data DROP NOT NULL;
+
+UPDATE telegram_outbox SET file_data = NULL, cover_data = NULL
+WHERE status <> 'pending' AND (file_data IS NOT NULL OR cover_data IS NOT NULL);
+
+-- Очистка старых завершенных записей идет по created_at, не задевая очередь pending
+CREATE INDEX IF NOT EXISTS idx_telegram_outbox_finished ON telegram_outbox(created_at) WHERE status <> 'pending';
+
+COMMENT ON COLUMN telegram_outbox.file_data IS 'Файл для отправки; NULL после того, как запись отправлена или провалена';
+COMMENT ON COLUMN telegram_outbox.cover_data IS 'Обложка для sendMediaGroup; отправляется первой, перед file_data; NULL после завершения записи';
+COMMENT ON TABLE telegram_outbox IS 'Очередь отправки договоров и обложек в Telegram (transactional outbox); завершенные записи удаляются через OUTBOX_RETENTION_DAYS';
@@ -56,6 +56,33 @@ const Index = () => {
     fetchNextNumber();
   }, []);
 
+  const trackDelivery = async (contractNumber: number) => {
+    for (let attempt = 0; attempt < 24; attempt++) {
+      await new Promise(resolve => setTimeout(resolve, 5000));
+      try {
+        const response = await fetch(`https://functions.poehali.dev/74c4ea92-6ade-4ffd-941c-c83f543fbfe5?contract_number=${contractNumber}`);
+        const data = await response.json();
+        if (data.status === 'sent') {
+          toast({
+            title: "Доставлено",
+            description: `Договор №${contractNumber} отправлен в Telegram`,
+          });
+          return;
+        }
+        if (data.status === 'failed') {
+          toast({
+            title: "Ошибка отправки",
+            description: `Договор №${contractNumber} не удалось отправить в Telegram`,
+            variant: "destructive"
+          });
+          return;
+        }
+      } catch (error) {
+        console.error('Failed to fetch delivery status:', error);
+      }
+    }
+  };
+
   const handleInputChange = (field: keyof FormData, value: string) => {
     setFormData(prev => {
       const updated = { ...prev, [field]: value };
@@ -134,6 +161,9 @@ const Index = () => {
     }
 
     setIsGenerating(true);
+    // Один ключ на отправку формы: повтор этого запроса (ретрай сети, прокси) не получит новый номер,
+    // а новая отправка той же формы - это новый договор
+    const idempotencyKey = crypto.randomUUID();
 
     try {
       let coverImageBase64 = '';
@@ -171,7 +201,8 @@ const Index = () => {
       const response = await fetch('https://functions.poehali.dev/74c4ea92-6ade-4ffd-941c-c83f543fbfe5', {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+          'Idempotency-Key': idempotencyKey
         },
         body: JSON.stringify(payload)
       });
@@ -188,10 +219,12 @@ const Index = () => {
       if (result.success) {
         toast({
           title: "Договор сгенерирован!",
-          description: `Договор №${result.contract_number} отправлен в Telegram`,
+          description: `Договор №${result.contract_number} поставлен в очередь отправки в Telegram`,
         });
+        trackDelivery(result.contract_number);
         
-        const nextResponse = await fetch('https://functions.poehali.dev/44c90102-922d-422d-a7ab-ea007b0a1d1a');
+        // reload: номер только что изменился, кеш браузера и функции не должен вернуть старый
+        const nextResponse = await fetch('https://functions.poehali.dev/44c90102-922d-422d-a7ab-ea007b0a1d1a', { cache: 'reload' });
         const nextData = await nextResponse.json();
         if (nextData.next_number) {
           setFormData(prev => ({ ...prev, contract_number: String(nextData.next_number) }));
@@ -4,6 +4,44 @@ import { Button } from '@/components/ui/button';
 import Icon from '@/components/ui/icon';
 import { useToast } from '@/hooks/use-toast';
 
+const UPLOAD_URL = 'https://functions.poehali.dev/cbc1d24a-1165-4535-ba22-270c4cf061f5';
+
+// Файлы больше одной части уходят по частям: тело вызова функции ограничено по размеру
+const CHUNK_SIZE = 2 * 1024 * 1024;
+
+const postBytes = async (query: string, body?: Uint8Array) => {
+  const response = await fetch(`${UPLOAD_URL}?${query}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    },
+    body
+  });
+  return response.json();
+};
+
+const uploadInChunks = async (bytes: Uint8Array, fileName: string) => {
+  const uploadId = crypto.randomUUID();
+  const chunkCount = Math.ceil(bytes.length / CHUNK_SIZE);
+  const base = `upload_id=${uploadId}&filename=${encodeURIComponent(fileName)}`;
+
+  for (let index = 0; index < chunkCount; index++) {
+    const chunk = bytes.subarray(index * CHUNK_SIZE, (index + 1) * CHUNK_SIZE);
+    let result;
+    try {
+      result = await postBytes(`${base}&chunk=${index}`, chunk);
+    } catch {
+      // Повтор после обрыва безопасен: уже принятая часть сервером не дублируется
+      result = await postBytes(`${base}&chunk=${index}`, chunk);
+    }
+    if (!result.success) {
+      return result;
+    }
+  }
+
+  return postBytes(`upload_id=${uploadId}&complete=${chunkCount}`);
+};
+
 const Upload = () => {
   const { toast } = useToast();
   const [file, setFile] = useState<File | null>(null);
@@ -40,20 +78,16 @@ const Upload = () => {
       const arrayBuffer = await file.arrayBuffer();
       const bytes = new Uint8Array(arrayBuffer);
 
-      const response = await fetch('https://functions.poehali.dev/cbc1d24a-1165-4535-ba22-270c4cf061f5', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        },
-        body: bytes
-      });
-
-      const result = await response.json();
+      const result = bytes.length > CHUNK_SIZE
+        ? await uploadInChunks(bytes, file.name)
+        : await postBytes(`filename=${encodeURIComponent(file.name)}`, bytes);
 
       if (result.success) {
         toast({
-          title: "Файл загружен!",
-          description: "Шаблон успешно загружен на сервер",
+          title: result.unchanged ? "Шаблон не изменился" : "Файл загружен!",
+          description: result.unchanged
+            ? `Этот файл уже активен (версия ${result.version})`
+            : `Шаблон загружен, активна версия ${result.version}`,
         });
         setFile(null);
       } else {